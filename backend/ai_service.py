@@ -1,62 +1,578 @@
-from typing import AsyncGenerator, Optional, List, Dict
-import torch
+from typing import Any, AsyncGenerator, AsyncIterator, Optional, List, Dict, Tuple, Union, TYPE_CHECKING
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+import asyncio
+import hashlib
+import importlib.util
 import threading
-from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
-from openai import OpenAI, OpenAIError
-from datetime import datetime
+import time
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAIError
+import httpx
+from backends import BackendRegistry, ContextWindow, EchoBackend, ErrorText, ModelBackend, estimate_tokens
+from inference import DialoGPTBatcher, InferenceQueueFull, quantize_dynamic_int8
+from kv_cache import CachedPrefix, KVCache, Turn, kv_cache
+from model_workers import ModelWorkerClient
+from token_cache import TokenCache, token_cache
+from response_cache import ResponseCache, response_cache, response_key
+from coalescing import SingleFlight
+from metrics import generated_tokens, generation_errors, generation_seconds, time_to_first_token
+from profiling import instant, span
+import config
+
+# torch and transformers cost seconds and hundreds of MB to import, so they are
+# only loaded when the DialoGPT fallback is first used.
+if TYPE_CHECKING:
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+# DialoGPT load states reported by /readyz
+MODEL_NOT_LOADED = "not_loaded"
+MODEL_LOADING = "loading"
+MODEL_READY = "ready"
+MODEL_FAILED = "failed"
+
+# HTTP/2 needs the optional ``h2`` package; fall back to HTTP/1.1 keep-alive.
+HTTP2_AVAILABLE: bool = importlib.util.find_spec("h2") is not None
+
+# Exact OpenAI token counts need the optional ``tiktoken`` package; otherwise estimate.
+TIKTOKEN_AVAILABLE: bool = importlib.util.find_spec("tiktoken") is not None
+
+
+# Context windows per backend; the history query fetches no more than this
+OPENAI_CONTEXT_WINDOW = ContextWindow(
+    max_messages=10,
+    max_tokens=config.OPENAI_CONTEXT_MAX_TOKENS or None
+)
+DIALOGPT_CONTEXT_WINDOW = ContextWindow(max_messages=5, max_tokens=1000)
+
+# Sampling settings sent with every OpenAI completion request
+OPENAI_SAMPLING: Dict[str, Any] = {"temperature": 0.7, "max_tokens": 500}
+
+
+class _PooledClient:
+    """An AsyncOpenAI client plus the bookkeeping the pool needs."""
+
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+        self.last_used: float = time.monotonic()
+        self.leases: int = 0
+        self.evicted: bool = False
+
+
+class OpenAIClientPool:
+    """
+    LRU-bounded pool of AsyncOpenAI clients keyed by a hash of the API key.
+
+    Reusing a client per key keeps its HTTP connections (and TLS/HTTP/2
+    sessions) alive between requests. Clients idle for longer than
+    ``idle_timeout`` or pushed out by ``max_clients`` are closed once no
+    stream is still using them.
+    """
+
+    def __init__(
+        self,
+        max_clients: int = 64,
+        idle_timeout: float = 300.0,
+        base_url: Optional[str] = None,
+        max_connections: int = 20
+    ):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self._clients: "OrderedDict[str, _PooledClient]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    @staticmethod
+    def _key(api_key: str) -> str:
+        """Never keep raw API keys as dictionary keys."""
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def _create(self, api_key: str) -> AsyncOpenAI:
+        http_client = DefaultAsyncHttpxClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.idle_timeout
+            )
+        )
+        return AsyncOpenAI(api_key=api_key, base_url=self.base_url, http_client=http_client)
+
+    async def _close(self, entry: _PooledClient) -> None:
+        try:
+            await entry.client.close()
+        except Exception as e:
+            print(f"Error closing OpenAI client: {str(e)}")
+
+    async def _evict(self, key: str) -> None:
+        entry = self._clients.pop(key)
+        entry.evicted = True
+        if entry.leases == 0:
+            await self._close(entry)
+
+    async def _evict_expired(self) -> None:
+        now = time.monotonic()
+        expired = [
+            key for key, entry in self._clients.items()
+            if entry.leases == 0 and now - entry.last_used > self.idle_timeout
+        ]
+        for key in expired:
+            await self._evict(key)
+        while len(self._clients) > self.max_clients:
+            await self._evict(next(iter(self._clients)))
+
+    @asynccontextmanager
+    async def client(self, api_key: str) -> AsyncIterator[AsyncOpenAI]:
+        """Lease the shared client for ``api_key`` for the duration of a request."""
+        key = self._key(api_key)
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = _PooledClient(self._create(api_key))
+            self._clients[key] = entry
+        self._clients.move_to_end(key)
+        entry.leases += 1
+        await self._evict_expired()
+        try:
+            yield entry.client
+        finally:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if entry.evicted and entry.leases == 0:
+                await self._close(entry)
+
+    async def aclose(self) -> None:
+        """Close every pooled client (called on shutdown)."""
+        for key in list(self._clients):
+            await self._evict(key)
+
+
+class OpenAIBackend(ModelBackend):
+    """OpenAI chat models; answers every request that carries an API key."""
+
+    name = "openai"
+    context_window = OPENAI_CONTEXT_WINDOW
+    requires_api_key = True
+
+    def __init__(self, service: "AIService", **kwargs):
+        super().__init__(**kwargs)
+        self.service = service
+
+    def handles(self, model: str, api_key: Optional[str]) -> bool:
+        return bool(api_key)
+
+    @property
+    def sampling_params(self) -> Dict[str, Any]:
+        return OPENAI_SAMPLING
+
+    @property
+    def deterministic(self) -> bool:
+        return OPENAI_SAMPLING["temperature"] == 0
+
+    def count_tokens(self, text: str, model: str) -> int:
+        encoding = self.service._tiktoken_encoding(model)
+        if encoding is None:
+            return estimate_tokens(text)
+        return len(self.service.token_cache.encode(
+            f"tiktoken:{encoding.name}",
+            text,
+            lambda t: encoding.encode(t, disallowed_special=())
+        ))
+
+    async def stream(self, prompt, chat_history, api_key, model, chat_id):
+        async for token in self.service._generate_openai_response(prompt, chat_history, api_key, model):
+            yield token
+
+    async def aclose(self) -> None:
+        await self.service.openai_clients.aclose()
+
+
+class DialoGPTBackend(ModelBackend):
+    """
+    The local DialoGPT model. Chosen by ``model="dialogpt"`` (or the model's
+    Hugging Face id) and as the free fallback when no API key is given.
+    """
+
+    name = "dialogpt"
+    context_window = DIALOGPT_CONTEXT_WINDOW
+
+    def __init__(self, service: "AIService", max_queue_depth: int = 64, **kwargs):
+        super().__init__(**kwargs)
+        self.service = service
+        self.max_queue_depth = max_queue_depth
+
+    def handles(self, model: str, api_key: Optional[str]) -> bool:
+        return not api_key or model.lower() in (self.name, self.service.fallback_model_name.lower())
+
+    def has_capacity(self) -> bool:
+        # The slots admit fewer prompts than the batcher queue holds, so the
+        # overflow waits here instead; count it against the same depth
+        admitted = self.active + self.waiting
+        return admitted < self.max_concurrency + self.max_queue_depth and \
+            not self.service.dialogpt_batcher.is_full()
+
+    def model_id(self, model: str) -> str:
+        return self.service.fallback_model_name
+
+    @property
+    def sampling_params(self) -> Dict[str, Any]:
+        return self.service.dialogpt_batcher.generation_kwargs
+
+    @property
+    def deterministic(self) -> bool:
+        return not self.sampling_params.get("do_sample", False)
+
+    def count_tokens(self, text: str, model: str) -> int:
+        if not self.service._model_loaded:
+            return estimate_tokens(text)
+        return len(self.service._dialogpt_ids(text))
+
+    async def stream(self, prompt, chat_history, api_key, model, chat_id):
+        async for token in self.service._generate_dialogpt_response(prompt, chat_history, chat_id):
+            yield token
+
+    async def aclose(self) -> None:
+        # Finishes the running batch; the worker starts again on the next prompt
+        await asyncio.to_thread(self.service.dialogpt_batcher.stop)
 
 
 class AIService:
     """Service for handling AI model interactions with support for OpenAI and local models."""
     
-    def __init__(self):
-        """Initialize the AI service. DialoGPT loads lazily when needed."""
-        self.fallback_model_name: str = "microsoft/DialoGPT-medium"
-        self.fallback_tokenizer: Optional[AutoTokenizer] = None
-        self.fallback_model: Optional[AutoModelForCausalLM] = None
+    def __init__(self, remote_inference: Optional[bool] = None):
+        """
+        Initialize the AI service. DialoGPT loads lazily when needed.
+
+        With ``remote_inference`` (the default when ``MODEL_WORKERS`` is set)
+        only the tokenizer is loaded here and generation runs in the
+        model-worker processes.
+        """
+        if remote_inference is None:
+            remote_inference = config.MODEL_WORKERS > 0
+        self.remote_inference: bool = remote_inference
+        self.fallback_model_name: str = config.DIALOGPT_MODEL_NAME
+        # CPU inference profile applied when the model loads
+        self.quantize: bool = config.DIALOGPT_QUANTIZE
+        self.torch_threads: int = config.DIALOGPT_TORCH_THREADS
+        self.fallback_tokenizer: Optional["AutoTokenizer"] = None
+        self.fallback_model: Optional["AutoModelForCausalLM"] = None
         self._model_loaded: bool = False
+        self._model_lock = threading.Lock()
+        self.model_state: str = MODEL_NOT_LOADED
+        self.model_error: Optional[str] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self.kv_cache: KVCache = kv_cache
+        self.token_cache: TokenCache = token_cache
+        self._tiktoken_encodings: Dict[str, Any] = {}
+        self.response_cache: ResponseCache = response_cache
+        self.response_cache_enabled: bool = config.RESPONSE_CACHE_ENABLED
+        self.flights: SingleFlight = SingleFlight()
+        self.coalesce_enabled: bool = config.COALESCE_GENERATIONS
+        self.openai_clients: OpenAIClientPool = OpenAIClientPool()
+        # Bounded pool for everything that blocks on the local model
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=config.DIALOGPT_EXECUTOR_THREADS, thread_name_prefix="dialogpt"
+        )
+        dialogpt_sampling: Dict[str, Any] = {
+            "max_new_tokens": 100,
+            "do_sample": True,
+            "temperature": 0.7,
+            "top_p": 0.9,
+        }
+        self.dialogpt_batcher: Union[DialoGPTBatcher, ModelWorkerClient]
+        if self.remote_inference:
+            self.dialogpt_batcher = ModelWorkerClient(
+                config.MODEL_WORKER_SOCKET,
+                generation_kwargs=dialogpt_sampling,
+                max_in_flight=config.DIALOGPT_MAX_QUEUE_DEPTH
+            )
+        else:
+            self.dialogpt_batcher = DialoGPTBatcher(
+                load_model=self._dialogpt_model,
+                generation_kwargs=dialogpt_sampling,
+                max_batch_size=config.DIALOGPT_MAX_BATCH_SIZE,
+                max_wait_ms=config.DIALOGPT_MAX_WAIT_MS,
+                max_queue_depth=config.DIALOGPT_MAX_QUEUE_DEPTH,
+                executor=self.executor
+            )
+        # Resolution order matters: the first backend that handles a model wins
+        self.backends: BackendRegistry = BackendRegistry()
+        if config.ECHO_BACKEND_ENABLED:
+            self.backends.register(EchoBackend(
+                token_delay_ms=config.ECHO_TOKEN_DELAY_MS,
+                max_concurrency=config.ECHO_MAX_CONCURRENCY,
+                queue_timeout=config.ECHO_QUEUE_TIMEOUT_S
+            ))
+        self.backends.register(DialoGPTBackend(
+            self,
+            max_queue_depth=config.DIALOGPT_MAX_QUEUE_DEPTH,
+            max_concurrency=config.DIALOGPT_MAX_CONCURRENCY,
+            queue_timeout=config.DIALOGPT_QUEUE_TIMEOUT_S
+        ))
+        self.backends.register(OpenAIBackend(
+            self,
+            max_concurrency=config.OPENAI_MAX_CONCURRENCY,
+            queue_timeout=config.OPENAI_QUEUE_TIMEOUT_S
+        ))
+    
+    async def aclose(self) -> None:
+        """Release pooled network resources."""
+        await self.backends.aclose()
+    
+    def backend(self, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo") -> ModelBackend:
+        """The backend that will answer a request for ``model``."""
+        return self.backends.resolve(model, api_key)
+    
+    def context_window(self, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo") -> ContextWindow:
+        """Context window of the backend that will answer this request."""
+        return self.backend(api_key, model).context_window
+    
+    def count_tokens(self, text: str, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo") -> int:
+        """
+        Tokens ``text`` costs in the context of the backend answering the request.
+
+        Exact (and cached per message) for OpenAI with tiktoken installed and
+        for DialoGPT once loaded; an estimate otherwise.
+        """
+        return self.backend(api_key, model).count_tokens(text, model)
+    
+    def _tiktoken_encoding(self, model: str) -> Optional[Any]:
+        if not TIKTOKEN_AVAILABLE:
+            return None
+        if model not in self._tiktoken_encodings:
+            import tiktoken
+            try:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # tiktoken downloads its vocabularies on first use
+                print(f"tiktoken unavailable for {model}, estimating tokens: {str(e)}")
+                encoding = None
+            self._tiktoken_encodings[model] = encoding
+        return self._tiktoken_encodings[model]
+    
+    def _dialogpt_ids(self, text: str) -> List[int]:
+        """DialoGPT token ids of one message, without the end-of-turn token."""
+        return self.token_cache.encode(
+            f"dialogpt:{self.fallback_model_name}", text, self.fallback_tokenizer.encode
+        )
+    
+    def _dialogpt_context(
+        self,
+        history: List[Dict[str, str]],
+        prompt_ids: List[int],
+        max_tokens: int
+    ) -> List[int]:
+        """Concatenate the cached ids of the newest messages that fit in ``max_tokens``."""
+        eos_token_id: int = self.fallback_tokenizer.eos_token_id
+        parts: List[List[int]] = [prompt_ids[-max_tokens:]]
+        length = len(parts[0])
+        for msg in reversed(history):
+            ids = self._dialogpt_ids(msg["message"]) + [eos_token_id]
+            if length + len(ids) > max_tokens:
+                break
+            parts.append(ids)
+            length += len(ids)
+        return [token_id for ids in reversed(parts) for token_id in ids]
+    
+    def has_capacity(self, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo") -> bool:
+        """Whether the backend for this request can accept it right now."""
+        return self.backend(api_key, model).has_capacity()
     
     def _load_dialogpt_model(self) -> None:
-        """Lazy load DialoGPT model only when needed (when no API key provided)."""
-        if not self._model_loaded:
+        """
+        Lazy load DialoGPT model only when needed (when no API key provided).
+
+        Blocking; call it off the event loop. Concurrent callers wait for the
+        first load instead of loading the weights again. With remote inference
+        only the tokenizer is loaded.
+        """
+        if self._model_loaded:
+            return
+        with self._model_lock:
+            if self._model_loaded:
+                return
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
+            self.model_state = MODEL_LOADING
             print(f"Loading DialoGPT model ({self.fallback_model_name})...")
-            self.fallback_tokenizer = AutoTokenizer.from_pretrained(self.fallback_model_name)
-            self.fallback_model = AutoModelForCausalLM.from_pretrained(self.fallback_model_name)
-            self.fallback_model.eval()
-            
-            if torch.cuda.is_available():
-                self.fallback_model.to("cuda")
+            try:
+                if self.torch_threads > 0:
+                    torch.set_num_threads(self.torch_threads)
+                self.fallback_tokenizer = AutoTokenizer.from_pretrained(self.fallback_model_name)
+                if not self.remote_inference:
+                    self.fallback_model = AutoModelForCausalLM.from_pretrained(self.fallback_model_name)
+                    self.fallback_model.eval()
+                    
+                    if torch.cuda.is_available():
+                        self.fallback_model.to("cuda")
+                    elif self.quantize:
+                        self.fallback_model = quantize_dynamic_int8(self.fallback_model)
+            except Exception as e:
+                self.model_state = MODEL_FAILED
+                self.model_error = str(e)
+                raise
             
             self._model_loaded = True
+            self.model_state = MODEL_READY
+            self.model_error = None
             print("DialoGPT model loaded successfully.")
     
+    async def load_dialogpt_model(self) -> None:
+        """Load DialoGPT on the model executor so the event loop keeps serving."""
+        if not self._model_loaded:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._load_dialogpt_model)
+    
+    def start_warmup(self) -> None:
+        """Begin loading DialoGPT in the background (called at startup)."""
+        if self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self._warmup())
+    
+    async def _warmup(self) -> None:
+        try:
+            await self.load_dialogpt_model()
+        except Exception as e:
+            print(f"DialoGPT warm-up failed: {str(e)}")
+    
+    def _dialogpt_model(self) -> Tuple[Any, Any]:
+        """Model and tokenizer for the batch scheduler, loading them if needed."""
+        self._load_dialogpt_model()
+        return self.fallback_model, self.fallback_tokenizer
+    
     async def generate_response(
         self,
         prompt: str,
         chat_history: Optional[List[Dict[str, str]]] = None,
         api_key: Optional[str] = None,
-        model: str = "gpt-3.5-turbo"
+        model: str = "gpt-3.5-turbo",
+        chat_id: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
         """
-        Generate AI response using OpenAI (if API key provided) or DialoGPT (fallback).
+        Generate AI response with the backend registered for ``model``: OpenAI
+        (if API key provided), DialoGPT ("dialogpt", or as fallback) or the
+        echo stub ("echo", when enabled).
         
         Args:
             prompt: User's message
             chat_history: List of previous messages [{"role": "user"|"assistant", "content": "..."}]
             api_key: Optional OpenAI API key (if None, uses DialoGPT)
-            model: OpenAI model name (default: gpt-3.5-turbo)
+            model: Model name (default: gpt-3.5-turbo)
+            chat_id: Chat the prompt belongs to; lets DialoGPT reuse the previous turn's KV cache
             
         Yields:
             Response tokens as they are generated
+
+        Raises:
+            BackendBusy: if no generation slot frees up within the backend's queue timeout
         """
-        history = chat_history or []
-        if api_key:
-            async for token in self._generate_openai_response(prompt, history, api_key, model):
-                yield token
-        else:
-            async for token in self._generate_dialogpt_response(prompt, history):
+        backend = self.backend(api_key, model)
+        history = (chat_history or [])[-backend.context_window.max_messages:]
+
+        cache_key = self._response_cache_key(backend, prompt, history, api_key, model)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                instant("response_cache_hit")
+                # Replay the stored chunks so the stream looks like a fresh reply
+                for token in cached:
+                    yield token
+                return
+
+        # Identical requests arriving while this one generates share its tokens;
+        # each caller still saves the reply under its own chat.
+        flight = self.flights.join(
+            self._coalesce_key(backend, prompt, history, api_key, model),
+            lambda: self._generate_and_cache(backend, prompt, history, api_key, model, chat_id, cache_key)
+        )
+        # Closing this generator (the client went away) leaves the flight at
+        # once, cancelling the generation if nobody else is subscribed
+        async with aclosing(flight.subscribe()) as tokens:
+            async for token in tokens:
                 yield token
     
+    async def _generate_and_cache(
+        self,
+        backend: ModelBackend,
+        prompt: str,
+        history: List[Dict[str, str]],
+        api_key: Optional[str],
+        model: str,
+        chat_id: Optional[str],
+        cache_key: Optional[str]
+    ) -> AsyncGenerator[str, None]:
+        tokens: List[str] = []
+        started = time.perf_counter()
+        failed = False
+        try:
+            with span("generate", backend=backend.name) as args:
+                async for token in backend.generate(prompt, history, api_key, model, chat_id):
+                    if not tokens:
+                        time_to_first_token.labels(backend.name).observe(time.perf_counter() - started)
+                        instant("first_token")
+                    tokens.append(token)
+                    yield token
+                if args is not None:
+                    args["tokens"] = len(tokens)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # Recorded once per generation, never per token
+            generated_tokens.labels(backend.name).inc(len(tokens))
+            generation_seconds.labels(backend.name).inc(time.perf_counter() - started)
+            if failed or any(isinstance(t, ErrorText) for t in tokens):
+                generation_errors.labels(backend.name).inc()
+
+        if cache_key is not None and tokens and not any(isinstance(t, ErrorText) for t in tokens):
+            self.response_cache.put(cache_key, tokens)
+    
+    def _coalesce_key(
+        self,
+        backend: ModelBackend,
+        prompt: str,
+        history: List[Dict[str, str]],
+        api_key: Optional[str],
+        model: str
+    ) -> Optional[str]:
+        """Key shared by identical in-flight requests, or None to never share."""
+        if not self.coalesce_enabled:
+            return None
+        return response_key(
+            backend.name,
+            backend.model_id(model),
+            api_key if backend.requires_api_key else None,
+            history,
+            prompt,
+            backend.sampling_params
+        )
+    
+    def _response_cache_key(
+        self,
+        backend: ModelBackend,
+        prompt: str,
+        history: List[Dict[str, str]],
+        api_key: Optional[str],
+        model: str
+    ) -> Optional[str]:
+        """Response cache key, or None when this request must be generated afresh."""
+        if not self.response_cache_enabled:
+            return None
+        if not (backend.deterministic or config.RESPONSE_CACHE_SAMPLED):
+            return None
+        return response_key(
+            backend.name,
+            backend.model_id(model),
+            api_key if backend.requires_api_key else None,
+            history,
+            prompt,
+            backend.sampling_params
+        )
+    
     async def _generate_openai_response(
         self,
         prompt: str,
@@ -66,100 +582,124 @@ class AIService:
     ) -> AsyncGenerator[str, None]:
         """Generate response using OpenAI API."""
         try:
-            client = OpenAI(api_key=api_key)
-            
             # Build messages with history
             messages = []
             if chat_history:
-                for msg in chat_history[-10:]:  # Last 10 messages for context
+                for msg in chat_history[-OPENAI_CONTEXT_WINDOW.max_messages:]:
                     role = "assistant" if msg["user"] == "bot" else "user"
                     messages.append({"role": role, "content": msg["message"]})
             
             messages.append({"role": "user", "content": prompt})
             
-            # Stream response
-            stream = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=True,
-                temperature=0.7,
-                max_tokens=500
-            )
-            
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                    
+            async with self.openai_clients.client(api_key) as client:
+                # Stream response
+                with span("openai_request", model=model):
+                    stream = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        **OPENAI_SAMPLING
+                    )
+                
+                try:
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                finally:
+                    # Drops the connection when cancelled, so OpenAI stops generating
+                    await stream.close()
+
         except OpenAIError as e:
-            yield f"OpenAI Error: {str(e)}. Please check your API key."
+            yield ErrorText(f"OpenAI Error: {str(e)}. Please check your API key.")
         except Exception as e:
-            yield f"Error: {str(e)}"
+            yield ErrorText(f"Error: {str(e)}")
     
     async def _generate_dialogpt_response(
         self,
         prompt: str,
-        chat_history: List[Dict[str, str]]
+        chat_history: List[Dict[str, str]],
+        chat_id: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
-        """Generate response using DialoGPT (free fallback)."""
+        """
+        Generate response using DialoGPT (free fallback).
+
+        When the chat's previous turn is still in the KV cache only the new
+        prompt is encoded and generation continues from the cached keys/values.
+        A prefix is only reused while it covers exactly the messages a cache
+        miss would encode; once the conversation outgrows the message window
+        or the token budget the window shifts and the history is recomputed
+        from scratch, so the reply never depends on whether the cache was hit.
+        """
         try:
-            # Lazy load the model only when needed
-            self._load_dialogpt_model()
+            # Lazy load the model only when needed, without blocking the event loop
+            with span("model_load", loaded=self._model_loaded):
+                await self.load_dialogpt_model()
             
             # Ensure models are loaded (for type checker)
             assert self.fallback_tokenizer is not None, "Tokenizer failed to load"
-            assert self.fallback_model is not None, "Model failed to load"
-            
-            # Build conversation history
-            conversation = ""
-            if chat_history:
-                for msg in chat_history[-5:]:  # Last 5 messages
-                    if msg["user"] == "user":
-                        conversation += f"{msg['message']}{self.fallback_tokenizer.eos_token}"
-                    else:
-                        conversation += f"{msg['message']}{self.fallback_tokenizer.eos_token}"
-            
-            conversation += prompt + self.fallback_tokenizer.eos_token
+            assert self.remote_inference or self.fallback_model is not None, "Model failed to load"
             
-            # Tokenize
-            input_ids = self.fallback_tokenizer.encode(
-                conversation,
-                return_tensors="pt",
-                truncation=True,
-                max_length=1000
-            )
-            
-            if torch.cuda.is_available():
-                input_ids = input_ids.to("cuda")
-            
-            # Generate with streaming
-            streamer = TextIteratorStreamer(
-                self.fallback_tokenizer,
-                skip_prompt=True,
-                skip_special_tokens=True
-            )
-            
-            thread = threading.Thread(
-                target=self.fallback_model.generate,
-                kwargs={
-                    "input_ids": input_ids,
-                    "max_new_tokens": 100,
-                    "do_sample": True,
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "pad_token_id": self.fallback_tokenizer.eos_token_id,
-                    "streamer": streamer,
-                }
-            )
-            thread.start()
-            
-            for token_text in streamer:
+            eos_token_id: int = self.fallback_tokenizer.eos_token_id
+            max_tokens: int = DIALOGPT_CONTEXT_WINDOW.max_tokens
+            history = chat_history[-DIALOGPT_CONTEXT_WINDOW.max_messages:]
+            with span("encode") as args:
+                turns: List[Turn] = [(msg["user"], msg["message"]) for msg in history]
+                prompt_ids: List[int] = self._dialogpt_ids(prompt) + [eos_token_id]
+
+                cached = self.kv_cache.take(chat_id, turns) if chat_id else None
+                prefix: Optional[CachedPrefix] = None
+                input_ids: List[int] = []
+                if cached is not None:
+                    prefix, turns = cached
+                    input_ids = prefix.token_ids
+                    if input_ids[-1] != eos_token_id:
+                        # The previous reply hit max_new_tokens before ending itself
+                        input_ids = input_ids + [eos_token_id]
+                    input_ids = input_ids + prompt_ids
+                    if len(input_ids) > max_tokens:
+                        # The conversation outgrew the window; recompute a shifted one
+                        prefix = None
+                        turns = [(msg["user"], msg["message"]) for msg in history]
+
+                if prefix is None:
+                    # Each message is tokenized once and then served from the token cache
+                    input_ids = self._dialogpt_context(history, prompt_ids, max_tokens)
+                if args is not None:
+                    args.update(tokens=len(input_ids), kv_cache_hit=prefix is not None)
+
+            # The cache entry is stored once both the keys/values (from the
+            # inference thread) and the saved reply text are known.
+            pending: Dict[str, Any] = {}
+
+            def store_prefix() -> None:
+                if chat_id and "prefix" in pending and "turns" in pending:
+                    self.kv_cache.put(chat_id, pending["prefix"], pending["turns"])
+
+            def on_cache(new_prefix: CachedPrefix) -> None:
+                pending["prefix"] = new_prefix
+                store_prefix()
+
+            # Generate with streaming, batched with other concurrent requests
+            parts: List[str] = []
+            async for token_text in self.dialogpt_batcher.generate(
+                input_ids,
+                prefix=prefix,
+                on_cache=on_cache if chat_id else None
+            ):
                 if token_text.strip():
+                    parts.append(token_text)
                     yield token_text
+
+            # Same text the /chat endpoint saves as the bot message
+            reply = "".join(parts).strip()
+            # Every message the prefix covers, so a hit can tell when it outgrew the window
+            pending["turns"] = turns + [("user", prompt), ("bot", reply)]
+            store_prefix()
             
-            thread.join()
-            
+        except InferenceQueueFull:
+            raise
         except Exception as e:
-            yield f"Error: {str(e)}"
+            yield ErrorText(f"Error: {str(e)}")
 
 
 # Global AI service instance
@@ -0,0 +1,165 @@
+from typing import Any, AsyncGenerator, Dict, List, Optional
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import asyncio
+
+
+@dataclass(frozen=True)
+class ContextWindow:
+    """How much chat history a model is given as context."""
+    max_messages: int
+    max_tokens: Optional[int] = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) for history budgets."""
+    return len(text) // 4 + 1
+
+
+class ErrorText(str):
+    """An error message streamed in place of a reply; never cached."""
+
+
+class BackendBusy(Exception):
+    """Raised when no generation slot frees up within the backend's queue timeout."""
+
+
+class ModelBackend(ABC):
+    """
+    One way of answering a prompt, with its own concurrency limit.
+
+    Each backend admits at most ``max_concurrency`` generations at a time;
+    further requests wait up to ``queue_timeout`` seconds for a slot and then
+    fail with BackendBusy. Keeping the limits per backend means CPU-bound local
+    inference and I/O-bound remote calls cannot starve each other.
+    """
+
+    name: str = ""
+    context_window: ContextWindow = ContextWindow(max_messages=10)
+    # Replies depend on the caller's API key (and are billed to it)
+    requires_api_key: bool = False
+
+    def __init__(self, max_concurrency: int = 8, queue_timeout: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active: int = 0
+        self.waiting: int = 0
+
+    @abstractmethod
+    def handles(self, model: str, api_key: Optional[str]) -> bool:
+        """Whether this backend answers requests for ``model``."""
+
+    def has_capacity(self) -> bool:
+        """Whether a new request can be accepted right now."""
+        return True
+
+    def model_id(self, model: str) -> str:
+        """The model that actually answers a request for ``model``."""
+        return model
+
+    @property
+    def sampling_params(self) -> Dict[str, Any]:
+        """Generation settings that influence the reply."""
+        return {}
+
+    @property
+    def deterministic(self) -> bool:
+        """Whether the same prompt and context always produce the same reply."""
+        return False
+
+    def count_tokens(self, text: str, model: str) -> int:
+        return estimate_tokens(text)
+
+    async def generate(
+        self,
+        prompt: str,
+        chat_history: List[Dict[str, str]],
+        api_key: Optional[str] = None,
+        model: str = "",
+        chat_id: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """Wait for a generation slot, then stream the reply."""
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise BackendBusy(f"The {self.name} backend is busy, please retry shortly")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            async for token in self.stream(prompt, chat_history, api_key, model, chat_id):
+                yield token
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    @abstractmethod
+    async def stream(
+        self,
+        prompt: str,
+        chat_history: List[Dict[str, str]],
+        api_key: Optional[str],
+        model: str,
+        chat_id: Optional[str]
+    ) -> AsyncGenerator[str, None]:
+        """Generate the reply (an async generator); called while holding a slot."""
+
+    async def aclose(self) -> None:
+        """Release clients, threads or models held by the backend."""
+
+
+class EchoBackend(ModelBackend):
+    """
+    Deterministic stand-in model for load tests: replies "Echo: <prompt>"
+    word by word, optionally sleeping ``token_delay_ms`` between words.
+    """
+
+    name = "echo"
+    context_window = ContextWindow(max_messages=10)
+
+    def __init__(self, token_delay_ms: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.token_delay_ms = token_delay_ms
+
+    def handles(self, model: str, api_key: Optional[str]) -> bool:
+        return model == self.name
+
+    @property
+    def deterministic(self) -> bool:
+        return True
+
+    async def stream(self, prompt, chat_history, api_key, model, chat_id):
+        words = f"Echo: {prompt}".split(" ")
+        for i, word in enumerate(words):
+            if self.token_delay_ms:
+                await asyncio.sleep(self.token_delay_ms / 1000)
+            yield word if i == 0 else f" {word}"
+
+
+class BackendRegistry:
+    """Model backends in resolution order; the first that handles a model wins."""
+
+    def __init__(self):
+        self._backends: Dict[str, ModelBackend] = {}
+
+    def __iter__(self):
+        return iter(self._backends.values())
+
+    def register(self, backend: ModelBackend) -> None:
+        self._backends[backend.name] = backend
+
+    def get(self, name: str) -> ModelBackend:
+        return self._backends[name]
+
+    def resolve(self, model: str, api_key: Optional[str] = None) -> ModelBackend:
+        for backend in self._backends.values():
+            if backend.handles(model, api_key):
+                return backend
+        raise LookupError(f"No backend for model {model!r}")
+
+    async def aclose(self) -> None:
+        for backend in self._backends.values():
+            await backend.aclose()
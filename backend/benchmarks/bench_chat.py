@@ -0,0 +1,339 @@
+"""
+Load test of the chat API against the echo stub model.
+
+Seeds a throwaway SQLite database, starts the FastAPI app (in-process through
+its ASGI interface, or under uvicorn on a local port) and drives concurrent
+/chat streams alongside /chats and /load_chat readers. Reports
+time-to-first-token, inter-token latency, request latency percentiles and
+requests/sec as JSON, so runs can be compared across releases.
+
+    cd backend
+    python -m benchmarks.bench_chat --streams 50 --chat-requests 1000 --readers 10
+    python -m benchmarks.bench_chat --mode uvicorn --token-delay-ms 5 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from urllib.parse import quote
+
+# (arrival time, body chunk) pairs of one response
+Chunks = List[Tuple[float, bytes]]
+Fetch = Callable[[str], Awaitable[Tuple[int, Chunks]]]
+
+
+def seed(path: str, chat_count: int, messages_per_chat: int) -> List[str]:
+    """Insert ``chat_count`` chats of ``messages_per_chat`` messages; returns the chat ids."""
+    chat_ids = [f"bench-{i}" for i in range(chat_count)]
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO chats (id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+        (
+            (chat_id, f"Chat {i}", start.strftime("%Y-%m-%d %H:%M:%S.%f"),
+             (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S.%f"))
+            for i, chat_id in enumerate(chat_ids)
+        )
+    )
+    conn.executemany(
+        "INSERT INTO messages (chat_id, user, message, timestamp) VALUES (?, ?, ?, ?)",
+        (
+            (
+                chat_id,
+                "user" if j % 2 == 0 else "bot",
+                f"Message {j} " + "lorem ipsum " * 8,
+                (start + timedelta(seconds=j)).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            )
+            for chat_id in chat_ids
+            for j in range(messages_per_chat)
+        )
+    )
+    conn.commit()
+    conn.close()
+    return chat_ids
+
+
+def percentiles(samples: List[float]) -> Dict[str, Any]:
+    """Count and nearest-rank p50/p95/p99/max of ``samples`` (ms)."""
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+
+    def rank(p: float) -> float:
+        return round(samples[max(0, int(len(samples) * p + 0.5) - 1)], 3)
+
+    return {
+        "count": len(samples),
+        "p50_ms": rank(0.50),
+        "p95_ms": rank(0.95),
+        "p99_ms": rank(0.99),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def asgi_fetch(app: Any) -> Fetch:
+    """
+    GET requests sent straight to ``app``'s ASGI interface. Body chunks are
+    timestamped as the app sends them (httpx's ASGITransport buffers the whole
+    response, which would hide streaming latency).
+    """
+    async def fetch(path: str) -> Tuple[int, Chunks]:
+        raw_path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.3"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": raw_path,
+            "raw_path": raw_path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+        }
+        status = 0
+        chunks: Chunks = []
+        done = asyncio.Event()
+        request_sent = False
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    chunks.append((time.perf_counter(), message["body"]))
+                if not message.get("more_body", False):
+                    done.set()
+
+        await app(scope, receive, send)
+        done.set()
+        return status, chunks
+
+    return fetch
+
+
+def http_fetch(client: Any) -> Fetch:
+    """GET requests over HTTP with ``client`` (an httpx.AsyncClient)."""
+    async def fetch(path: str) -> Tuple[int, Chunks]:
+        chunks: Chunks = []
+        async with client.stream("GET", path) as response:
+            async for chunk in response.aiter_raw():
+                chunks.append((time.perf_counter(), chunk))
+        return response.status_code, chunks
+
+    return fetch
+
+
+def delta_times(chunks: Chunks) -> List[float]:
+    """Arrival time of every ``delta`` event in an SSE body."""
+    times: List[float] = []
+    buffer = b""
+    for arrived, chunk in chunks:
+        buffer += chunk
+        *events, buffer = buffer.split(b"\n\n")
+        times.extend(arrived for event in events if event.startswith(b"event: delta"))
+    return times
+
+
+class Recorder:
+    """Latency samples collected while the load runs."""
+
+    def __init__(self):
+        self.ttft: List[float] = []
+        self.itl: List[float] = []
+        self.latency: Dict[str, List[float]] = {"chat": [], "chats": [], "load_chat": []}
+        self.errors: Dict[str, int] = {"chat": 0, "chats": 0, "load_chat": 0}
+        self.tokens: int = 0
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        for name, samples in self.latency.items():
+            endpoints[name] = dict(
+                percentiles(samples),
+                errors=self.errors[name],
+                requests_per_second=round(len(samples) / elapsed, 2),
+            )
+        total = sum(len(samples) for samples in self.latency.values())
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "requests_per_second": round(total / elapsed, 2),
+            "tokens_per_second": round(self.tokens / elapsed, 2),
+            "time_to_first_token": percentiles(self.ttft),
+            "inter_token_latency": percentiles(self.itl),
+            "endpoints": endpoints,
+        }
+
+
+async def chat_worker(fetch: Fetch, chat_ids: List[str], prompts: "asyncio.Queue[str]", recorder: Recorder) -> None:
+    rng = random.Random()
+    while not prompts.empty():
+        prompt = prompts.get_nowait()
+        started = time.perf_counter()
+        try:
+            status, chunks = await fetch(
+                f"/chat?model=echo&prompt={quote(prompt)}&chat_id={rng.choice(chat_ids)}"
+            )
+        except Exception:
+            recorder.errors["chat"] += 1
+            continue
+        finished = time.perf_counter()
+        times = delta_times(chunks)
+        if status != 200 or not times or b"event: failure" in b"".join(chunk for _, chunk in chunks):
+            recorder.errors["chat"] += 1
+            continue
+        recorder.latency["chat"].append((finished - started) * 1000)
+        recorder.ttft.append((times[0] - started) * 1000)
+        recorder.itl.extend((b - a) * 1000 for a, b in zip(times, times[1:]))
+        recorder.tokens += len(times)
+
+
+async def reader_worker(fetch: Fetch, chat_ids: List[str], page_size: int, stop: asyncio.Event, recorder: Recorder) -> None:
+    rng = random.Random()
+    while not stop.is_set():
+        if rng.random() < 0.5:
+            name, path = "chats", f"/chats?limit={page_size}"
+        else:
+            name, path = "load_chat", f"/load_chat/{rng.choice(chat_ids)}?limit={page_size}"
+        started = time.perf_counter()
+        try:
+            status, _ = await fetch(path)
+        except Exception:
+            status = 0
+        if status != 200:
+            recorder.errors[name] += 1
+            continue
+        recorder.latency[name].append((time.perf_counter() - started) * 1000)
+
+
+async def run_load(fetch: Fetch, chat_ids: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    recorder = Recorder()
+    words = " ".join(f"word{i}" for i in range(args.prompt_words - 1))
+    prompts: "asyncio.Queue[str]" = asyncio.Queue()
+    for i in range(args.chat_requests):
+        # Distinct prompts, so generations are never coalesced or cached
+        prompts.put_nowait(f"{uuid.uuid4().hex[:8]} {words}")
+
+    stop = asyncio.Event()
+    readers = [
+        asyncio.create_task(reader_worker(fetch, chat_ids, args.page_size, stop, recorder))
+        for _ in range(args.readers)
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(*(chat_worker(fetch, chat_ids, prompts, recorder) for _ in range(args.streams)))
+    stop.set()
+    await asyncio.gather(*readers)
+    return recorder.report(time.perf_counter() - started)
+
+
+async def run_in_process(chat_ids: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        return await run_load(asgi_fetch(app), chat_ids, args)
+
+
+async def run_under_uvicorn(chat_ids: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    import uvicorn
+    from main import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        limits = httpx.Limits(max_connections=args.streams + args.readers)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=None) as client:
+            return await run_load(http_fetch(client), chat_ids, args)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+async def migrate(path: str) -> int:
+    from databases import Database
+    from migrations import run_migrations
+
+    database = Database(f"sqlite:///{path}")
+    await database.connect()
+    try:
+        return await run_migrations(database)
+    finally:
+        await database.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--streams", type=int, default=50, help="concurrent /chat streams")
+    parser.add_argument("--chat-requests", type=int, default=500, help="total /chat requests")
+    parser.add_argument("--readers", type=int, default=10, help="concurrent /chats and /load_chat clients")
+    parser.add_argument("--chats", type=int, default=1000, help="chats in the seeded database")
+    parser.add_argument("--messages-per-chat", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--prompt-words", type=int, default=20, help="words per prompt (= tokens per echoed reply)")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="simulated time per echoed token")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        # Read by config at import time, so set before the app is imported
+        os.environ.update(
+            DATABASE_URL=f"sqlite:///{path}",
+            ECHO_BACKEND_ENABLED="1",
+            ECHO_TOKEN_DELAY_MS=str(args.token_delay_ms),
+            ECHO_MAX_CONCURRENCY=str(max(args.streams, 1)),
+        )
+        asyncio.run(migrate(path))
+        started = time.perf_counter()
+        chat_ids = seed(path, args.chats, args.messages_per_chat)
+        seed_seconds = time.perf_counter() - started
+
+        run = run_in_process if args.mode == "asgi" else run_under_uvicorn
+        results = asyncio.run(run(chat_ids, args))
+
+    report = {
+        "mode": args.mode,
+        "streams": args.streams,
+        "chat_requests": args.chat_requests,
+        "readers": args.readers,
+        "chats": args.chats,
+        "messages": args.chats * args.messages_per_chat,
+        "token_delay_ms": args.token_delay_ms,
+        "seed_seconds": round(seed_seconds, 2),
+        **results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
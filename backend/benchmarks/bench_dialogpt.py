@@ -0,0 +1,115 @@
+"""
+DialoGPT CPU throughput and memory per inference profile.
+
+Each profile (model, int8 quantization, torch threads) runs in its own
+subprocess so peak RSS is measured per profile. The child loads the model
+through AIService, exactly as the server does, then greedily generates
+replies to a fixed set of prompts. Results are printed as JSON.
+
+    cd backend
+    python -m benchmarks.bench_dialogpt --threads 1 2 4
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+MODELS = ["microsoft/DialoGPT-medium", "microsoft/DialoGPT-small"]
+PROMPTS = [
+    "Hello, how are you?",
+    "What are you doing this weekend?",
+    "Can you recommend a good book?",
+    "I just got back from a trip to the mountains.",
+]
+
+
+def rss_mib() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux)."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_profile(max_new_tokens: int, rounds: int) -> Dict[str, float]:
+    """Load the model configured in the environment and measure generation."""
+    import torch
+    from ai_service import AIService
+
+    service = AIService()
+    started = time.perf_counter()
+    service._load_dialogpt_model()
+    load_seconds = time.perf_counter() - started
+    rss_after_load = rss_mib()
+    model, tokenizer = service._dialogpt_model()
+
+    tokens = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for prompt in PROMPTS:
+            input_ids = tokenizer.encode(prompt + tokenizer.eos_token, return_tensors="pt")
+            with torch.inference_mode():
+                output = model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=max_new_tokens,
+                    min_new_tokens=max_new_tokens,
+                    do_sample=False,
+                    pad_token_id=tokenizer.eos_token_id,
+                )
+            tokens += output.shape[1] - input_ids.shape[1]
+    generate_seconds = time.perf_counter() - started
+
+    return {
+        "load_seconds": round(load_seconds, 2),
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / generate_seconds, 2),
+        "rss_after_load_mib": rss_after_load,
+        "peak_rss_mib": rss_mib(),
+    }
+
+
+def spawn_profile(model: str, quantize: bool, threads: int, args: argparse.Namespace) -> Dict:
+    env = dict(
+        os.environ,
+        DIALOGPT_MODEL_NAME=model,
+        DIALOGPT_QUANTIZE="1" if quantize else "0",
+        DIALOGPT_TORCH_THREADS=str(threads),
+    )
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_dialogpt", "--child",
+         "--max-new-tokens", str(args.max_new_tokens), "--rounds", str(args.rounds)],
+        env=env, capture_output=True, text=True
+    )
+    profile = {"model": model, "quantize": quantize, "threads": threads}
+    if result.returncode != 0:
+        profile["error"] = result.stderr.strip().splitlines()[-1]
+        return profile
+    profile.update(json.loads(result.stdout.strip().splitlines()[-1]))
+    return profile
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--models", nargs="+", default=MODELS)
+    parser.add_argument("--threads", nargs="+", type=int, default=[os.cpu_count() or 1])
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_profile(args.max_new_tokens, args.rounds)))
+        return
+
+    results: List[Dict] = [
+        spawn_profile(model, quantize, threads, args)
+        for model, quantize, threads in itertools.product(args.models, [False, True], args.threads)
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
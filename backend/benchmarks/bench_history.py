@@ -0,0 +1,120 @@
+"""
+History-load latency before and after the schema migrations.
+
+Seeds a throwaway SQLite file with the original (version 1) schema, times the
+get_chat_history query for random chats, applies the remaining migrations and
+times it again. Results are printed as JSON.
+
+    cd backend
+    python -m benchmarks.bench_history --messages 1000000 --chats 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from databases import Database
+from migrations import run_migrations
+
+HISTORY_QUERY = (
+    "SELECT user, message FROM messages WHERE chat_id = ? "
+    "ORDER BY timestamp DESC, id DESC LIMIT ?"
+)
+
+
+def seed(path: str, message_count: int, chat_count: int) -> None:
+    """Insert ``message_count`` messages spread over ``chat_count`` chats."""
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO chats (id, title) VALUES (?, ?)",
+        ((f"chat-{i}", f"Chat {i}") for i in range(chat_count))
+    )
+    start = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    conn.executemany(
+        "INSERT INTO messages (chat_id, user, message, timestamp) VALUES (?, ?, ?, ?)",
+        (
+            (
+                f"chat-{rng.randrange(chat_count)}",
+                "user" if i % 2 == 0 else "bot",
+                f"Message {i} " + "lorem ipsum " * 8,
+                (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            )
+            for i in range(message_count)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+def time_history_loads(path: str, chat_count: int, queries: int, limit: int) -> Dict[str, float]:
+    """Latency percentiles (ms) of the history query for random chats."""
+    conn = sqlite3.connect(path)
+    rng = random.Random(7)
+    samples: List[float] = []
+    for _ in range(queries):
+        chat_id = f"chat-{rng.randrange(chat_count)}"
+        started = time.perf_counter()
+        conn.execute(HISTORY_QUERY, (chat_id, limit)).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    conn.close()
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+async def migrate(path: str, target: int = None) -> int:
+    database = Database(f"sqlite:///{path}")
+    await database.connect()
+    try:
+        return await run_migrations(database, target=target)
+    finally:
+        await database.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        asyncio.run(migrate(path, target=1))
+
+        started = time.perf_counter()
+        seed(path, args.messages, args.chats)
+        seed_seconds = time.perf_counter() - started
+
+        before = time_history_loads(path, args.chats, args.queries, args.limit)
+        started = time.perf_counter()
+        version = asyncio.run(migrate(path))
+        migrate_seconds = time.perf_counter() - started
+        after = time_history_loads(path, args.chats, args.queries, args.limit)
+
+    print(json.dumps({
+        "messages": args.messages,
+        "chats": args.chats,
+        "queries": args.queries,
+        "seed_seconds": round(seed_seconds, 2),
+        "migrate_seconds": round(migrate_seconds, 2),
+        "schema_version": version,
+        "before": before,
+        "after": after,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+
+
+class Flight:
+    """
+    One generation, run as its own task and shared by every request that
+    subscribed to it. Tokens are kept so late subscribers replay the ones
+    they missed.
+    """
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done: bool = False
+        self.error: Optional[BaseException] = None
+        self.subscribers: int = 0
+        # Every subscriber left before the end; the generation was cancelled
+        self.abandoned: bool = False
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, token: str) -> None:
+        self.tokens.append(token)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """Yield every token of the generation, starting from the first."""
+        self.subscribers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(self.tokens):
+                    yield self.tokens[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self.task is not None:
+                self.abandoned = True
+                self.task.cancel()
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight generations: the first request for a key
+    starts the generation and later requests for the same key subscribe to it
+    until it finishes.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.started: int = 0
+        self.coalesced: int = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+    def join(self, key: Optional[str], generate: Callable[[], AsyncIterator[str]]) -> Flight:
+        """
+        The running flight for ``key``, or a new one driving ``generate()``.
+        A ``None`` key never shares its flight.
+        """
+        flight = self._flights.get(key) if key is not None else None
+        if flight is not None and not flight.done and not flight.abandoned:
+            self.coalesced += 1
+            return flight
+
+        flight = Flight()
+        self.started += 1
+        if key is not None:
+            self._flights[key] = flight
+        flight.task = asyncio.create_task(self._run(key, flight, generate))
+        return flight
+
+    async def _run(self, key: Optional[str], flight: Flight, generate: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for token in generate():
+                flight.publish(token)
+        except asyncio.CancelledError as e:
+            flight.finish(e)
+            raise
+        except Exception as e:
+            flight.finish(e)
+        else:
+            flight.finish()
+        finally:
+            if key is not None and self._flights.get(key) is flight:
+                del self._flights[key]
@@ -0,0 +1,160 @@
+"""Runtime settings, read once from environment variables."""
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment."""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment."""
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting ("1", "true", "yes", "on") from the environment."""
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# -----------------------------
+# Database
+# -----------------------------
+DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./chatbot.db")
+# SQLite connection profile (ignored for other databases)
+SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS: int = env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_MMAP_SIZE: int = env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+# Negative values are KiB, positive values are pages
+SQLITE_CACHE_SIZE: int = env_int("SQLITE_CACHE_SIZE", -64 * 1024)
+SQLITE_TEMP_STORE: str = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+# asyncpg pool for postgresql:// URLs, shared by every request of this process
+POSTGRES_POOL_MIN_SIZE: int = env_int("POSTGRES_POOL_MIN_SIZE", 5)
+POSTGRES_POOL_MAX_SIZE: int = env_int("POSTGRES_POOL_MAX_SIZE", 20)
+# Idle connections above the minimum are closed after this long
+POSTGRES_POOL_MAX_IDLE_S: float = env_float("POSTGRES_POOL_MAX_IDLE_S", 300.0)
+POSTGRES_COMMAND_TIMEOUT_S: float = env_float("POSTGRES_COMMAND_TIMEOUT_S", 10.0)
+# Prepared statements cached per connection; set 0 behind PgBouncer in transaction mode
+POSTGRES_STATEMENT_CACHE_SIZE: int = env_int("POSTGRES_STATEMENT_CACHE_SIZE", 256)
+# Apply migrations in the app lifespan; serve.sh migrates once up front and turns this off
+MIGRATE_ON_STARTUP: bool = env_bool("MIGRATE_ON_STARTUP", True)
+
+# -----------------------------
+# Message write-behind buffer
+# -----------------------------
+# Flush as soon as this many messages are buffered...
+MESSAGE_WRITER_BATCH_SIZE: int = env_int("MESSAGE_WRITER_BATCH_SIZE", 100)
+# ...or after this long, whichever comes first
+MESSAGE_WRITER_FLUSH_MS: float = env_float("MESSAGE_WRITER_FLUSH_MS", 50.0)
+
+# -----------------------------
+# Conversation context cache
+# -----------------------------
+# Chats whose recent history is kept in memory
+CONTEXT_CACHE_MAX_CHATS: int = env_int("CONTEXT_CACHE_MAX_CHATS", 10000)
+# Newest messages kept per chat; must cover the largest model context window
+CONTEXT_CACHE_DEPTH: int = env_int("CONTEXT_CACHE_DEPTH", 20)
+
+# -----------------------------
+# Model backends
+# -----------------------------
+# Concurrent generations per backend; further requests wait up to the queue timeout
+OPENAI_MAX_CONCURRENCY: int = env_int("OPENAI_MAX_CONCURRENCY", 64)
+OPENAI_QUEUE_TIMEOUT_S: float = env_float("OPENAI_QUEUE_TIMEOUT_S", 30.0)
+# Two batches' worth, so the next batch fills while one is generating
+DIALOGPT_MAX_CONCURRENCY: int = env_int("DIALOGPT_MAX_CONCURRENCY", 16)
+DIALOGPT_QUEUE_TIMEOUT_S: float = env_float("DIALOGPT_QUEUE_TIMEOUT_S", 30.0)
+# Deterministic "echo" model for load tests; off unless explicitly enabled
+ECHO_BACKEND_ENABLED: bool = env_bool("ECHO_BACKEND_ENABLED", False)
+ECHO_MAX_CONCURRENCY: int = env_int("ECHO_MAX_CONCURRENCY", 1000)
+ECHO_QUEUE_TIMEOUT_S: float = env_float("ECHO_QUEUE_TIMEOUT_S", 30.0)
+# Simulated time per token, to mimic a slow model
+ECHO_TOKEN_DELAY_MS: float = env_float("ECHO_TOKEN_DELAY_MS", 0.0)
+
+# -----------------------------
+# Response cache and request coalescing
+# -----------------------------
+# Replay stored replies for repeated (model, context, prompt); off by default
+RESPONSE_CACHE_ENABLED: bool = env_bool("RESPONSE_CACHE_ENABLED", False)
+# Also cache replies of sampled (non-deterministic) generations
+RESPONSE_CACHE_SAMPLED: bool = env_bool("RESPONSE_CACHE_SAMPLED", False)
+RESPONSE_CACHE_TTL_S: float = env_float("RESPONSE_CACHE_TTL_S", 300.0)
+RESPONSE_CACHE_MAX_ENTRIES: int = env_int("RESPONSE_CACHE_MAX_ENTRIES", 1000)
+# Identical requests arriving while one is generating share its token stream
+COALESCE_GENERATIONS: bool = env_bool("COALESCE_GENERATIONS", True)
+
+# -----------------------------
+# Tokenization
+# -----------------------------
+# (tokenizer, message) pairs whose token ids are kept in memory (LRU)
+TOKEN_CACHE_MAX_ENTRIES: int = env_int("TOKEN_CACHE_MAX_ENTRIES", 50000)
+# Token budget for OpenAI chat history (counted with tiktoken if installed); 0 = message count only
+OPENAI_CONTEXT_MAX_TOKENS: int = env_int("OPENAI_CONTEXT_MAX_TOKENS", 0)
+
+# -----------------------------
+# DialoGPT
+# -----------------------------
+# Hugging Face model id; "microsoft/DialoGPT-small" for small deployments
+DIALOGPT_MODEL_NAME: str = os.getenv("DIALOGPT_MODEL_NAME", "microsoft/DialoGPT-medium")
+# Dynamic int8 quantization of the linear layers (CPU only)
+DIALOGPT_QUANTIZE: bool = env_bool("DIALOGPT_QUANTIZE", False)
+# Intra-op threads torch uses for generation; 0 keeps torch's default (one per core)
+DIALOGPT_TORCH_THREADS: int = env_int("DIALOGPT_TORCH_THREADS", 0)
+# Chats whose attention keys/values are kept between turns (LRU)
+DIALOGPT_KV_CACHE_MAX_CHATS: int = env_int("DIALOGPT_KV_CACHE_MAX_CHATS", 64)
+# Memory budget for cached keys/values; DialoGPT-medium needs ~200 KB per token
+DIALOGPT_KV_CACHE_MAX_BYTES: int = env_int("DIALOGPT_KV_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+# Load the model in the background at startup; /readyz fails until it is loaded
+DIALOGPT_WARMUP: bool = env_bool("DIALOGPT_WARMUP", False)
+
+# -----------------------------
+# DialoGPT batch scheduler
+# -----------------------------
+# Largest number of prompts run through one batched generate() call
+DIALOGPT_MAX_BATCH_SIZE: int = env_int("DIALOGPT_MAX_BATCH_SIZE", 8)
+# How long the worker waits for more prompts after the first one arrives
+DIALOGPT_MAX_WAIT_MS: float = env_float("DIALOGPT_MAX_WAIT_MS", 20.0)
+# Prompts allowed to wait for the worker before /chat answers 503
+DIALOGPT_MAX_QUEUE_DEPTH: int = env_int("DIALOGPT_MAX_QUEUE_DEPTH", 64)
+# Threads shared by blocking local-model work (the batch worker and model
+# loading); at least 2 so a load never waits behind the worker
+DIALOGPT_EXECUTOR_THREADS: int = max(2, env_int("DIALOGPT_EXECUTOR_THREADS", 2))
+
+# -----------------------------
+# HTTP worker processes
+# -----------------------------
+# uvicorn workers started by serve.sh (uvicorn itself reads it too)
+WEB_CONCURRENCY: int = env_int("WEB_CONCURRENCY", 1)
+# Every request of a chat reaches the same replica: there is only one, or
+# the load balancer routes on chat_id
+CHAT_AFFINITY: bool = env_bool("CHAT_AFFINITY", False)
+# The context cache and the write-behind buffer only see this process's
+# writes, so they are used only while a chat's requests all reach it: one
+# HTTP worker, and per-chat routing when replicas share a PostgreSQL database
+PROCESS_LOCAL_CHAT_STATE: bool = WEB_CONCURRENCY <= 1 and (
+    CHAT_AFFINITY or not DATABASE_URL.startswith(("postgresql", "postgres"))
+)
+
+# -----------------------------
+# Model-worker processes
+# -----------------------------
+# DialoGPT processes run by "python -m model_workers"; when > 0 the HTTP
+# workers send prompts to them instead of loading the model themselves
+MODEL_WORKERS: int = env_int("MODEL_WORKERS", 0)
+# Unix socket the model workers listen on
+MODEL_WORKER_SOCKET: str = os.getenv("MODEL_WORKER_SOCKET", "/tmp/chatbot-model-workers.sock")
+
+# -----------------------------
+# Request profiling
+# -----------------------------
+# Allow /chat requests sent with "X-Profile: 1" to record a span timeline
+PROFILING_ENABLED: bool = env_bool("PROFILING_ENABLED", False)
+# Write each trace to this directory as Chrome-trace JSON instead of sending
+# it as a trailing "profile" SSE event
+PROFILE_TRACE_DIR: str = os.getenv("PROFILE_TRACE_DIR", "")
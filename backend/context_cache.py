@@ -0,0 +1,105 @@
+from typing import Dict, List, Optional
+from collections import OrderedDict
+from models.chat import HistoryMessage
+import config
+
+
+class _CachedWindow:
+    """The newest messages of one chat."""
+
+    def __init__(self, history: List[HistoryMessage], complete: bool):
+        self.history = history
+        # True when ``history`` is the whole chat, not just its tail
+        self.complete = complete
+
+
+class ContextCache:
+    """
+    In-process LRU cache of recent conversation context, keyed by chat_id.
+
+    Each entry holds up to ``depth`` of a chat's newest messages. Entries are
+    filled by history reads and kept current by the /chat write path, so
+    follow-up turns of an active conversation never touch the database.
+    """
+
+    def __init__(self, max_chats: int = 10000, depth: int = 20):
+        self.max_chats = max_chats
+        self.depth = depth
+        self._entries: "OrderedDict[str, _CachedWindow]" = OrderedDict()
+        # Bumped on every write so a read that raced a write cannot store stale history
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        """False when sized to zero chats, e.g. with chat state shared across processes."""
+        return self.max_chats > 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def version(self, chat_id: str) -> int:
+        return self._versions.get(chat_id, 0)
+
+    def _bump(self, chat_id: str) -> None:
+        self._versions[chat_id] = self.version(chat_id) + 1
+        self._versions.move_to_end(chat_id)
+        # Only recently written chats can still have a racing read in flight
+        while len(self._versions) > 2 * self.max_chats:
+            self._versions.popitem(last=False)
+
+    def get(self, chat_id: str, max_messages: int) -> Optional[List[HistoryMessage]]:
+        """Newest ``max_messages`` messages (oldest first), or None on a miss."""
+        entry = self._entries.get(chat_id)
+        if entry is None or (len(entry.history) < max_messages and not entry.complete):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(chat_id)
+        self.hits += 1
+        return entry.history[-max_messages:] if max_messages else []
+
+    def put(self, chat_id: str, history: List[HistoryMessage], complete: bool, version: int) -> None:
+        """Store history read at ``version``; ignored if a write happened since."""
+        if version != self.version(chat_id) or not self.max_chats:
+            return
+        self._entries[chat_id] = _CachedWindow(history[-self.depth:], complete)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_chats:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def append(self, chat_id: str, message: HistoryMessage) -> None:
+        """Add a newly written message to the chat's window, if cached."""
+        self._bump(chat_id)
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return
+        entry.history.append(message)
+        if len(entry.history) > self.depth:
+            del entry.history[0]
+            entry.complete = False
+
+    def invalidate(self, chat_id: str) -> None:
+        self._bump(chat_id)
+        self._entries.pop(chat_id, None)
+
+    def clear(self) -> None:
+        for chat_id in list(self._entries):
+            self.invalidate(chat_id)
+
+
+# Global context cache instance; caches nothing when other processes also write chats
+context_cache = ContextCache(
+    max_chats=config.CONTEXT_CACHE_MAX_CHATS if config.PROCESS_LOCAL_CHAT_STATE else 0,
+    depth=config.CONTEXT_CACHE_DEPTH
+)
@@ -1,10 +1,16 @@
-from sqlalchemy import create_engine
-from models.db import metadata
+import asyncio
+from db import database
+from migrations import run_migrations
 
-DATABASE_URL = "sqlite:///./chatbot.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 
-# Create all tables
-metadata.create_all(engine)
+async def main() -> None:
+    await database.connect()
+    try:
+        version = await run_migrations(database)
+    finally:
+        await database.disconnect()
+    print(f"Tables created successfully! (schema version {version})")
 
-print("Tables created successfully!")
+
+if __name__ == "__main__":
+    asyncio.run(main())
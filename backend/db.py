@@ -1,4 +1,73 @@
+import sqlite3
+from typing import Any, Dict
 from databases import Database
+import config
 
-DATABASE_URL = "sqlite:///./chatbot.db"
-database = Database(DATABASE_URL)
+DATABASE_URL = config.DATABASE_URL
+
+# Applied to every new SQLite connection; journal_mode is set once at startup
+SQLITE_PRAGMAS: Dict[str, Any] = {
+    "synchronous": config.SQLITE_SYNCHRONOUS,
+    "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+    "mmap_size": config.SQLITE_MMAP_SIZE,
+    "cache_size": config.SQLITE_CACHE_SIZE,
+    "temp_store": config.SQLITE_TEMP_STORE,
+}
+
+
+# asyncpg pool settings for PostgreSQL. The queries are short OLTP lookups,
+# so JIT compilation only adds planning time.
+POSTGRES_POOL_OPTIONS: Dict[str, Any] = {
+    "min_size": config.POSTGRES_POOL_MIN_SIZE,
+    "max_size": config.POSTGRES_POOL_MAX_SIZE,
+    "max_inactive_connection_lifetime": config.POSTGRES_POOL_MAX_IDLE_S,
+    "command_timeout": config.POSTGRES_COMMAND_TIMEOUT_S,
+    "statement_cache_size": config.POSTGRES_STATEMENT_CACHE_SIZE,
+    "server_settings": {"application_name": "chatbot", "jit": "off"},
+}
+
+
+class TunedSQLiteConnection(sqlite3.Connection):
+    """sqlite3 connection that applies SQLITE_PRAGMAS as soon as it opens."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        for name, value in SQLITE_PRAGMAS.items():
+            self.execute(f"PRAGMA {name} = {value}")
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def is_postgres(url: str) -> bool:
+    return url.startswith(("postgresql", "postgres"))
+
+
+def database_options(url: str) -> Dict[str, Any]:
+    """Connection options of the tuned profile for ``url``'s database."""
+    if is_sqlite(url):
+        return {"factory": TunedSQLiteConnection}
+    if is_postgres(url):
+        return dict(POSTGRES_POOL_OPTIONS)
+    return {}
+
+
+async def configure_database(database: Database) -> Dict[str, Any]:
+    """
+    Apply the database-wide SQLite settings and return the effective profile.
+
+    WAL is persistent in the database file, so it only needs setting once;
+    readers then no longer block on the writer (and vice versa).
+    """
+    if not is_sqlite(str(database.url)):
+        return {}
+    profile = {
+        "journal_mode": await database.fetch_val(f"PRAGMA journal_mode = {config.SQLITE_JOURNAL_MODE}")
+    }
+    for name in SQLITE_PRAGMAS:
+        profile[name] = await database.fetch_val(f"PRAGMA {name}")
+    return profile
+
+
+database = Database(DATABASE_URL, **database_options(DATABASE_URL))
@@ -1,44 +1,180 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Query, Request
 from fastapi.responses import StreamingResponse
+from contextlib import aclosing
 from datetime import datetime, UTC
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import re
+import time
 import uuid
-from typing import Optional, List, AsyncGenerator
-from models.chat import ChatMessage, Chat, HistoryMessage, ChatSummary, ApiResponse
-from models.db import chats, messages
-from db import database
-from ai_service import ai_service
+from typing import Callable, Optional, List, AsyncGenerator, Set, Tuple
+from models.chat import (
+    ChatMessage, Chat, HistoryMessage, ChatPage, ApiResponse, StreamStart, StreamEnd
+)
+from storage import store
+from message_writer import message_writer
+from context_cache import context_cache
+from kv_cache import kv_cache
+from ai_service import ai_service, estimate_tokens
+from metrics import active_streams, sse_bytes_sent
+from profiling import Trace, current_trace, span
+import config
 
 app = FastAPI()
 router = APIRouter()
 
+# Streaming formats for /chat
+STREAM_DELTA = "delta"         # typed start/delta/end events, new text only
+STREAM_SNAPSHOT = "snapshot"   # legacy: full ChatMessage re-sent on every token
+STREAM_FORMATS = (STREAM_DELTA, STREAM_SNAPSHOT)
+
+# Saves of replies cut off by a disconnect; they outlive the cancelled stream
+_pending_saves: Set[asyncio.Task] = set()
+
+# chat_id comes from the client; only these characters reach a trace filename
+UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def sse_event(event: str, data: str) -> bytes:
+    """Encode a named Server-Sent Event."""
+    return f"event: {event}\ndata: {data}\n\n".encode('utf-8')
+
+
+async def metered(stream: AsyncGenerator[bytes, None], fmt: str) -> AsyncGenerator[bytes, None]:
+    """Count the bytes of an SSE stream and track it as active while it runs."""
+    sent = sse_bytes_sent.labels(fmt)
+    active_streams.inc()
+    try:
+        async with aclosing(stream):
+            async for chunk in stream:
+                sent.inc(len(chunk))
+                yield chunk
+    finally:
+        active_streams.dec()
+
+
+async def profiled(stream: AsyncGenerator[bytes, None], trace: Trace, fmt: str, chat_id: str) -> AsyncGenerator[bytes, None]:
+    """
+    Record every SSE write of a profiled request, then deliver its trace: to
+    PROFILE_TRACE_DIR if set, otherwise as a final event of the stream.
+    """
+    async with aclosing(stream):
+        async for chunk in stream:
+            with trace.span("sse_write", bytes=len(chunk)):
+                yield chunk
+
+    if config.PROFILE_TRACE_DIR:
+        safe_id = UNSAFE_FILENAME_CHARS.sub("_", chat_id)[:64]
+        filename = f"chat-{safe_id}-{int(time.time() * 1000)}.json"
+        path = await asyncio.to_thread(trace.write, config.PROFILE_TRACE_DIR, filename)
+        print(f"Request profile written to {path}")
+    elif fmt == STREAM_DELTA:
+        yield sse_event("profile", json.dumps(trace.to_chrome()))
+    else:
+        yield f"data: {json.dumps({'profile': trace.to_chrome()})}\n\n".encode('utf-8')
+
+
 # -----------------------------
 # Helper to create a new chat
 # -----------------------------
 async def create_chat(title: str = "New Chat") -> str:
     """Create a new chat session in the database."""
     chat_id: str = str(uuid.uuid4())
-    query = chats.insert().values(id=chat_id, title=title)
-    await database.execute(query)
+    await store.create_chat(chat_id, title, datetime.now(UTC))
+    # A brand-new chat has no history; spare its first turn the lookup
+    context_cache.put(chat_id, [], complete=True, version=context_cache.version(chat_id))
     return chat_id
 
 
+# -----------------------------
+# Chat list cursors
+# -----------------------------
+def encode_cursor(updated_at: datetime, chat_id: str) -> str:
+    """Opaque keyset cursor pointing just past (updated_at, chat_id)."""
+    raw = json.dumps([updated_at.isoformat(), chat_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        updated_at, chat_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(updated_at), str(chat_id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
 # -----------------------------
 # Get chat history
 # -----------------------------
-async def get_chat_history(chat_id: str) -> List[HistoryMessage]:
-    """Retrieve chat history for context."""
-    msg_query = messages.select().where(
-        messages.c.chat_id == chat_id
-    ).order_by(messages.c.timestamp)
-    msgs = await database.fetch_all(msg_query)
-    
-    return [
-        HistoryMessage(
-            user=msg["user"],
-            message=msg["message"]
-        )
-        for msg in msgs
-    ]
+async def get_chat_history(
+    chat_id: str,
+    max_messages: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[HistoryMessage]:
+    """
+    Retrieve the most recent chat history for context.
+
+    Windows that fit in the context cache are served from memory; otherwise
+    only the newest rows are read from the store. Older
+    messages are dropped once ``max_tokens`` (as counted by ``count_tokens``)
+    is spent.
+    """
+    cacheable = context_cache.enabled and max_messages is not None and max_messages <= context_cache.depth
+    history = context_cache.get(chat_id, max_messages) if cacheable else None
+
+    if history is None:
+        version = context_cache.version(chat_id)
+        await message_writer.flush_chat(chat_id)
+        limit = context_cache.depth if cacheable else max_messages
+        history = await store.fetch_context(chat_id, limit)
+        if cacheable:
+            context_cache.put(chat_id, history, complete=len(history) < limit, version=version)
+            history = history[-max_messages:] if max_messages else []
+
+    return trim_to_token_budget(history, max_tokens, count_tokens)
+
+
+def trim_to_token_budget(
+    history: List[HistoryMessage],
+    max_tokens: Optional[int],
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[HistoryMessage]:
+    """Keep the newest messages that fit in ``max_tokens`` (at least one)."""
+    if max_tokens is None:
+        return history
+    budget = max_tokens
+    for i in range(len(history) - 1, -1, -1):
+        budget -= count_tokens(history[i].message)
+        if budget < 0 and i < len(history) - 1:
+            return history[i + 1:]
+    return history
+
+
+async def save_message(message: ChatMessage) -> None:
+    """Persist a message and keep the chat's cached context current."""
+    context_cache.append(message.chat_id, HistoryMessage(user=message.user, message=message.message))
+    await message_writer.write(message)
+
+
+def save_message_later(message: ChatMessage) -> None:
+    """
+    Persist a message from a stream that is being cancelled, where awaiting is
+    no longer possible; the save runs as its own task.
+    """
+    task = asyncio.create_task(save_message(message))
+    _pending_saves.add(task)
+    task.add_done_callback(_pending_saves.discard)
+
+
+async def finish_pending_saves() -> None:
+    """Wait for saves started by save_message_later (called at shutdown)."""
+    if _pending_saves:
+        await asyncio.gather(*_pending_saves, return_exceptions=True)
 
 
 # -----------------------------
@@ -46,10 +182,14 @@ async def get_chat_history(chat_id: str) -> List[HistoryMessage]:
 # -----------------------------
 @router.get("/chat")
 async def chat(
+    request: Request,
     prompt: str,
     chat_id: Optional[str] = None,
     api_key: Optional[str] = None,
-    model: str = "gpt-3.5-turbo"
+    model: str = "gpt-3.5-turbo",
+    stream_format: Optional[str] = None,
+    x_stream_format: Optional[str] = Header(None),
+    x_profile: Optional[str] = Header(None)
 ) -> StreamingResponse:
     """
     Chat endpoint with streaming responses.
@@ -59,15 +199,49 @@ async def chat(
         chat_id: Optional chat session ID (creates new if None)
         api_key: Optional OpenAI API key from query parameter
         model: AI model to use (default: gpt-3.5-turbo)
+        stream_format: "delta" (default) or "snapshot"; also read from the
+            X-Stream-Format header
+        x_profile: "1" records a span timeline of this request when
+            PROFILING_ENABLED is set
     
     Returns:
         StreamingResponse with Server-Sent Events
+
+    If the client disconnects mid-reply, generation is cancelled (the OpenAI
+    stream is closed, the local model stops at its next step) and the partial
+    reply is saved with ``truncated`` set.
     """
+    fmt = (stream_format or x_stream_format or STREAM_DELTA).lower()
+    if fmt not in STREAM_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown stream format: {fmt}"
+        )
+
+    if not ai_service.has_capacity(api_key, model):
+        raise HTTPException(
+            status_code=503,
+            detail="The model is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    trace: Optional[Trace] = None
+    if config.PROFILING_ENABLED and x_profile in ("1", "true"):
+        # Inherited by everything this request runs, including its generation
+        trace = Trace(f"/chat {model}")
+        current_trace.set(trace)
+
     if not chat_id:
-        chat_id = await create_chat(title=prompt[:50])  # Truncate title
+        with span("create_chat"):
+            chat_id = await create_chat(title=prompt[:50])  # Truncate title
 
     # Get chat history BEFORE saving user message (to avoid duplication)
-    history_msgs: List[HistoryMessage] = await get_chat_history(chat_id) if chat_id else []
+    window = ai_service.context_window(api_key, model)
+    with span("get_chat_history"):
+        history_msgs: List[HistoryMessage] = await get_chat_history(
+            chat_id, window.max_messages, window.max_tokens,
+            lambda text: ai_service.count_tokens(text, api_key, model)
+        ) if chat_id else []
     history = [{"user": msg.user, "message": msg.message} for msg in history_msgs]
 
     # Save user message
@@ -77,55 +251,125 @@ async def chat(
         timestamp=datetime.now(UTC),
         chat_id=chat_id,
     )
-    await database.execute(messages.insert().values(
-        user=user_msg.user,
-        message=user_msg.message,
-        timestamp=user_msg.timestamp,
-        chat_id=user_msg.chat_id
-    ))
-
-    async def stream() -> AsyncGenerator[bytes, None]:
-        """Stream AI response tokens."""
+    with span("save_user_message"):
+        await save_message(user_msg)
+
+    async def stream_snapshot() -> AsyncGenerator[bytes, None]:
+        """Stream the accumulated bot message on every token (legacy format)."""
+        message_text: str = ""
+        saved = False
         try:
-            
-            message_text: str = ""
-            
             # Stream response from AI service
-            async for token in ai_service.generate_response(
+            async with aclosing(ai_service.generate_response(
                 prompt=prompt,
                 chat_history=history,
                 api_key=api_key,
-                model=model
-            ):
-                message_text += token
-                msg = ChatMessage(
-                    user="bot",
-                    message=message_text.strip(),
-                    timestamp=datetime.now(UTC),
-                    chat_id=chat_id,
-                )
-                yield f"data: {msg.model_dump_json()}\n\n".encode('utf-8')
-
-            # Save complete bot message to database
-            final_msg = ChatMessage(
-                user="bot",
-                message=message_text.strip(),
-                timestamp=datetime.now(UTC),
-                chat_id=chat_id,
-            )
-            await database.execute(messages.insert().values(
-                user=final_msg.user,
-                message=final_msg.message,
-                timestamp=final_msg.timestamp,
-                chat_id=final_msg.chat_id
-            ))
+                model=model,
+                chat_id=chat_id
+            )) as tokens:
+                async for token in tokens:
+                    message_text += token
+                    if await request.is_disconnected():
+                        await save_truncated_message(message_text)
+                        return
+                    msg = ChatMessage(
+                        user="bot",
+                        message=message_text.strip(),
+                        timestamp=datetime.now(UTC),
+                        chat_id=chat_id,
+                    )
+                    yield f"data: {msg.model_dump_json()}\n\n".encode('utf-8')
 
+            await save_bot_message(message_text)
+            saved = True
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # The server cancels or closes the stream when the client goes away
+            if not saved and message_text.strip():
+                save_message_later(bot_message(message_text, truncated=True))
+            raise
         except Exception as e:
             print(f"Streaming error: {str(e)}")
             yield f"data: {{\"error\": \"{str(e)}\"}}\n\n".encode('utf-8')
 
+    async def stream_delta() -> AsyncGenerator[bytes, None]:
+        """Stream typed start/delta/end events carrying only new text."""
+        message_id: str = uuid.uuid4().hex
+        started: float = time.perf_counter()
+        first_token_ms: Optional[float] = None
+        parts: List[str] = []
+        saved = False
+        try:
+            yield sse_event("start", StreamStart(
+                chat_id=chat_id,
+                message_id=message_id
+            ).model_dump_json())
+
+            async with aclosing(ai_service.generate_response(
+                prompt=prompt,
+                chat_history=history,
+                api_key=api_key,
+                model=model,
+                chat_id=chat_id
+            )) as tokens:
+                async for token in tokens:
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                    parts.append(token)
+                    if await request.is_disconnected():
+                        await save_truncated_message("".join(parts))
+                        return
+                    yield sse_event("delta", json.dumps({"delta": token}))
+
+            final_text = await save_bot_message("".join(parts))
+            saved = True
+
+            yield sse_event("end", StreamEnd(
+                message_id=message_id,
+                sha256=hashlib.sha256(final_text.encode('utf-8')).hexdigest(),
+                tokens=len(parts),
+                first_token_ms=first_token_ms,
+                elapsed_ms=(time.perf_counter() - started) * 1000
+            ).model_dump_json())
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # The server cancels or closes the stream when the client goes away
+            if not saved and "".join(parts).strip():
+                save_message_later(bot_message("".join(parts), truncated=True))
+            raise
+        except Exception as e:
+            print(f"Streaming error: {str(e)}")
+            # Not "error": EventSource reserves that name for connection failures
+            yield sse_event("failure", json.dumps({"error": str(e)}))
+
+    def bot_message(message_text: str, truncated: bool = False) -> ChatMessage:
+        """Bot reply for this chat; ``truncated`` if cut off by a disconnect."""
+        return ChatMessage(
+            user="bot",
+            message=message_text.strip(),
+            timestamp=datetime.now(UTC),
+            chat_id=chat_id,
+            truncated=truncated,
+        )
+
+    async def save_bot_message(message_text: str) -> str:
+        """Save the complete bot message to the database."""
+        final_msg = bot_message(message_text)
+        with span("save_bot_message"):
+            await save_message(final_msg)
+        return final_msg.message
+
+    async def save_truncated_message(message_text: str) -> None:
+        """Save what was generated before the client disconnected, if anything."""
+        print(f"Client disconnected from chat {chat_id}; generation cancelled")
+        if message_text.strip():
+            await save_message(bot_message(message_text, truncated=True))
+
+    stream = stream_delta() if fmt == STREAM_DELTA else stream_snapshot()
+    if trace is not None:
+        stream = profiled(stream, trace, fmt, chat_id)
     return StreamingResponse(
-        stream(),
+        metered(stream, fmt),
         media_type="text/event-stream",
         headers={
             'Cache-Control': 'no-cache',
@@ -139,43 +383,52 @@ async def chat(
 # Load chat messages
 # -----------------------------
 @router.get("/load_chat/{chat_id}", response_model=Chat)
-async def load_chat(chat_id: str) -> Chat:
-    """Load a specific chat with its message history."""
-    chat_query = chats.select().where(chats.c.id == chat_id)
-    chat_data = await database.fetch_one(chat_query)
-    if not chat_data:
-        raise HTTPException(status_code=404, detail="Chat not found")
+async def load_chat(
+    chat_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None
+) -> Chat:
+    """
+    Load a specific chat with its message history.
 
-    msg_query = messages.select().where(
-        messages.c.chat_id == chat_id
-    ).order_by(messages.c.timestamp)
-    messages_data = await database.fetch_all(msg_query)
-
-    messages_list: List[ChatMessage] = [
-        ChatMessage(
-            user=m["user"],
-            message=m["message"],
-            timestamp=m["timestamp"],
-            chat_id=m["chat_id"]
-        )
-        for m in messages_data
-    ]
-    return Chat(
-        chat_id=chat_data["id"],
-        title=chat_data["title"],
-        messages=messages_list
-    )
+    Messages are always returned oldest first and paged by message id:
+    - ``limit`` alone returns the newest ``limit`` messages
+    - ``before_id`` pages backwards through older messages
+    - ``after_id`` returns only messages newer than that id (e.g. after a
+      reconnect), oldest first
+    ``has_more`` tells whether another page exists in the paging direction.
+    """
+    await message_writer.flush_chat(chat_id)
+    chat = await store.load_chat_page(chat_id, limit, before_id, after_id)
+    if chat is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return chat
 
 
 # -----------------------------
-# List all chats
+# List chats (keyset pagination)
 # -----------------------------
-@router.get("/chats")
-async def list_chats() -> List[ChatSummary]:
-    """List all chat sessions."""
-    query = chats.select()
-    all_chats = await database.fetch_all(query)
-    return [ChatSummary(id=chat["id"], title=chat["title"]) for chat in all_chats]
+@router.get("/chats", response_model=ChatPage)
+async def list_chats(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
+) -> ChatPage:
+    """List chat sessions, most recently active first, one page at a time."""
+    after: Optional[Tuple[datetime, str]] = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    # Fetch one extra chat to learn whether another page exists
+    rows = await store.list_chats(limit + 1, after)
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(page[-1].updated_at, page[-1].id)
+    return ChatPage(chats=page, next_cursor=next_cursor)
 
 
 # -----------------------------
@@ -185,15 +438,11 @@ async def list_chats() -> List[ChatSummary]:
 async def delete_chat(chat_id: str) -> ApiResponse:
     """Delete a chat session and all its messages."""
     try:
-        # Delete all messages for this chat
-        delete_messages = messages.delete().where(messages.c.chat_id == chat_id)
-        await database.execute(delete_messages)
-
-        # Delete the chat
-        del_chat = chats.delete().where(chats.c.id == chat_id)
-        result = await database.execute(del_chat)
-
-        if result:
+        # Delete all messages for this chat, including any still buffered
+        await message_writer.flush_chat(chat_id)
+        context_cache.invalidate(chat_id)
+        kv_cache.invalidate(chat_id)
+        if await store.delete_chat(chat_id):
             return ApiResponse(message="Chat deleted successfully")
         return ApiResponse(message="Chat not found")
 
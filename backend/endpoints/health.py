@@ -0,0 +1,105 @@
+from typing import List
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+from ai_service import ai_service, MODEL_READY
+from context_cache import context_cache
+from storage import store
+from metrics import Collected, metrics
+import config
+
+router = APIRouter()
+
+
+# -----------------------------
+# Liveness
+# -----------------------------
+@router.get("/healthz")
+async def healthz() -> dict:
+    """The process is up and serving requests."""
+    return {"status": "ok"}
+
+
+# -----------------------------
+# Readiness
+# -----------------------------
+@router.get("/readyz")
+async def readyz() -> JSONResponse:
+    """
+    Whether this instance should receive traffic.
+
+    Requires the database connection and, when DIALOGPT_WARMUP is enabled,
+    a loaded DialoGPT model; answers 503 until then.
+    """
+    checks = {
+        "database": store.is_connected,
+        "model": ai_service.model_state,
+    }
+    ready = store.is_connected and (
+        not config.DIALOGPT_WARMUP or ai_service.model_state == MODEL_READY
+    )
+    if ai_service.model_error:
+        checks["model_error"] = ai_service.model_error
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks}
+    )
+
+
+# -----------------------------
+# Cache statistics
+# -----------------------------
+@router.get("/stats")
+async def stats() -> dict:
+    """Hit rates and sizes of the in-process caches, and coalesced generations."""
+    return {
+        "response_cache": ai_service.response_cache.stats(),
+        "coalescing": ai_service.flights.stats(),
+        "context_cache": context_cache.stats(),
+        "kv_cache": ai_service.kv_cache.stats(),
+        "token_cache": ai_service.token_cache.stats(),
+    }
+
+
+# -----------------------------
+# Prometheus metrics
+# -----------------------------
+def collect_service_metrics() -> List[Collected]:
+    """Queue depths, backend load and cache counters, read at scrape time."""
+    caches = {
+        "response": ai_service.response_cache.stats(),
+        "context": context_cache.stats(),
+        "kv": ai_service.kv_cache.stats(),
+        "token": ai_service.token_cache.stats(),
+    }
+    backends = list(ai_service.backends)
+    flights = ai_service.flights.stats()
+    return [
+        ("inference_queue_depth", "gauge", "Prompts waiting for the DialoGPT inference worker",
+         [({}, ai_service.dialogpt_batcher.queue_depth)]),
+        ("backend_active_generations", "gauge", "Generations holding a backend slot",
+         [({"backend": b.name}, b.active) for b in backends]),
+        ("backend_waiting_requests", "gauge", "Requests waiting for a backend slot",
+         [({"backend": b.name}, b.waiting) for b in backends]),
+        ("cache_hits_total", "counter", "Cache lookups that found an entry",
+         [({"cache": name}, stats["hits"]) for name, stats in caches.items()]),
+        ("cache_misses_total", "counter", "Cache lookups that found nothing",
+         [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("cache_hit_ratio", "gauge", "Hits / lookups since startup",
+         [({"cache": name}, stats["hits"] / max(1, stats["hits"] + stats["misses"]))
+          for name, stats in caches.items()]),
+        ("cache_entries", "gauge", "Entries currently cached",
+         [({"cache": name}, stats["entries"]) for name, stats in caches.items()]),
+        ("generations_in_flight", "gauge", "Generations currently running",
+         [({}, flights["in_flight"])]),
+        ("generations_coalesced_total", "counter", "Requests that joined an identical running generation",
+         [({}, flights["coalesced"])]),
+    ]
+
+
+metrics.register_collector(collect_service_metrics)
+
+
+@router.get("/metrics")
+async def prometheus_metrics() -> PlainTextResponse:
+    """All metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,373 @@
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import queue
+import threading
+import time
+from kv_cache import CachedPrefix
+
+# torch is imported on first use so the API can start without the local-model stack
+if TYPE_CHECKING:
+    import torch
+
+
+def quantize_dynamic_int8(model: Any) -> Any:
+    """
+    Quantize ``model``'s linear layers to int8 for CPU inference.
+
+    GPT-2 style models (DialoGPT) implement their attention and MLP
+    projections as transformers' ``Conv1D``, which torch's dynamic quantization
+    does not recognise, so those are first swapped for equivalent
+    ``nn.Linear`` layers.
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight = torch.nn.Parameter(child.weight.detach().t().contiguous())
+                linear.bias = torch.nn.Parameter(child.bias.detach())
+                setattr(parent, name, linear)
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the local model already has too many prompts waiting."""
+
+
+class _RequestStreamer:
+    """
+    Decodes one row of a batch and hands finished text to its event loop.
+
+    Text is released word by word, like transformers' TextStreamer, so a
+    token that changes how the previous one decodes is never sent early.
+    """
+
+    def __init__(self, tokenizer: Any, loop: asyncio.AbstractEventLoop, tokens: asyncio.Queue):
+        self.tokenizer = tokenizer
+        self.loop = loop
+        self.tokens = tokens
+        self.next_tokens_are_prompt: bool = True
+        self.token_cache: List[int] = []
+        self.print_len: int = 0
+
+    def put(self, ids: "torch.Tensor") -> None:
+        if self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            return
+        self.token_cache.extend(ids.reshape(-1).tolist())
+        text = self.tokenizer.decode(self.token_cache, skip_special_tokens=True)
+        if text.endswith("\n"):
+            printable = text[self.print_len:]
+            self.token_cache = []
+            self.print_len = 0
+        else:
+            printable = text[self.print_len:text.rfind(" ") + 1]
+            self.print_len += len(printable)
+        self._send(printable)
+
+    def end(self) -> None:
+        if self.token_cache:
+            text = self.tokenizer.decode(self.token_cache, skip_special_tokens=True)
+            self._send(text[self.print_len:])
+            self.token_cache = []
+            self.print_len = 0
+        self.loop.call_soon_threadsafe(self.tokens.put_nowait, None)
+
+    def _send(self, text: str) -> None:
+        if text:
+            self.loop.call_soon_threadsafe(self.tokens.put_nowait, text)
+
+
+class _BatchStreamer:
+    """Fans the per-step tokens of a batched generate() out to each request."""
+
+    def __init__(self, streamers: List[_RequestStreamer], eos_token_id: int):
+        self.streamers = streamers
+        self.eos_token_id = eos_token_id
+        self.finished: List[bool] = [False] * len(streamers)
+
+    def put(self, value: "torch.Tensor") -> None:
+        if value.dim() == 1:
+            value = value.unsqueeze(-1)
+        for row, streamer in enumerate(self.streamers):
+            if self.finished[row]:
+                continue
+            ids = value[row:row + 1]
+            if not streamer.next_tokens_are_prompt and ids[0, -1].item() == self.eos_token_id:
+                # Rows that are done keep receiving padding until the whole batch stops
+                self.finished[row] = True
+                streamer.end()
+            else:
+                streamer.put(ids)
+
+    def end(self) -> None:
+        for row, streamer in enumerate(self.streamers):
+            if not self.finished[row]:
+                self.finished[row] = True
+                streamer.end()
+
+    def fail(self, error: Exception) -> None:
+        """Deliver ``error`` to every request that has not finished yet."""
+        for row, streamer in enumerate(self.streamers):
+            if not self.finished[row]:
+                self.finished[row] = True
+                streamer.loop.call_soon_threadsafe(streamer.tokens.put_nowait, error)
+
+
+class _PendingRequest:
+    """A tokenized prompt waiting for the inference worker."""
+
+    def __init__(
+        self,
+        input_ids: List[int],
+        loop: asyncio.AbstractEventLoop,
+        prefix: Optional[CachedPrefix] = None,
+        on_cache: Optional[Callable[[CachedPrefix], None]] = None
+    ):
+        self.input_ids = input_ids
+        self.loop = loop
+        # Keys/values already computed for the start of ``input_ids``
+        self.prefix = prefix
+        # Called on ``loop`` with the keys/values of prompt + reply
+        self.on_cache = on_cache
+        self.tokens: asyncio.Queue = asyncio.Queue()
+        # Set when the caller stops reading before the reply is complete
+        self.cancelled = threading.Event()
+
+
+class _CancelledRows:
+    """Stopping criterion that ends the rows whose caller went away."""
+
+    def __init__(self, batch: List[_PendingRequest]):
+        self.batch = batch
+
+    def __call__(self, input_ids: "torch.Tensor", scores: "torch.Tensor", **kwargs: Any) -> "torch.Tensor":
+        import torch
+
+        return torch.tensor(
+            [request.cancelled.is_set() for request in self.batch],
+            dtype=torch.bool, device=input_ids.device
+        )
+
+
+class DialoGPTBatcher:
+    """
+    Single inference worker that batches concurrent DialoGPT prompts.
+
+    Prompts submitted within ``max_wait_ms`` of each other (up to
+    ``max_batch_size``) are left-padded into one tensor and run through a
+    single ``generate`` call; each request still gets its own token stream.
+    At most ``max_queue_depth`` prompts may wait for the worker.
+
+    The worker runs on ``executor`` (a pool shared with other blocking model
+    work) and hands its thread back after ``idle_timeout_s`` without prompts;
+    the next prompt starts it again. Tokens reach the event loop through
+    ``call_soon_threadsafe``, so the loop never blocks on the model.
+    """
+
+    def __init__(
+        self,
+        load_model: Callable[[], Tuple[Any, Any]],
+        generation_kwargs: Dict[str, Any],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 20.0,
+        max_queue_depth: int = 64,
+        executor: Optional[ThreadPoolExecutor] = None,
+        idle_timeout_s: float = 1.0
+    ):
+        self.load_model = load_model
+        self.generation_kwargs = generation_kwargs
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_depth = max_queue_depth
+        self._pending: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue(maxsize=max_queue_depth)
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="dialogpt-batcher")
+        self.idle_timeout_s = idle_timeout_s
+        self._worker: Optional[Future] = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of prompts waiting for the worker."""
+        return self._pending.qsize()
+
+    def is_full(self) -> bool:
+        """True when a new prompt would be rejected."""
+        return self._pending.full()
+
+    def _ensure_worker(self) -> None:
+        with self._worker_lock:
+            if self._worker is None or self._worker.done():
+                self._worker = self.executor.submit(self._run)
+
+    async def generate(
+        self,
+        input_ids: List[int],
+        prefix: Optional[CachedPrefix] = None,
+        on_cache: Optional[Callable[[CachedPrefix], None]] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Queue a tokenized prompt and yield its decoded text as it is generated.
+
+        With ``prefix`` (keys/values for the start of ``input_ids``) only the
+        rest of the prompt is encoded. ``on_cache`` receives the keys/values of
+        the prompt plus reply once generation finishes, possibly after the
+        last token has been yielded.
+
+        If the caller stops iterating early (e.g. its client disconnected) the
+        prompt is dropped from the queue, or its row stops generating at the
+        next step.
+        """
+        request = _PendingRequest(input_ids, asyncio.get_running_loop(), prefix, on_cache)
+        try:
+            self._pending.put_nowait(request)
+        except queue.Full:
+            raise InferenceQueueFull("Local model queue is full, please retry shortly")
+        self._ensure_worker()
+
+        finished = False
+        try:
+            while True:
+                item = await request.tokens.get()
+                if item is None:
+                    finished = True
+                    return
+                if isinstance(item, Exception):
+                    finished = True
+                    raise item
+                yield item
+        finally:
+            if not finished:
+                request.cancelled.set()
+
+    def stop(self) -> None:
+        """Ask the worker to exit once the current batch is done."""
+        with self._worker_lock:
+            worker = self._worker
+            if worker is not None and not worker.done():
+                self._pending.put(None)
+        if worker is not None:
+            worker.result()
+        self._worker = None
+
+    def _collect_batch(self, first: _PendingRequest) -> Tuple[List[_PendingRequest], bool]:
+        """Gather prompts arriving within the wait window; also report a stop request."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._pending.get(timeout=remaining) if remaining > 0 else self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._pending.get(timeout=self.idle_timeout_s)
+            except queue.Empty:
+                with self._worker_lock:
+                    # A prompt queued just now finds no worker and starts one
+                    if self._pending.empty():
+                        self._worker = None
+                        return
+                continue
+            if first is None:
+                return
+            batch, stopping = self._collect_batch(first)
+            try:
+                self._generate_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    request.loop.call_soon_threadsafe(request.tokens.put_nowait, e)
+            if stopping:
+                return
+
+    def _generate_batch(self, batch: List[_PendingRequest]) -> None:
+        # Nobody is waiting for prompts cancelled while they were queued
+        batch = [request for request in batch if not request.cancelled.is_set()]
+        if not batch:
+            return
+        model, tokenizer = self.load_model()
+        # A cached prefix has its own length, so those requests cannot share
+        # padding with the rest; they are cheap to run one by one.
+        for request in batch:
+            if request.prefix is not None:
+                self._generate_rows(model, tokenizer, [request])
+        fresh = [request for request in batch if request.prefix is None]
+        if fresh:
+            self._generate_rows(model, tokenizer, fresh)
+
+    def _generate_rows(self, model: Any, tokenizer: Any, batch: List[_PendingRequest]) -> None:
+        import torch
+        from transformers import StoppingCriteriaList
+
+        pad_id: int = tokenizer.eos_token_id
+        width = max(len(request.input_ids) for request in batch)
+
+        # Left-pad so every prompt ends where generation starts
+        input_ids = torch.full((len(batch), width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, request in enumerate(batch):
+            length = len(request.input_ids)
+            input_ids[row, width - length:] = torch.tensor(request.input_ids, dtype=torch.long)
+            attention_mask[row, width - length:] = 1
+
+        kwargs = dict(self.generation_kwargs)
+        if batch[0].prefix is not None:
+            kwargs["past_key_values"] = batch[0].prefix.past_key_values
+        if any(request.on_cache is not None for request in batch):
+            kwargs["return_dict_in_generate"] = True
+
+        streamer = _BatchStreamer(
+            [_RequestStreamer(tokenizer, request.loop, request.tokens) for request in batch],
+            eos_token_id=pad_id
+        )
+        try:
+            with torch.inference_mode():
+                output = model.generate(
+                    input_ids=input_ids.to(model.device),
+                    attention_mask=attention_mask.to(model.device),
+                    pad_token_id=pad_id,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_CancelledRows(batch)]),
+                    **kwargs
+                )
+        except Exception as e:
+            streamer.fail(e)
+        else:
+            for row, request in enumerate(batch):
+                # A cut-off reply is not what the chat will hold; don't cache it
+                if request.on_cache is None or request.cancelled.is_set():
+                    continue
+                try:
+                    prefix = _row_prefix(output, row, width - len(request.input_ids), len(request.input_ids), pad_id)
+                except Exception as e:
+                    print(f"KV cache extraction error: {str(e)}")
+                    continue
+                request.loop.call_soon_threadsafe(request.on_cache, prefix)
+        streamer.end()
+
+
+def _row_prefix(output: Any, row: int, start: int, prompt_length: int, eos_token_id: int) -> CachedPrefix:
+    """Cut one row's prompt + reply and its keys/values out of a batched generate() result."""
+    token_ids: List[int] = output.sequences[row, start:].tolist()
+    reply = token_ids[prompt_length:]
+    if eos_token_id in reply:
+        # Everything after a row's end-of-sequence is padding
+        token_ids = token_ids[:prompt_length + reply.index(eos_token_id) + 1]
+    # generate() never feeds the last token back, so the cache is one shorter
+    end = start + len(token_ids) - 1
+    past_key_values = tuple(
+        tuple(tensor[row:row + 1, :, start:end].clone() for tensor in layer)
+        for layer in output.past_key_values
+    )
+    return CachedPrefix(token_ids, past_key_values)
@@ -0,0 +1,116 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import threading
+import config
+
+# (user, message) pairs, the same shape as a chat history entry
+Turn = Tuple[str, str]
+
+
+class CachedPrefix:
+    """
+    Attention keys/values DialoGPT computed for one conversation.
+
+    ``past_key_values`` covers every id in ``token_ids`` except the last, which
+    generate() feeds again when the conversation continues.
+    """
+
+    def __init__(self, token_ids: List[int], past_key_values: Any):
+        self.token_ids = token_ids
+        self.past_key_values = past_key_values
+        self.nbytes: int = sum(
+            tensor.numel() * tensor.element_size()
+            for layer in past_key_values
+            for tensor in layer
+        )
+
+
+class _CachedConversation:
+    def __init__(self, prefix: CachedPrefix, turns: List[Turn]):
+        self.prefix = prefix
+        # The chat messages ``prefix`` was built from, oldest first
+        self.turns = turns
+
+
+class KVCache:
+    """
+    Per-chat LRU cache of DialoGPT ``past_key_values``, bounded by entry count
+    and total bytes.
+
+    A follow-up turn takes its chat's entry, appends only the new user message
+    to the cached token ids and lets generate() skip the cached prefix. Entries
+    are taken, not shared, because generate() extends the cache in place; the
+    caller puts the extended prefix back when the turn finishes. Used from the
+    event loop and the inference thread, hence the lock.
+    """
+
+    def __init__(self, max_chats: int = 64, max_bytes: int = 512 * 1024 * 1024):
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _CachedConversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def take(self, chat_id: str, history: List[Turn]) -> Optional[Tuple[CachedPrefix, List[Turn]]]:
+        """
+        Remove and return the chat's prefix and turns if ``history`` (the
+        messages the caller would otherwise encode) is exactly what the prefix
+        covers: nothing was written to the chat behind the cache's back, and
+        the conversation has not outgrown the caller's window.
+        """
+        with self._lock:
+            entry = self._entries.pop(chat_id, None)
+            if entry is not None:
+                self.nbytes -= entry.prefix.nbytes
+            if entry is None or not history or entry.turns != history:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.prefix, entry.turns
+
+    def put(self, chat_id: str, prefix: CachedPrefix, turns: List[Turn]) -> None:
+        if prefix.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(chat_id, None)
+            if old is not None:
+                self.nbytes -= old.prefix.nbytes
+            self._entries[chat_id] = _CachedConversation(prefix, turns)
+            self.nbytes += prefix.nbytes
+            while len(self._entries) > self.max_chats or self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.prefix.nbytes
+                self.evictions += 1
+
+    def invalidate(self, chat_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(chat_id, None)
+            if entry is not None:
+                self.nbytes -= entry.prefix.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+# Global KV cache instance
+kv_cache = KVCache(
+    max_chats=config.DIALOGPT_KV_CACHE_MAX_CHATS,
+    max_bytes=config.DIALOGPT_KV_CACHE_MAX_BYTES
+)
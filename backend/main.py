@@ -1,20 +1,41 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from db import database
+from storage import store
+from message_writer import message_writer
+import config
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from endpoints.chat import router as chat_router
-import os
+from endpoints.chat import finish_pending_saves, router as chat_router
+from endpoints.health import router as health_router
+from ai_service import ai_service
 from pathlib import Path
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup code
-    await database.connect()
+    await store.connect()
+    profile = await store.configure()
+    if profile:
+        print(f"Database profile: {profile}")
+    if config.MIGRATE_ON_STARTUP:
+        await store.migrate()
+    if config.PROCESS_LOCAL_CHAT_STATE:
+        await message_writer.start()
+    else:
+        # Another worker may read the chat next; write each message straight away
+        print("Chat state shared across processes: context cache and write-behind buffer off")
+    if config.DIALOGPT_WARMUP:
+        # Loads on a worker thread; /readyz reports when it is done
+        ai_service.start_warmup()
     yield
     # Shutdown code
-    await database.disconnect()
+    # Replies cut off by a disconnect are still being saved; the writer and
+    # the store must outlive them
+    await finish_pending_saves()
+    await message_writer.stop()
+    await ai_service.aclose()
+    await store.disconnect()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -29,6 +50,7 @@ app.add_middleware(
 
 # Include API routes FIRST (before catch-all)
 app.include_router(chat_router)
+app.include_router(health_router)
 
 # Serve React build files in production
 frontend_build = Path(__file__).parent.parent / "chatbot-frontend" / "build"
@@ -59,7 +81,7 @@ if frontend_build.exists():
     @app.get("/{full_path:path}")
     async def serve_react(full_path: str):
         # Don't serve React for API routes
-        if full_path.startswith(("chat", "chats", "load_chat")):
+        if full_path.startswith(("chat", "chats", "load_chat", "healthz", "readyz", "stats", "metrics")):
             return {"error": "API endpoint not found"}
         
         index_file = frontend_build / "index.html"
@@ -0,0 +1,122 @@
+from typing import List, Optional
+import asyncio
+from models.chat import ChatMessage
+from storage import ChatStore, store
+import config
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat messages.
+
+    While running, ``write`` only appends to an in-memory buffer; a background
+    task flushes the buffer in one transaction whenever it reaches
+    ``batch_size`` messages or ``flush_interval_ms`` has passed, and once more
+    on shutdown. Each flush is one ``append_messages`` call on the store.
+    Readers call ``flush_chat`` first to see their own writes. When the writer
+    is not running (scripts, tests) messages are written immediately.
+    """
+
+    def __init__(
+        self,
+        store: ChatStore,
+        batch_size: int = 100,
+        flush_interval_ms: float = 50.0
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self._pending: List[ChatMessage] = []
+        self._in_flight: List[ChatMessage] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping: bool = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        """Messages buffered but not yet written."""
+        return len(self._pending)
+
+    async def start(self) -> None:
+        """Start the background flush task (called from the app lifespan)."""
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and write everything still buffered."""
+        if self._task is not None:
+            # Let a flush in progress finish; cancelling it mid-write could
+            # leave its batch neither stored nor buffered
+            self._stopping = True
+            self._wake.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+                self._stopping = False
+        await self.flush()
+
+    async def write(self, message: ChatMessage) -> None:
+        """Persist ``message``, buffered if the writer is running."""
+        if not self.running:
+            await self.store.append_messages([message])
+            return
+        self._pending.append(message)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    def has_pending(self, chat_id: str) -> bool:
+        return any(
+            message.chat_id == chat_id for message in self._pending + self._in_flight
+        )
+
+    async def flush_chat(self, chat_id: str) -> None:
+        """Read-your-writes: make sure buffered messages of ``chat_id`` are stored."""
+        if self.has_pending(chat_id):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all buffered messages now."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            self._in_flight = batch
+            try:
+                await self.store.append_messages(batch)
+            except BaseException:
+                # Not committed (the transaction rolls back, also when
+                # cancelled): keep the messages for the next attempt, in order
+                self._pending = batch + self._pending
+                raise
+            finally:
+                self._in_flight = []
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Message flush error: {str(e)}")
+
+# Global message writer instance
+message_writer = MessageWriter(
+    store,
+    batch_size=config.MESSAGE_WRITER_BATCH_SIZE,
+    flush_interval_ms=config.MESSAGE_WRITER_FLUSH_MS
+)
@@ -0,0 +1,263 @@
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+from contextlib import contextmanager
+import time
+
+# (metric name, type, help, [(label values, value)]) reported by a collector at scrape time
+Sample = Tuple[Dict[str, str], float]
+Collected = Tuple[str, str, str, List[Sample]]
+
+# Latency buckets in seconds, from sub-millisecond queries to slow generations
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    """A named metric with one child per combination of label values."""
+
+    kind: str = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            # Unlabelled metrics are reported (as zero) from the start
+            self.labels()
+
+    def labels(self, *values: str):
+        """
+        The child for these label values. Children are created once and kept,
+        so hot paths look one up and then only touch its counters.
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value: float = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing total."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increment the unlabelled counter."""
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down."""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts: List[int] = [0] * (len(bounds) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the seconds spent in the ``with`` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self) -> _Buckets:
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, values: Tuple[str, ...], child: _Buckets) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process metrics in the Prometheus text format.
+
+    Counters, gauges and histograms are updated in place by the code they
+    measure; collectors are called at scrape time for values that already
+    live elsewhere (queue depths, cache statistics), so those cost nothing
+    between scrapes.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], List[Collected]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def register_collector(self, collect: Callable[[], List[Collected]]) -> None:
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                collected = collect()
+            except Exception as e:
+                print(f"Metrics collector error: {str(e)}")
+                continue
+            for name, kind, help, samples in collected:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry and the metrics recorded on the hot paths
+metrics = MetricsRegistry()
+
+time_to_first_token = metrics.histogram(
+    "chat_time_to_first_token_seconds",
+    "Time from the start of a generation to its first token",
+    ["backend"]
+)
+generated_tokens = metrics.counter(
+    "chat_generated_tokens_total",
+    "Tokens (streamed chunks) generated, excluding cached replies",
+    ["backend"]
+)
+generation_seconds = metrics.counter(
+    "chat_generation_seconds_total",
+    "Wall time spent generating; tokens/sec = rate(tokens) / rate(seconds)",
+    ["backend"]
+)
+generation_errors = metrics.counter(
+    "chat_generation_errors_total",
+    "Generations that ended with an error reply or exception",
+    ["backend"]
+)
+db_query_seconds = metrics.histogram(
+    "db_query_seconds",
+    "Latency of database statements issued by the chat endpoints",
+    ["statement"]
+)
+sse_bytes_sent = metrics.counter(
+    "sse_bytes_sent_total",
+    "Bytes of Server-Sent Events written by /chat",
+    ["format"]
+)
+active_streams = metrics.gauge(
+    "chat_active_streams",
+    "/chat responses currently streaming"
+)
@@ -0,0 +1,169 @@
+from typing import List, NamedTuple, Optional
+from databases import Database
+from db import is_postgres, is_sqlite
+
+# pg_advisory_lock key held while migrating, so replicas and workers
+# starting together apply each migration once (any fixed number will do)
+POSTGRES_MIGRATION_LOCK = 4_801_205_517
+
+
+class Migration(NamedTuple):
+    """One schema change, applied in order and recorded in schema_migrations."""
+    version: int
+    description: str
+    statements: List[str]
+
+
+# Append new migrations to the end; never edit one that has shipped.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial schema", [
+        """CREATE TABLE IF NOT EXISTS chats (
+            id VARCHAR NOT NULL,
+            title VARCHAR NOT NULL,
+            PRIMARY KEY (id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER NOT NULL,
+            chat_id VARCHAR,
+            user VARCHAR NOT NULL,
+            message VARCHAR NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id),
+            FOREIGN KEY(chat_id) REFERENCES chats (id)
+        )""",
+    ]),
+    Migration(2, "index messages by (chat_id, timestamp)", [
+        "CREATE INDEX IF NOT EXISTS ix_messages_chat_id_timestamp ON messages (chat_id, timestamp)",
+    ]),
+    # SQLite cannot ADD COLUMN with a CURRENT_TIMESTAMP default, so rebuild chats
+    Migration(3, "add chats.created_at and chats.updated_at", [
+        """CREATE TABLE chats_new (
+            id VARCHAR NOT NULL,
+            title VARCHAR NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id)
+        )""",
+        """INSERT INTO chats_new (id, title, created_at, updated_at)
+        SELECT
+            c.id,
+            c.title,
+            COALESCE((SELECT MIN(m.timestamp) FROM messages m WHERE m.chat_id = c.id), CURRENT_TIMESTAMP),
+            COALESCE((SELECT MAX(m.timestamp) FROM messages m WHERE m.chat_id = c.id), CURRENT_TIMESTAMP)
+        FROM chats c""",
+        "DROP TABLE chats",
+        "ALTER TABLE chats_new RENAME TO chats",
+    ]),
+    # Keyset pagination compares stored timestamps as text, so every row must use
+    # SQLAlchemy's "YYYY-MM-DD HH:MM:SS.ffffff" format, including the defaults.
+    Migration(4, "index chats by (updated_at, id) for recency listing", [
+        """CREATE TABLE chats_new (
+            id VARCHAR NOT NULL,
+            title VARCHAR NOT NULL,
+            created_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f000', 'now')),
+            updated_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f000', 'now')),
+            PRIMARY KEY (id)
+        )""",
+        """INSERT INTO chats_new (id, title, created_at, updated_at)
+        SELECT
+            id,
+            title,
+            CASE WHEN length(created_at) = 19 THEN created_at || '.000000' ELSE created_at END,
+            CASE WHEN length(updated_at) = 19 THEN updated_at || '.000000' ELSE updated_at END
+        FROM chats""",
+        "DROP TABLE chats",
+        "ALTER TABLE chats_new RENAME TO chats",
+        "CREATE INDEX ix_chats_updated_at_id ON chats (updated_at, id)",
+    ]),
+    Migration(5, "index messages by (chat_id, id) for paged loading", [
+        "CREATE INDEX IF NOT EXISTS ix_messages_chat_id_id ON messages (chat_id, id)",
+    ]),
+    Migration(6, "add messages.truncated for replies cut off by a disconnect", [
+        "ALTER TABLE messages ADD COLUMN truncated BOOLEAN NOT NULL DEFAULT 0",
+    ]),
+]
+
+
+# PostgreSQL starts from the finished version-6 schema, with native types.
+# Every later migration is appended to both lists under the same version.
+POSTGRES_MIGRATIONS: List[Migration] = [
+    Migration(6, "initial schema", [
+        """CREATE TABLE IF NOT EXISTS chats (
+            id VARCHAR NOT NULL,
+            title VARCHAR NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            updated_at TIMESTAMPTZ DEFAULT now(),
+            PRIMARY KEY (id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_chats_updated_at_id ON chats (updated_at, id)",
+        """CREATE TABLE IF NOT EXISTS messages (
+            id BIGSERIAL NOT NULL,
+            chat_id VARCHAR,
+            "user" VARCHAR NOT NULL,
+            message VARCHAR NOT NULL,
+            timestamp TIMESTAMPTZ DEFAULT now(),
+            truncated BOOLEAN NOT NULL DEFAULT FALSE,
+            PRIMARY KEY (id),
+            FOREIGN KEY(chat_id) REFERENCES chats (id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_messages_chat_id_timestamp ON messages (chat_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_messages_chat_id_id ON messages (chat_id, id)",
+    ]),
+]
+
+
+def migrations_for(database: Database) -> List[Migration]:
+    """The migration history of ``database``'s dialect."""
+    return MIGRATIONS if is_sqlite(str(database.url)) else POSTGRES_MIGRATIONS
+
+
+async def get_schema_version(database: Database) -> int:
+    """Highest migration version applied to ``database`` (0 if none)."""
+    await database.execute(
+        """CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER NOT NULL,
+            description VARCHAR NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (version)
+        )"""
+    )
+    version = await database.fetch_val("SELECT MAX(version) FROM schema_migrations")
+    return version or 0
+
+
+async def run_migrations(database: Database, target: Optional[int] = None) -> int:
+    """
+    Upgrade ``database`` in place to ``target`` (default: latest version).
+
+    Each migration runs in its own transaction together with its
+    schema_migrations row, so a failed upgrade leaves the previous version.
+    On PostgreSQL the check-and-apply holds an advisory lock: a process
+    that starts while another is migrating waits, then finds the schema
+    current. Returns the resulting schema version.
+    """
+    if not is_postgres(str(database.url)):
+        return await _apply_migrations(database, target)
+    # The lock belongs to the session, so keep this task on one connection
+    async with database.connection():
+        await database.execute(f"SELECT pg_advisory_lock({POSTGRES_MIGRATION_LOCK})")
+        try:
+            return await _apply_migrations(database, target)
+        finally:
+            await database.execute(f"SELECT pg_advisory_unlock({POSTGRES_MIGRATION_LOCK})")
+
+
+async def _apply_migrations(database: Database, target: Optional[int]) -> int:
+    current = await get_schema_version(database)
+    for migration in migrations_for(database):
+        if migration.version <= current or (target is not None and migration.version > target):
+            continue
+        print(f"Applying migration {migration.version}: {migration.description}")
+        async with database.transaction():
+            for statement in migration.statements:
+                await database.execute(statement)
+            await database.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (:version, :description)",
+                values={"version": migration.version, "description": migration.description}
+            )
+        current = migration.version
+    return current
@@ -0,0 +1,256 @@
+"""
+Out-of-process DialoGPT inference for multi-worker deployments.
+
+``python -m model_workers`` loads the model once, then forks ``MODEL_WORKERS``
+processes that inherit it copy-on-write (inference never writes to the
+weights, so every worker reads the same physical pages). Each worker runs its
+own DialoGPTBatcher and serves prompts on a shared Unix socket, one prompt per
+connection, streaming the decoded text back as newline-delimited JSON:
+
+    -> {"input_ids": [...]}
+    <- {"text": "..."}           one per chunk
+    <- {"done": true}            or {"error": "...", "busy": bool}
+
+HTTP workers (uvicorn ``--workers N``) started with ``MODEL_WORKERS`` > 0 only
+load the tokenizer and send their prompts here through ModelWorkerClient.
+Closing the connection cancels the prompt.
+"""
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+import asyncio
+import gc
+import json
+import os
+import signal
+import socket
+from inference import DialoGPTBatcher, InferenceQueueFull
+from kv_cache import CachedPrefix
+import config
+
+# Longest request line a worker accepts (a prompt of ~1000 token ids is ~6 KB)
+MAX_REQUEST_BYTES = 1024 * 1024
+
+
+class ModelWorkersUnavailable(Exception):
+    """Raised when the model-worker socket cannot be reached."""
+
+
+class ModelWorkerClient:
+    """
+    Stands in for DialoGPTBatcher in HTTP workers: each prompt is sent to the
+    model-worker pool over its Unix socket and the reply streamed back.
+
+    Attention caches live in the worker that computed them, and a chat's next
+    turn may land on another worker, so ``prefix`` and ``on_cache`` are
+    accepted for interface compatibility and ignored (``input_ids`` always
+    holds the whole context).
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        generation_kwargs: Dict[str, Any],
+        max_in_flight: int = 64,
+        connect_timeout: float = 5.0
+    ):
+        self.socket_path = socket_path
+        # Applied by the workers; kept here for response-cache and coalescing keys
+        self.generation_kwargs = generation_kwargs
+        self.max_in_flight = max_in_flight
+        self.connect_timeout = connect_timeout
+        self._in_flight: int = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Prompts this process has sent to the workers and not finished reading."""
+        return self._in_flight
+
+    def is_full(self) -> bool:
+        return self._in_flight >= self.max_in_flight
+
+    async def generate(
+        self,
+        input_ids: List[int],
+        prefix: Optional[CachedPrefix] = None,
+        on_cache: Optional[Callable[[CachedPrefix], None]] = None
+    ) -> AsyncGenerator[str, None]:
+        """Send a tokenized prompt to the pool and yield its text as it arrives."""
+        if self.is_full():
+            raise InferenceQueueFull("Local model queue is full, please retry shortly")
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(self.socket_path), timeout=self.connect_timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ModelWorkersUnavailable(f"Model workers unavailable at {self.socket_path}: {str(e)}")
+
+        self._in_flight += 1
+        try:
+            writer.write(json.dumps({"input_ids": input_ids}).encode("utf-8") + b"\n")
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ModelWorkersUnavailable("Model worker closed the connection mid-reply")
+                message = json.loads(line)
+                if "text" in message:
+                    yield message["text"]
+                elif message.get("done"):
+                    return
+                elif message.get("busy"):
+                    raise InferenceQueueFull(message["error"])
+                else:
+                    raise RuntimeError(message.get("error", "Model worker error"))
+        finally:
+            # If the caller left early this tells the worker to stop the row
+            self._in_flight -= 1
+            writer.close()
+
+    def stop(self) -> None:
+        """Nothing runs in this process; the pool is stopped on its own."""
+
+
+# -----------------------------
+# Worker side
+# -----------------------------
+
+async def _send(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+    writer.write(json.dumps(message).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def handle_connection(
+    batcher: DialoGPTBatcher,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter
+) -> None:
+    """Serve one prompt; stop generating if the client hangs up first."""
+    try:
+        line = await reader.readline()
+        if not line:
+            return
+        input_ids: List[int] = json.loads(line)["input_ids"]
+
+        async def stream() -> None:
+            try:
+                async for text in batcher.generate(input_ids):
+                    await _send(writer, {"text": text})
+                await _send(writer, {"done": True})
+            except InferenceQueueFull as e:
+                await _send(writer, {"error": str(e), "busy": True})
+            except Exception as e:
+                await _send(writer, {"error": str(e), "busy": False})
+
+        replying = asyncio.create_task(stream())
+        # The client sends nothing after its prompt, so EOF means it left
+        hangup = asyncio.create_task(reader.read(1))
+        await asyncio.wait({replying, hangup}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (replying, hangup):
+            task.cancel()
+        await asyncio.gather(replying, hangup, return_exceptions=True)
+    except (ConnectionError, ValueError, KeyError) as e:
+        print(f"Model worker connection error: {str(e)}")
+    finally:
+        writer.close()
+
+
+async def serve(batcher: DialoGPTBatcher, sock: socket.socket) -> None:
+    """Accept prompts on an already bound and listening Unix socket until cancelled."""
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: handle_connection(batcher, reader, writer),
+        sock=sock,
+        limit=MAX_REQUEST_BYTES
+    )
+    async with server:
+        await server.serve_forever()
+
+
+def _worker_main(service: Any, sock: socket.socket, index: int, workers: int) -> None:
+    import torch
+
+    # Share the cores between the workers unless a count is configured
+    threads = service.torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(threads)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    print(f"Model worker {index} (pid {os.getpid()}) serving with {threads} torch threads")
+    try:
+        asyncio.run(serve(service.dialogpt_batcher, sock))
+    finally:
+        service.dialogpt_batcher.stop()
+
+
+def _spawn(service: Any, sock: socket.socket, index: int, workers: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _worker_main(service, sock, index, workers)
+        except BaseException as e:
+            if not isinstance(e, (KeyboardInterrupt, SystemExit)):
+                print(f"Model worker {index} failed: {str(e)}")
+                code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def run_pool(socket_path: str, workers: int, service: Any = None) -> None:
+    """
+    Load DialoGPT, fork ``workers`` processes serving ``socket_path``, and
+    supervise them, replacing any that exit. ``service`` (an AIService with
+    the model loaded) is built here unless given.
+    """
+    if service is None:
+        from ai_service import AIService
+
+        service = AIService(remote_inference=False)
+        # Loaded on this thread, before the fork: no executor thread has started
+        # yet, so the children inherit the weights and a batcher that is idle.
+        service._load_dialogpt_model()
+    # Keep the collector from touching (and so copying) the inherited objects
+    gc.freeze()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(socket_path)
+    sock.listen(1024)
+
+    children: Dict[int, int] = {}
+    for index in range(workers):
+        children[_spawn(service, sock, index, workers)] = index
+
+    stopping = False
+
+    def shutdown(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    print(f"Model worker pool: {workers} workers on {socket_path}")
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index = children.pop(pid, None)
+            if index is not None and not stopping:
+                print(f"Model worker {index} exited ({status}); restarting")
+                children[_spawn(service, sock, index, workers)] = index
+    finally:
+        sock.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    if config.MODEL_WORKERS < 1:
+        raise SystemExit("Set MODEL_WORKERS to the number of model-worker processes to run")
+    run_pool(config.MODEL_WORKER_SOCKET, config.MODEL_WORKERS)
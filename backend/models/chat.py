@@ -3,15 +3,18 @@ from typing import List, Optional
 from datetime import datetime
 
 class ChatMessage(BaseModel):
+    id: Optional[int] = None
     chat_id: Optional[str] = None
     user: str                 # "user" or "bot"
     message: str
     timestamp: datetime
+    truncated: bool = False   # reply cut short by a client disconnect
 
 class Chat(BaseModel):
     chat_id: str
     title: str
     messages: List[ChatMessage] = []
+    has_more: bool = False    # more messages exist beyond this page
 
 class HistoryMessage(BaseModel):
     """Single message for chat history context"""
@@ -22,7 +25,26 @@ class ChatSummary(BaseModel):
     """Chat list item"""
     id: str
     title: str
+    updated_at: Optional[datetime] = None
+
+class ChatPage(BaseModel):
+    """One page of the chat list, most recently active first"""
+    chats: List[ChatSummary]
+    next_cursor: Optional[str] = None
 
 class ApiResponse(BaseModel):
     """Generic API response"""
     message: str
+
+class StreamStart(BaseModel):
+    """First event of a delta-encoded /chat stream"""
+    chat_id: str
+    message_id: str
+
+class StreamEnd(BaseModel):
+    """Last event of a delta-encoded /chat stream"""
+    message_id: str
+    sha256: str               # hash of the final stored bot message
+    tokens: int
+    first_token_ms: Optional[float] = None
+    elapsed_ms: float
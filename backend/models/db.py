@@ -1,6 +1,7 @@
-from sqlalchemy import Table, Column, String, Integer, ForeignKey, DateTime, MetaData
-from sqlalchemy.sql import func
+from sqlalchemy import Table, Column, String, Integer, ForeignKey, DateTime, MetaData, Index, Boolean
+from sqlalchemy.sql import func, text
 
+# Keep in sync with migrations.py, which owns the actual schema.
 metadata = MetaData()
 
 # Chat table
@@ -9,6 +10,9 @@ chats = Table(
     metadata,
     Column("id", String, primary_key=True),
     Column("title", String, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_chats_updated_at_id", "updated_at", "id"),
 )
 
 # ChatMessage table
@@ -20,4 +24,8 @@ messages = Table(
     Column("user", String, nullable=False),
     Column("message", String, nullable=False),
     Column("timestamp", DateTime(timezone=True), server_default=func.now()),
+    # Bot reply cut short because the client disconnected mid-stream
+    Column("truncated", Boolean, nullable=False, server_default=text("0")),
+    Index("ix_messages_chat_id_timestamp", "chat_id", "timestamp"),
+    Index("ix_messages_chat_id_id", "chat_id", "id"),
 )
@@ -0,0 +1,94 @@
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import asyncio
+import os
+import time
+
+# The trace of the request being served, if it asked to be profiled. Tasks
+# started while handling the request (e.g. its generation) inherit it.
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+_NO_SPAN: ContextManager[None] = nullcontext()
+
+
+class Trace:
+    """
+    Span timeline of one request in the Chrome trace event format (load it in
+    chrome://tracing or https://ui.perfetto.dev). Each asyncio task gets its
+    own track.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._origin = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self._tracks: Dict[int, int] = {}
+
+    def _now_us(self) -> float:
+        return round((time.perf_counter() - self._origin) * 1_000_000, 1)
+
+    def _track(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task)
+        if key not in self._tracks:
+            self._tracks[key] = len(self._tracks) + 1
+            self.events.append({
+                "name": "thread_name", "ph": "M", "pid": 1, "tid": self._tracks[key],
+                "args": {"name": task.get_name() if task is not None else "main"},
+            })
+        return self._tracks[key]
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+        """Record the ``with`` block as a complete event; yields its (mutable) args."""
+        track = self._track()
+        started = self._now_us()
+        try:
+            yield args
+        finally:
+            self.events.append({
+                "name": name, "ph": "X", "pid": 1, "tid": track,
+                "ts": started, "dur": round(self._now_us() - started, 1), "args": args,
+            })
+
+    def instant(self, name: str, **args: Any) -> None:
+        """Record a point in time."""
+        self.events.append({
+            "name": name, "ph": "i", "s": "t", "pid": 1, "tid": self._track(),
+            "ts": self._now_us(), "args": args,
+        })
+
+    def to_chrome(self) -> Dict[str, Any]:
+        return {
+            "traceEvents": [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.name}}] + self.events,
+            "displayTimeUnit": "ms",
+        }
+
+    def write(self, directory: str, filename: str) -> str:
+        """Write the trace as JSON to ``directory``; returns the file path."""
+        import json
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        with open(path, "w") as f:
+            json.dump(self.to_chrome(), f)
+        return path
+
+
+def span(name: str, **args: Any) -> ContextManager[Any]:
+    """A span in the current request's trace; a shared no-op when not profiling."""
+    trace = current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return trace.span(name, **args)
+
+
+def instant(name: str, **args: Any) -> None:
+    """A point in time in the current request's trace, if profiling."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.instant(name, **args)
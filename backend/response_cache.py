@@ -0,0 +1,94 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import time
+import config
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share a cache entry."""
+    return " ".join(text.split())
+
+
+def response_key(
+    backend: str,
+    model: str,
+    api_key: Optional[str],
+    chat_history: List[Dict[str, str]],
+    prompt: str,
+    sampling_params: Dict[str, Any]
+) -> str:
+    """
+    Cache key for a generation: the backend and model, the caller's API key
+    (hashed; OpenAI replies are never shared across keys), the normalized
+    context window and prompt, and the sampling parameters.
+    """
+    payload = json.dumps({
+        "backend": backend,
+        "model": model,
+        "api_key": hashlib.sha256(api_key.encode("utf-8")).hexdigest() if api_key else None,
+        "history": [[msg["user"], normalize_text(msg["message"])] for msg in chat_history],
+        "prompt": normalize_text(prompt),
+        "sampling": sampling_params,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU cache of complete replies with a time-to-live.
+
+    Replies are stored as the token chunks they were streamed in, so a hit
+    replays exactly the same stream.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_s: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[str, ...]]]" = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.expired: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def get(self, key: str) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl_s:
+            del self._entries[key]
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(entry[1])
+
+    def put(self, key: str, tokens: List[str]) -> None:
+        self._entries[key] = (time.monotonic(), tuple(tokens))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# Global response cache instance
+response_cache = ResponseCache(
+    max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_s=config.RESPONSE_CACHE_TTL_S
+)
@@ -0,0 +1,22 @@
+#!/bin/bash
+# Production entrypoint: WEB_CONCURRENCY uvicorn workers, plus (with
+# MODEL_WORKERS > 0) the DialoGPT model-worker pool they send prompts to.
+
+# Migrate once up front; the uvicorn workers skip it (MIGRATE_ON_STARTUP=0)
+python create_tables.py || exit 1
+
+pids=()
+if (( ${MODEL_WORKERS:-0} > 0 )); then
+    python -m model_workers &
+    pids+=($!)
+fi
+
+MIGRATE_ON_STARTUP=0 uvicorn main:app --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-1}" &
+pids+=($!)
+
+trap 'kill -TERM "${pids[@]}" 2>/dev/null' TERM INT
+
+# When either side exits, stop the other
+wait -n
+kill -TERM "${pids[@]}" 2>/dev/null
+wait
@@ -0,0 +1,258 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import and_, or_, select
+from databases import Database
+from models.chat import Chat, ChatMessage, ChatSummary, HistoryMessage
+from models.db import chats, messages
+from db import configure_database, database, is_postgres, is_sqlite
+from migrations import run_migrations
+from metrics import db_query_seconds
+
+# Matches how SQLAlchemy stores DateTime values in SQLite
+SQLITE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+SQLITE_INSERT_MESSAGE = (
+    "INSERT INTO messages (chat_id, user, message, timestamp, truncated) VALUES (?, ?, ?, ?, ?)"
+)
+# "user" is a reserved word in PostgreSQL
+POSTGRES_INSERT_MESSAGE = (
+    'INSERT INTO messages (chat_id, "user", message, timestamp, truncated) VALUES ($1, $2, $3, $4, $5)'
+)
+
+
+class ChatStore(ABC):
+    """
+    Persistence of chats and their messages, as used by the chat endpoints.
+
+    Implementations own their connection pool and schema; callers never
+    issue queries themselves. Every statement is timed in db_query_seconds.
+    """
+
+    @property
+    @abstractmethod
+    def is_connected(self) -> bool:
+        """Whether connect() has opened the pool."""
+
+    @abstractmethod
+    async def connect(self) -> None:
+        """Open the connection pool."""
+
+    @abstractmethod
+    async def disconnect(self) -> None:
+        """Close the connection pool."""
+
+    async def configure(self) -> Dict[str, Any]:
+        """Apply database-wide settings; returns the effective profile for the startup log."""
+        return {}
+
+    @abstractmethod
+    async def migrate(self) -> int:
+        """Bring the schema up to date; returns its version."""
+
+    @abstractmethod
+    async def create_chat(self, chat_id: str, title: str, created_at: datetime) -> None:
+        """Insert an empty chat."""
+
+    @abstractmethod
+    async def append_messages(self, batch: List[ChatMessage]) -> None:
+        """Insert ``batch`` and bump each chat's updated_at, atomically."""
+
+    @abstractmethod
+    async def fetch_context(self, chat_id: str, limit: Optional[int]) -> List[HistoryMessage]:
+        """The chat's newest ``limit`` messages (all if None), oldest first."""
+
+    @abstractmethod
+    async def list_chats(self, limit: int, after: Optional[Tuple[datetime, str]] = None) -> List[ChatSummary]:
+        """Up to ``limit`` chats, most recently active first, starting past the ``after`` key."""
+
+    @abstractmethod
+    async def load_chat_page(
+        self,
+        chat_id: str,
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None
+    ) -> Optional[Chat]:
+        """One page of a chat's messages, oldest first (see /load_chat); None if no such chat."""
+
+    @abstractmethod
+    async def delete_chat(self, chat_id: str) -> bool:
+        """Delete a chat and its messages; False if it did not exist."""
+
+
+class SQLChatStore(ChatStore):
+    """ChatStore over a ``databases`` connection pool, with portable SQLAlchemy Core queries."""
+
+    def __init__(self, database: Database):
+        self.database = database
+
+    @property
+    def is_connected(self) -> bool:
+        return self.database.is_connected
+
+    async def connect(self) -> None:
+        await self.database.connect()
+
+    async def disconnect(self) -> None:
+        await self.database.disconnect()
+
+    async def migrate(self) -> int:
+        return await run_migrations(self.database)
+
+    async def create_chat(self, chat_id: str, title: str, created_at: datetime) -> None:
+        query = chats.insert().values(id=chat_id, title=title, created_at=created_at, updated_at=created_at)
+        with db_query_seconds.labels("insert_chat").time():
+            await self.database.execute(query)
+
+    async def append_messages(self, batch: List[ChatMessage]) -> None:
+        latest: Dict[str, datetime] = {}
+        for message in batch:
+            if message.chat_id not in latest or message.timestamp > latest[message.chat_id]:
+                latest[message.chat_id] = message.timestamp
+
+        # The whole transaction: every insert plus the chats updates
+        with db_query_seconds.labels("insert_messages").time():
+            async with self.database.connection() as connection:
+                async with connection.transaction():
+                    await self._insert_messages(connection, batch)
+                    for chat_id, timestamp in latest.items():
+                        await connection.execute(
+                            chats.update().where(chats.c.id == chat_id).values(updated_at=timestamp)
+                        )
+
+    async def _insert_messages(self, connection: Any, batch: List[ChatMessage]) -> None:
+        await connection.execute_many(messages.insert(), values=[
+            {"chat_id": m.chat_id, "user": m.user, "message": m.message,
+             "timestamp": m.timestamp, "truncated": m.truncated}
+            for m in batch
+        ])
+
+    async def fetch_context(self, chat_id: str, limit: Optional[int]) -> List[HistoryMessage]:
+        # Newest rows first, so only the window is read; reversed below
+        query = messages.select().where(
+            messages.c.chat_id == chat_id
+        ).order_by(messages.c.timestamp.desc(), messages.c.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        with db_query_seconds.labels("select_history").time():
+            rows = await self.database.fetch_all(query)
+        return [HistoryMessage(user=row["user"], message=row["message"]) for row in reversed(rows)]
+
+    async def list_chats(self, limit: int, after: Optional[Tuple[datetime, str]] = None) -> List[ChatSummary]:
+        query = chats.select().order_by(chats.c.updated_at.desc(), chats.c.id.desc())
+        if after is not None:
+            updated_at, chat_id = after
+            query = query.where(or_(
+                chats.c.updated_at < updated_at,
+                and_(chats.c.updated_at == updated_at, chats.c.id < chat_id)
+            ))
+        with db_query_seconds.labels("select_chats_page").time():
+            rows = await self.database.fetch_all(query.limit(limit))
+        return [ChatSummary(id=row["id"], title=row["title"], updated_at=row["updated_at"]) for row in rows]
+
+    async def load_chat_page(
+        self,
+        chat_id: str,
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None
+    ) -> Optional[Chat]:
+        with db_query_seconds.labels("select_chat").time():
+            chat = await self.database.fetch_one(chats.select().where(chats.c.id == chat_id))
+        if not chat:
+            return None
+
+        query = messages.select().where(messages.c.chat_id == chat_id)
+        if before_id is not None:
+            query = query.where(messages.c.id < before_id)
+        if after_id is not None:
+            query = query.where(messages.c.id > after_id)
+
+        # Catching up reads forwards from after_id; everything else reads back from the newest
+        newest_first = after_id is None
+        query = query.order_by(messages.c.id.desc() if newest_first else messages.c.id)
+        if limit is not None:
+            # Fetch one extra row to learn whether another page exists
+            query = query.limit(limit + 1)
+        with db_query_seconds.labels("select_messages_page").time():
+            rows = await self.database.fetch_all(query)
+
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        if newest_first:
+            rows = list(reversed(rows))
+        return Chat(
+            chat_id=chat["id"],
+            title=chat["title"],
+            messages=[
+                ChatMessage(
+                    id=m["id"],
+                    user=m["user"],
+                    message=m["message"],
+                    timestamp=m["timestamp"],
+                    chat_id=m["chat_id"],
+                    truncated=m["truncated"]
+                )
+                for m in rows
+            ],
+            has_more=has_more
+        )
+
+    async def delete_chat(self, chat_id: str) -> bool:
+        # execute() reports no row count portably, so look the chat up first
+        async with self.database.transaction():
+            with db_query_seconds.labels("select_chat").time():
+                exists = await self.database.fetch_val(select([chats.c.id]).where(chats.c.id == chat_id))
+            with db_query_seconds.labels("delete_messages").time():
+                await self.database.execute(messages.delete().where(messages.c.chat_id == chat_id))
+            with db_query_seconds.labels("delete_chat").time():
+                await self.database.execute(chats.delete().where(chats.c.id == chat_id))
+        return exists is not None
+
+
+class SQLiteStore(SQLChatStore):
+    """The default single-node store: one SQLite file in WAL mode."""
+
+    async def configure(self) -> Dict[str, Any]:
+        return await configure_database(self.database)
+
+    async def _insert_messages(self, connection: Any, batch: List[ChatMessage]) -> None:
+        # One executemany call instead of a thread hop per row
+        await connection.raw_connection.executemany(SQLITE_INSERT_MESSAGE, [
+            (m.chat_id, m.user, m.message, m.timestamp.strftime(SQLITE_TIMESTAMP_FORMAT), m.truncated)
+            for m in batch
+        ])
+
+
+class PostgresStore(SQLChatStore):
+    """
+    Store shared by any number of backend replicas, on an asyncpg connection
+    pool (sized and tuned by the POSTGRES_POOL_* settings in db.py).
+    """
+
+    async def configure(self) -> Dict[str, Any]:
+        return {
+            "server_version": await self.database.fetch_val("SHOW server_version"),
+            "max_connections": await self.database.fetch_val("SHOW max_connections"),
+        }
+
+    async def _insert_messages(self, connection: Any, batch: List[ChatMessage]) -> None:
+        # asyncpg prepares the insert once and pipelines every row in one round trip
+        await connection.raw_connection.executemany(POSTGRES_INSERT_MESSAGE, [
+            (m.chat_id, m.user, m.message, m.timestamp, m.truncated)
+            for m in batch
+        ])
+
+
+def create_store(database: Database) -> ChatStore:
+    """The store implementation for ``database``'s URL."""
+    url = str(database.url)
+    if is_sqlite(url):
+        return SQLiteStore(database)
+    if is_postgres(url):
+        return PostgresStore(database)
+    return SQLChatStore(database)
+
+
+# Global store, over the database configured by DATABASE_URL
+store: ChatStore = create_store(database)
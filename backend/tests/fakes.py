@@ -0,0 +1,53 @@
+"""Stand-in tokenizer and models for DialoGPTBatcher tests."""
+import threading
+import time
+import torch
+from typing import List
+
+EOS = 0
+
+
+class FakeTokenizer:
+    """Decodes id ``n`` as the word ``wn``; id 0 is end-of-sequence."""
+    eos_token_id = EOS
+
+    def decode(self, ids: List[int], skip_special_tokens: bool = True, **kwargs) -> str:
+        return " ".join(f"w{i}" for i in ids if i != EOS)
+
+
+class FakeModel:
+    """Replies to each row with (prompt[-1] * 10 + step) for three steps, then EOS."""
+    device = torch.device("cpu")
+
+    def __init__(self, release: threading.Event = None):
+        self.calls: List[dict] = []
+        self.release = release
+
+    def generate(self, input_ids, attention_mask, pad_token_id, streamer, **kwargs):
+        self.calls.append({"input_ids": input_ids.clone(), "attention_mask": attention_mask.clone()})
+        if self.release is not None:
+            self.release.wait()
+        streamer.put(input_ids)
+        last = input_ids[:, -1]
+        for step in range(1, 4):
+            streamer.put(last * 10 + step)
+        streamer.put(torch.full_like(last, EOS))
+        streamer.end()
+
+
+class EndlessModel:
+    """Emits one token per step until its stopping criteria end every row (or 200 steps)."""
+    device = torch.device("cpu")
+
+    def __init__(self):
+        self.steps = 0
+
+    def generate(self, input_ids, attention_mask, pad_token_id, streamer, stopping_criteria, **kwargs):
+        streamer.put(input_ids)
+        done = torch.zeros(len(input_ids), dtype=torch.bool)
+        while not done.all() and self.steps < 200:
+            self.steps += 1
+            streamer.put(torch.where(done, pad_token_id, self.steps))
+            done |= stopping_criteria(input_ids, None)
+            time.sleep(0.005)
+        streamer.end()
@@ -1,9 +1,40 @@
+import asyncio
+import json
+import socket
+import threading
+import time
 import pytest
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from unittest.mock import MagicMock, AsyncMock, patch
-from ai_service import AIService
+from ai_service import AIService, OpenAIClientPool
 from typing import List, Dict
 
 
+class async_iter:
+    """Async iterator over ``items`` (stands in for an OpenAI AsyncStream)."""
+
+    def __init__(self, items, then_wait: bool = False):
+        self.items = list(items)
+        # Hang after the last item, like a reply that is still being generated
+        self.then_wait = then_wait
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.items:
+            return self.items.pop(0)
+        if self.then_wait:
+            await asyncio.Event().wait()
+        raise StopAsyncIteration
+
+    async def close(self):
+        self.closed = True
+
+
 @pytest.fixture
 def ai_service():
     """Create AIService instance for testing."""
@@ -30,7 +61,7 @@ async def test_generate_response_without_api_key(ai_service):
 
 
 @pytest.mark.asyncio
-@patch('ai_service.OpenAI')
+@patch('ai_service.AsyncOpenAI')
 async def test_generate_response_with_api_key(mock_openai, ai_service):
     """Test that OpenAI is used when API key is provided."""
     # Mock OpenAI client
@@ -50,9 +81,9 @@ async def test_generate_response_with_api_key(mock_openai, ai_service):
     mock_chunk3.choices = [MagicMock()]
     mock_chunk3.choices[0].delta.content = None
     
-    mock_client.chat.completions.create.return_value = iter([
+    mock_client.chat.completions.create = AsyncMock(return_value=async_iter([
         mock_chunk1, mock_chunk2, mock_chunk3
-    ])
+    ]))
     
     prompt = "Hello"
     api_key = "sk-test123"
@@ -67,7 +98,8 @@ async def test_generate_response_with_api_key(mock_openai, ai_service):
         tokens.append(token)
     
     # Verify OpenAI was called
-    mock_openai.assert_called_once_with(api_key=api_key)
+    mock_openai.assert_called_once()
+    assert mock_openai.call_args.kwargs["api_key"] == api_key
     assert tokens == ["Hello", " there!"]
 
 
@@ -93,7 +125,7 @@ async def test_generate_response_with_chat_history(ai_service):
 
 
 @pytest.mark.asyncio
-@patch('ai_service.OpenAI')
+@patch('ai_service.AsyncOpenAI')
 async def test_openai_error_handling(mock_openai, ai_service):
     """Test that OpenAI errors are handled gracefully."""
     mock_client = MagicMock()
@@ -101,7 +133,7 @@ async def test_openai_error_handling(mock_openai, ai_service):
     
     # Simulate OpenAI error
     from openai import OpenAIError
-    mock_client.chat.completions.create.side_effect = OpenAIError("API Error")
+    mock_client.chat.completions.create = AsyncMock(side_effect=OpenAIError("API Error"))
     
     tokens: List[str] = []
     async for token in ai_service.generate_response(
@@ -150,7 +182,7 @@ def test_ai_service_initialization():
 
 
 @pytest.mark.asyncio
-@patch('ai_service.OpenAI')
+@patch('ai_service.AsyncOpenAI')
 async def test_no_duplicate_user_message_in_history(mock_openai, ai_service):
     """Regression test: Ensure user message doesn't appear twice in history."""
     mock_client = MagicMock()
@@ -159,13 +191,13 @@ async def test_no_duplicate_user_message_in_history(mock_openai, ai_service):
     # Track the messages sent to OpenAI
     captured_messages = None
     
-    def capture_messages(**kwargs):
+    async def capture_messages(**kwargs):
         nonlocal captured_messages
         captured_messages = kwargs.get('messages', [])
         # Return empty iterator
-        return iter([])
+        return async_iter([])
     
-    mock_client.chat.completions.create.side_effect = capture_messages
+    mock_client.chat.completions.create = capture_messages
     
     prompt = "What is 2+2?"
     chat_history: List[Dict[str, str]] = [
@@ -192,3 +224,136 @@ async def test_no_duplicate_user_message_in_history(mock_openai, ai_service):
     
     # Ensure "What is 2+2?" appears only once
     assert user_messages.count("What is 2+2?") == 1
+
+
+@pytest.mark.asyncio
+@patch('ai_service.AsyncOpenAI')
+async def test_openai_client_reused_per_api_key(mock_openai, ai_service):
+    """Requests with the same API key share one pooled client."""
+    mock_openai.return_value.chat.completions.create = AsyncMock(
+        side_effect=lambda **kwargs: async_iter([])
+    )
+
+    for api_key in ["sk-a", "sk-a", "sk-b", "sk-a"]:
+        async for _ in ai_service.generate_response(prompt="hi", api_key=api_key):
+            pass
+
+    assert mock_openai.call_count == 2
+    assert len(ai_service.openai_clients) == 2
+
+
+@pytest.mark.asyncio
+@patch('ai_service.AsyncOpenAI')
+async def test_openai_client_pool_evicts_lru(mock_openai):
+    """The least recently used idle client is closed when the pool is full."""
+    clients = []
+
+    def make_client(**kwargs):
+        client = MagicMock()
+        client.close = AsyncMock()
+        clients.append(client)
+        return client
+
+    mock_openai.side_effect = make_client
+    pool = OpenAIClientPool(max_clients=2)
+
+    for api_key in ["sk-a", "sk-b", "sk-a", "sk-c"]:
+        async with pool.client(api_key):
+            pass
+
+    assert len(pool) == 2
+    clients[0].close.assert_not_awaited()   # sk-a was used recently
+    clients[1].close.assert_awaited_once()  # sk-b was least recently used
+    await pool.aclose()
+    clients[0].close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@patch('ai_service.AsyncOpenAI')
+async def test_openai_stream_closed_when_reader_leaves(mock_openai, ai_service):
+    """Abandoning a reply mid-stream closes the upstream OpenAI stream."""
+    chunk = MagicMock()
+    chunk.choices = [MagicMock()]
+    chunk.choices[0].delta.content = "Hello"
+    stream = async_iter([chunk], then_wait=True)
+    mock_openai.return_value.chat.completions.create = AsyncMock(return_value=stream)
+
+    tokens = ai_service.generate_response(prompt="hi", api_key="sk-test")
+    assert await tokens.__anext__() == "Hello"
+    await tokens.aclose()
+
+    for _ in range(100):
+        if stream.closed:
+            break
+        await asyncio.sleep(0.01)
+    assert stream.closed
+    assert len(ai_service.flights) == 0
+
+
+def stand_in_openai_app(token_delay: float) -> FastAPI:
+    """Minimal OpenAI-compatible server streaming one chunk per word."""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def completions(body: dict):
+        words = body["messages"][-1]["content"].split()
+
+        async def chunks():
+            for word in words:
+                await asyncio.sleep(token_delay)
+                chunk = {
+                    "id": "chatcmpl-test",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+@pytest.fixture
+def stand_in_openai_server():
+    """Run the stand-in server on a free local port for one test."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(
+        stand_in_openai_app(token_delay=0.05), host="127.0.0.1", port=port, log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_openai_streams_interleave(stand_in_openai_server):
+    """Two slow completions stream side by side instead of one after the other."""
+    service = AIService()
+    service.openai_clients = OpenAIClientPool(base_url=stand_in_openai_server)
+    arrivals: List[str] = []
+
+    async def consume(prompt: str, api_key: str) -> None:
+        async for token in service.generate_response(prompt=prompt, api_key=api_key):
+            arrivals.append(token)
+
+    await asyncio.gather(
+        consume("a1 a2 a3 a4 a5", "sk-a"),
+        consume("b1 b2 b3 b4 b5", "sk-b"),
+    )
+    await service.aclose()
+
+    assert sorted(arrivals) == sorted(["a1", "a2", "a3", "a4", "a5", "b1", "b2", "b3", "b4", "b5"])
+    # A blocking client would deliver all of one stream before the other
+    first_b = next(i for i, token in enumerate(arrivals) if token.startswith("b"))
+    last_a = max(i for i, token in enumerate(arrivals) if token.startswith("a"))
+    assert first_b < last_a
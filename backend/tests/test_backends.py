@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from ai_service import AIService, DialoGPTBackend, OpenAIBackend
+from backends import BackendBusy, BackendRegistry, EchoBackend, ModelBackend
+
+
+class BlockingBackend(ModelBackend):
+    """Yields one token, then waits until ``release`` is set."""
+    name = "blocking"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = asyncio.Event()
+
+    def handles(self, model, api_key):
+        return model == self.name
+
+    async def stream(self, prompt, chat_history, api_key, model, chat_id):
+        yield "started"
+        await self.release.wait()
+        yield "done"
+
+
+async def collect(backend: ModelBackend, prompt: str = "hi"):
+    return [token async for token in backend.generate(prompt, [])]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped_per_backend():
+    backend = BlockingBackend(max_concurrency=2, queue_timeout=5)
+    tasks = [asyncio.create_task(collect(backend)) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    assert backend.active == 2
+    assert backend.waiting == 1
+
+    backend.release.set()
+    assert await asyncio.gather(*tasks) == [["started", "done"]] * 3
+    assert backend.active == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_raises_backend_busy():
+    backend = BlockingBackend(max_concurrency=1, queue_timeout=0.05)
+    first = asyncio.create_task(collect(backend))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(BackendBusy):
+        await collect(backend)
+    assert backend.waiting == 0
+
+    backend.release.set()
+    await first
+
+
+@pytest.mark.asyncio
+async def test_saturated_backend_does_not_block_another():
+    local = BlockingBackend(max_concurrency=1, queue_timeout=5)
+    echo = EchoBackend(max_concurrency=1, queue_timeout=0.5)
+    blocked = asyncio.create_task(collect(local))
+    await asyncio.sleep(0.01)
+
+    assert await collect(echo, "hello world") == ["Echo:", " hello", " world"]
+
+    local.release.set()
+    await blocked
+
+
+def test_resolution_order():
+    with patch("config.ECHO_BACKEND_ENABLED", True):
+        service = AIService()
+
+    assert isinstance(service.backend(None, "gpt-3.5-turbo"), DialoGPTBackend)
+    assert isinstance(service.backend("sk-test", "gpt-3.5-turbo"), OpenAIBackend)
+    assert isinstance(service.backend("sk-test", "dialogpt"), DialoGPTBackend)
+    assert isinstance(service.backend("sk-test", "microsoft/DialoGPT-medium"), DialoGPTBackend)
+    assert isinstance(service.backend("sk-test", "echo"), EchoBackend)
+    assert service.context_window(None, "echo") == EchoBackend.context_window
+
+
+def test_echo_backend_is_off_by_default():
+    with patch("config.ECHO_BACKEND_ENABLED", False):
+        service = AIService()
+    assert isinstance(service.backend(None, "echo"), DialoGPTBackend)
+
+
+def test_registry_without_match_raises():
+    registry = BackendRegistry()
+    registry.register(EchoBackend())
+    with pytest.raises(LookupError):
+        registry.resolve("gpt-4")
+
+
+def test_backend_must_implement_handles_and_stream():
+    class Incomplete(ModelBackend):
+        def handles(self, model, api_key):
+            return True
+
+    with pytest.raises(TypeError, match="stream"):
+        Incomplete()
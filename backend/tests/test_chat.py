@@ -1,29 +1,52 @@
+import asyncio
+import hashlib
+import threading
+import time
 import pytest
+import torch
 import pytest_asyncio
-from httpx import AsyncClient, ASGITransport
-from main import app
-from db import database
+from unittest.mock import AsyncMock, patch
+from ai_service import ai_service
+from backends import BackendRegistry, EchoBackend
+from inference import DialoGPTBatcher
+from token_cache import TokenCache
+from databases import Database
+from db import database_options
+import endpoints.chat
+from endpoints.chat import get_chat_history
+from migrations import run_migrations
+from message_writer import message_writer
+from context_cache import context_cache
 from models.db import chats, messages
+from storage import create_store
 from datetime import datetime
+import config
+from tests.conftest import parse_sse, require_postgres
 
 
-@pytest_asyncio.fixture(scope="function")
-async def async_client():
-    await database.connect()
-    transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url="http://test") as client:
-        yield client
-    await database.disconnect()
+async def fake_generate_response(prompt, chat_history=None, api_key=None, model="gpt-3.5-turbo", chat_id=None):
+    """Deterministic stand-in for AIService.generate_response."""
+    for token in ["Hello", " there", "!"]:
+        yield token
 
 
-@pytest_asyncio.fixture(autouse=True)
-async def clean_database():
+@pytest_asyncio.fixture(autouse=True, params=["sqlite", "postgres"])
+async def database(request, tmp_path):
+    """The endpoints' database, emptied: a fresh SQLite file, or TEST_POSTGRES_URL."""
+    url = f"sqlite:///{tmp_path / 'chat.db'}" if request.param == "sqlite" else require_postgres()
+    chat_store = create_store(Database(url, **database_options(url)))
+    database = chat_store.database
     await database.connect()
+    await chat_store.configure()
+    await run_migrations(database)
     await database.execute(messages.delete())
     await database.execute(chats.delete())
-    yield
+    context_cache.clear()
+    with patch("endpoints.chat.store", chat_store), patch.object(message_writer, "store", chat_store):
+        yield database
     await database.execute(messages.delete())
     await database.execute(chats.delete())
+    await database.disconnect()
 
 
 class TestChatEndpoints:
@@ -31,25 +54,74 @@ class TestChatEndpoints:
     async def test_list_chats_empty(self, async_client):
         response = await async_client.get("/chats")
         assert response.status_code == 200
-        assert response.json() == []
+        assert response.json() == {"chats": [], "next_cursor": None}
 
     @pytest.mark.asyncio
-    async def test_list_chats_with_data(self, async_client):
+    async def test_list_chats_with_data(self, async_client, database):
         await database.execute(
-            chats.insert().values(id="test-chat-1", title="Test Chat 1")
+            chats.insert().values(id="test-chat-1", title="Test Chat 1",
+                                  updated_at=datetime(2024, 1, 1, 0, 0, 0))
         )
         await database.execute(
-            chats.insert().values(id="test-chat-2", title="Test Chat 2")
+            chats.insert().values(id="test-chat-2", title="Test Chat 2",
+                                  updated_at=datetime(2024, 1, 2, 0, 0, 0))
         )
         
         response = await async_client.get("/chats")
         assert response.status_code == 200
-        data = response.json()
+        data = response.json()["chats"]
         assert len(data) == 2
-        assert data[0]["id"] == "test-chat-1"
-        assert data[0]["title"] == "Test Chat 1"
-        assert data[1]["id"] == "test-chat-2"
-        assert data[1]["title"] == "Test Chat 2"
+        # Most recently active first
+        assert data[0]["id"] == "test-chat-2"
+        assert data[0]["title"] == "Test Chat 2"
+        assert data[1]["id"] == "test-chat-1"
+        assert data[1]["title"] == "Test Chat 1"
+
+    @pytest.mark.asyncio
+    async def test_list_chats_paginates_with_cursor(self, async_client, database):
+        for i in range(5):
+            await database.execute(
+                chats.insert().values(id=f"chat-{i}", title=f"Chat {i}",
+                                      updated_at=datetime(2024, 1, 1, 0, 0, i % 3))
+            )
+        # Rows without an explicit timestamp use the column default
+        await database.execute(chats.insert().values(id="chat-default", title="Default"))
+
+        seen = []
+        cursor = None
+        while True:
+            url = "/chats?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            page = (await async_client.get(url)).json()
+            assert len(page["chats"]) <= 2
+            seen.extend(chat["id"] for chat in page["chats"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        # Ties on updated_at are broken by id, so nothing repeats or goes missing
+        assert seen == ["chat-default", "chat-2", "chat-4", "chat-1", "chat-3", "chat-0"]
+
+    @pytest.mark.asyncio
+    async def test_list_chats_rejects_bad_cursor(self, async_client):
+        response = await async_client.get("/chats?cursor=not-a-cursor")
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    @patch("endpoints.chat.ai_service.generate_response", fake_generate_response)
+    async def test_chat_moves_chat_to_top_of_list(self, async_client, database):
+        for chat_id in ["older", "newer"]:
+            await database.execute(
+                chats.insert().values(id=chat_id, title=chat_id,
+                                      updated_at=datetime(2024, 1, 1))
+            )
+        await database.execute(chats.update().where(chats.c.id == "newer").values(
+            updated_at=datetime(2024, 1, 2)
+        ))
+
+        await async_client.get("/chat?prompt=Hi&chat_id=older")
+
+        data = (await async_client.get("/chats")).json()["chats"]
+        assert [chat["id"] for chat in data] == ["older", "newer"]
 
     @pytest.mark.asyncio
     async def test_load_chat_not_found(self, async_client):
@@ -58,7 +130,7 @@ class TestChatEndpoints:
         assert response.json()["detail"] == "Chat not found"
 
     @pytest.mark.asyncio
-    async def test_load_chat_with_messages(self, async_client):
+    async def test_load_chat_with_messages(self, async_client, database):
         chat_id = "test-chat-load"
         await database.execute(
             chats.insert().values(id=chat_id, title="Test Chat")
@@ -92,7 +164,55 @@ class TestChatEndpoints:
         assert data["messages"][1]["message"] == "Hi there!"
 
     @pytest.mark.asyncio
-    async def test_load_chat_empty_messages(self, async_client):
+    async def test_load_chat_pages_backwards_by_id(self, async_client, database):
+        chat_id = "test-chat-pages"
+        await database.execute(chats.insert().values(id=chat_id, title="Pages"))
+        for i in range(7):
+            await database.execute(
+                messages.insert().values(
+                    chat_id=chat_id, user="user", message=f"Message {i}",
+                    timestamp=datetime(2024, 1, 1, 0, 0, i)
+                )
+            )
+
+        newest = (await async_client.get(f"/load_chat/{chat_id}?limit=3")).json()
+        assert [m["message"] for m in newest["messages"]] == ["Message 4", "Message 5", "Message 6"]
+        assert newest["has_more"] is True
+
+        before_id = newest["messages"][0]["id"]
+        older = (await async_client.get(f"/load_chat/{chat_id}?limit=3&before_id={before_id}")).json()
+        assert [m["message"] for m in older["messages"]] == ["Message 1", "Message 2", "Message 3"]
+        assert older["has_more"] is True
+
+        before_id = older["messages"][0]["id"]
+        oldest = (await async_client.get(f"/load_chat/{chat_id}?limit=3&before_id={before_id}")).json()
+        assert [m["message"] for m in oldest["messages"]] == ["Message 0"]
+        assert oldest["has_more"] is False
+
+    @pytest.mark.asyncio
+    async def test_load_chat_since_message_id(self, async_client, database):
+        chat_id = "test-chat-since"
+        await database.execute(chats.insert().values(id=chat_id, title="Since"))
+        for i in range(5):
+            await database.execute(
+                messages.insert().values(
+                    chat_id=chat_id, user="bot", message=f"Message {i}",
+                    timestamp=datetime(2024, 1, 1, 0, 0, i)
+                )
+            )
+        full = (await async_client.get(f"/load_chat/{chat_id}")).json()
+        seen_id = full["messages"][1]["id"]
+
+        missed = (await async_client.get(f"/load_chat/{chat_id}?after_id={seen_id}")).json()
+        assert [m["message"] for m in missed["messages"]] == ["Message 2", "Message 3", "Message 4"]
+        assert missed["has_more"] is False
+
+        first = (await async_client.get(f"/load_chat/{chat_id}?after_id={seen_id}&limit=2")).json()
+        assert [m["message"] for m in first["messages"]] == ["Message 2", "Message 3"]
+        assert first["has_more"] is True
+
+    @pytest.mark.asyncio
+    async def test_load_chat_empty_messages(self, async_client, database):
         chat_id = "test-chat-empty"
         await database.execute(
             chats.insert().values(id=chat_id, title="Empty Chat")
@@ -106,7 +226,7 @@ class TestChatEndpoints:
         assert data["messages"] == []
 
     @pytest.mark.asyncio
-    async def test_delete_chat_success(self, async_client):
+    async def test_delete_chat_success(self, async_client, database):
         chat_id = "test-chat-delete"
         await database.execute(
             chats.insert().values(id=chat_id, title="Chat to Delete")
@@ -139,7 +259,7 @@ class TestChatEndpoints:
         assert response.json()["message"] == "Chat not found"
 
     @pytest.mark.asyncio
-    async def test_chat_creates_new_chat_without_id(self, async_client):
+    async def test_chat_creates_new_chat_without_id(self, async_client, database):
         prompt = "Hello bot"
         
         async with async_client.stream("GET", f"/chat?prompt={prompt}") as response:
@@ -153,7 +273,7 @@ class TestChatEndpoints:
         assert all_chats[0]["title"] == prompt
 
     @pytest.mark.asyncio
-    async def test_chat_uses_existing_chat_id(self, async_client):
+    async def test_chat_uses_existing_chat_id(self, async_client, database):
         chat_id = "existing-chat"
         await database.execute(
             chats.insert().values(id=chat_id, title="Existing Chat")
@@ -169,7 +289,7 @@ class TestChatEndpoints:
         assert len(all_chats) == 1
 
     @pytest.mark.asyncio
-    async def test_chat_saves_user_message(self, async_client):
+    async def test_chat_saves_user_message(self, async_client, database):
         chat_id = "message-test-chat"
         await database.execute(
             chats.insert().values(id=chat_id, title="Message Test")
@@ -188,3 +308,318 @@ class TestChatEndpoints:
         )
         assert len(user_messages) >= 1
         assert user_messages[0]["message"] == prompt
+
+    @pytest.mark.asyncio
+    @patch("endpoints.chat.ai_service.generate_response", fake_generate_response)
+    async def test_chat_streams_delta_events(self, async_client, database):
+        response = await async_client.get("/chat?prompt=Hi")
+        assert response.status_code == 200
+
+        events = parse_sse(response.text)
+        assert [e for e, _ in events] == ["start", "delta", "delta", "delta", "end"]
+
+        start, end = events[0][1], events[-1][1]
+        assert start["message_id"] == end["message_id"]
+        assert [data["delta"] for e, data in events if e == "delta"] == ["Hello", " there", "!"]
+        assert end["sha256"] == hashlib.sha256(b"Hello there!").hexdigest()
+        assert end["tokens"] == 3
+
+        bot_messages = await database.fetch_all(
+            messages.select().where(
+                (messages.c.chat_id == start["chat_id"]) & (messages.c.user == "bot")
+            )
+        )
+        assert [m["message"] for m in bot_messages] == ["Hello there!"]
+
+    @pytest.mark.asyncio
+    async def test_chat_reports_failures_without_the_reserved_error_event(self, async_client):
+        async def failing_generate_response(*args, **kwargs):
+            yield "Hello"
+            raise RuntimeError("model exploded")
+
+        with patch("endpoints.chat.ai_service.generate_response", failing_generate_response):
+            response = await async_client.get("/chat?prompt=Hi")
+
+        events = parse_sse(response.text)
+        assert [e for e, _ in events] == ["start", "delta", "failure"]
+        assert events[-1][1] == {"error": "model exploded"}
+
+    @pytest.mark.asyncio
+    @patch("endpoints.chat.ai_service.generate_response", fake_generate_response)
+    async def test_chat_streams_snapshots_on_request(self, async_client):
+        response = await async_client.get("/chat?prompt=Hi&stream_format=snapshot")
+        assert [data["message"] for _, data in parse_sse(response.text)] == [
+            "Hello", "Hello there", "Hello there!"
+        ]
+
+        response = await async_client.get(
+            "/chat?prompt=Hi", headers={"X-Stream-Format": "snapshot"}
+        )
+        assert [e for e, _ in parse_sse(response.text)] == ["message"] * 3
+
+    @pytest.mark.asyncio
+    async def test_chat_rejects_unknown_stream_format(self, async_client):
+        response = await async_client.get("/chat?prompt=Hi&stream_format=xml")
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    @patch("endpoints.chat.ai_service.dialogpt_batcher.is_full", return_value=True)
+    async def test_chat_returns_503_when_local_model_queue_full(self, mock_is_full, async_client, database):
+        response = await async_client.get("/chat?prompt=Hi")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+        all_chats = await database.fetch_all(chats.select())
+        assert all_chats == []
+
+    @pytest.mark.asyncio
+    async def test_chat_returns_503_when_flooded_past_default_limits(self, async_client):
+        release = asyncio.Event()
+
+        async def blocked_reply(prompt, chat_history, chat_id=None):
+            await release.wait()
+            yield "done"
+
+        backend = ai_service.backend(None, "dialogpt")
+        limit = config.DIALOGPT_MAX_CONCURRENCY + config.DIALOGPT_MAX_QUEUE_DEPTH
+        # Messages go through the write-behind buffer, as in a single process;
+        # only the new chats then contend for SQLite's write lock
+        await message_writer.start()
+        try:
+            with patch.object(ai_service, "_generate_dialogpt_response", blocked_reply):
+                # Distinct prompts, so none of them coalesce
+                flood = [
+                    asyncio.create_task(async_client.get(f"/chat?prompt=flood%20{i}&model=dialogpt"))
+                    for i in range(limit)
+                ]
+                for _ in range(500):
+                    if backend.active + backend.waiting == limit:
+                        break
+                    await asyncio.sleep(0.01)
+                assert backend.active == config.DIALOGPT_MAX_CONCURRENCY
+
+                response = await async_client.get("/chat?prompt=one%20more&model=dialogpt")
+                assert response.status_code == 503
+                assert response.headers["retry-after"] == "1"
+
+                release.set()
+                responses = await asyncio.gather(*flood)
+        finally:
+            await message_writer.stop()
+        assert all([e for e, _ in parse_sse(r.text)][-1] == "end" for r in responses)
+
+    @pytest.mark.asyncio
+    @patch("endpoints.chat.ai_service.generate_response", fake_generate_response)
+    async def test_load_chat_sees_buffered_messages(self, async_client, database):
+        flush_interval_ms = message_writer.flush_interval_ms
+        message_writer.flush_interval_ms = 60_000
+        await message_writer.start()
+        try:
+            response = await async_client.get("/chat?prompt=Hi")
+            chat_id = parse_sse(response.text)[0][1]["chat_id"]
+
+            stored = await database.fetch_all(messages.select().where(messages.c.chat_id == chat_id))
+            assert stored == []
+
+            data = (await async_client.get(f"/load_chat/{chat_id}")).json()
+            assert [m["message"] for m in data["messages"]] == ["Hi", "Hello there!"]
+        finally:
+            await message_writer.stop()
+            message_writer.flush_interval_ms = flush_interval_ms
+
+
+    @pytest.mark.asyncio
+    async def test_identical_prompts_share_a_generation_but_save_separately(self, async_client, database):
+        registry = BackendRegistry()
+        echo = EchoBackend(token_delay_ms=10)
+        registry.register(echo)
+        calls = []
+        original_stream = echo.stream
+
+        def counting_stream(*args):
+            calls.append(args)
+            return original_stream(*args)
+
+        echo.stream = counting_stream
+        with patch.object(ai_service, "backends", registry):
+            responses = await asyncio.gather(*(
+                async_client.get("/chat?prompt=hello%20there&model=echo") for _ in range(3)
+            ))
+
+        assert len(calls) == 1
+        chat_ids = [parse_sse(r.text)[0][1]["chat_id"] for r in responses]
+        assert len(set(chat_ids)) == 3
+        for chat_id in chat_ids:
+            bot = await database.fetch_all(
+                messages.select().where((messages.c.chat_id == chat_id) & (messages.c.user == "bot"))
+            )
+            assert [m["message"] for m in bot] == ["Echo: hello there"]
+
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_generation_and_saves_partial_reply(self, async_client):
+        registry = BackendRegistry()
+        echo = EchoBackend(token_delay_ms=10)
+        registry.register(echo)
+        # The client goes away after receiving two tokens
+        disconnected = AsyncMock(side_effect=[False, False] + [True] * 10)
+        with patch.object(ai_service, "backends", registry), \
+                patch("starlette.requests.Request.is_disconnected", disconnected):
+            response = await async_client.get("/chat?prompt=one%20two%20three%20four%20five&model=echo")
+
+        events = parse_sse(response.text)
+        assert [event for event, _ in events] == ["start", "delta", "delta"]
+        for _ in range(100):
+            if echo.active == 0 and len(ai_service.flights) == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert echo.active == 0 and len(ai_service.flights) == 0
+
+        chat = (await async_client.get(f"/load_chat/{events[0][1]['chat_id']}")).json()
+        bot = chat["messages"][-1]
+        assert bot["user"] == "bot"
+        assert bot["message"] == "Echo: one two"
+        assert bot["truncated"] is True
+        assert chat["messages"][0]["truncated"] is False
+
+    @pytest.mark.asyncio
+    async def test_chats_stay_responsive_during_local_generation(self, async_client):
+        class SlowTokenizer:
+            eos_token_id = 0
+
+            def encode(self, text):
+                return [len(word) for word in text.split()]
+
+            def decode(self, ids, skip_special_tokens=True):
+                return " ".join("tok" for i in ids if i != 0)
+
+        class SlowModel:
+            """Holds its thread for 50 ms per token, like CPU-bound generation."""
+            device = "cpu"
+
+            def generate(self, input_ids, attention_mask, pad_token_id, streamer, **kwargs):
+                streamer.put(input_ids)
+                for _ in range(20):
+                    time.sleep(0.05)
+                    streamer.put(torch.ones(len(input_ids), dtype=torch.long))
+                streamer.end()
+
+        started = threading.Event()
+        model, tokenizer = SlowModel(), SlowTokenizer()
+
+        def load_model():
+            started.set()
+            return model, tokenizer
+
+        batcher = DialoGPTBatcher(
+            load_model=load_model,
+            generation_kwargs={},
+            executor=ai_service.executor
+        )
+        with patch.object(ai_service, "dialogpt_batcher", batcher), \
+                patch.object(ai_service, "fallback_model", model), \
+                patch.object(ai_service, "fallback_tokenizer", tokenizer), \
+                patch.object(ai_service, "_model_loaded", True), \
+                patch.object(ai_service, "token_cache", TokenCache()):
+            chat = asyncio.create_task(async_client.get("/chat?prompt=hello&model=dialogpt"))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+
+            latencies = []
+            for _ in range(5):
+                began = time.perf_counter()
+                response = await async_client.get("/chats")
+                latencies.append(time.perf_counter() - began)
+                assert response.status_code == 200
+            assert not chat.done()
+            assert len(parse_sse((await chat).text)) > 2
+            await asyncio.to_thread(batcher.stop)
+
+        # A blocked event loop would hold every request for the whole second of generation
+        assert max(latencies) < 0.25
+
+
+class TestChatHistory:
+    async def seed(self, database, chat_id: str, count: int, text: str = "Message {i}"):
+        await database.execute(chats.insert().values(id=chat_id, title="History"))
+        for i in range(count):
+            await database.execute(
+                messages.insert().values(
+                    chat_id=chat_id,
+                    user="user" if i % 2 == 0 else "bot",
+                    message=text.format(i=i),
+                    timestamp=datetime(2024, 1, 1, 0, 0, i)
+                )
+            )
+
+    @pytest.mark.asyncio
+    async def test_history_returns_newest_messages_in_order(self, database):
+        await self.seed(database, "history-chat", 20)
+
+        history = await get_chat_history("history-chat", max_messages=5)
+        assert [m.message for m in history] == [f"Message {i}" for i in range(15, 20)]
+
+    @pytest.mark.asyncio
+    async def test_history_without_limit_returns_everything(self, database):
+        await self.seed(database, "history-chat", 4)
+
+        history = await get_chat_history("history-chat")
+        assert [m.message for m in history] == [f"Message {i}" for i in range(4)]
+
+    @pytest.mark.asyncio
+    async def test_history_respects_token_budget(self, database):
+        # Each message is ~10 estimated tokens
+        await self.seed(database, "history-chat", 10, text="{i:02d}" + "x" * 38)
+
+        history = await get_chat_history("history-chat", max_messages=10, max_tokens=35)
+        assert [m.message[:2] for m in history] == ["07", "08", "09"]
+
+    @pytest.mark.asyncio
+    async def test_history_served_from_cache_after_first_read(self, database):
+        await self.seed(database, "history-chat", 8)
+        await get_chat_history("history-chat", max_messages=5)
+        hits = context_cache.hits
+
+        # Rows written behind the cache's back are not seen: the second read is a hit
+        await database.execute(messages.delete())
+        history = await get_chat_history("history-chat", max_messages=3)
+        assert [m.message for m in history] == ["Message 5", "Message 6", "Message 7"]
+        assert context_cache.hits == hits + 1
+
+    @pytest.mark.asyncio
+    async def test_history_reads_only_the_window_when_cache_is_off(self, database):
+        await self.seed(database, "history-chat", 8)
+        store = endpoints.chat.store
+        misses = context_cache.misses
+
+        with patch.object(context_cache, "max_chats", 0), \
+                patch.object(store, "fetch_context", wraps=store.fetch_context) as fetch_context:
+            history = await get_chat_history("history-chat", max_messages=3)
+
+        # No cache to fill, so no point reading the cache's full depth
+        assert [m.message for m in history] == ["Message 5", "Message 6", "Message 7"]
+        fetch_context.assert_awaited_once_with("history-chat", 3)
+        assert context_cache.misses == misses
+        assert len(context_cache) == 0
+
+    @pytest.mark.asyncio
+    @patch("endpoints.chat.ai_service.generate_response", fake_generate_response)
+    async def test_chat_turns_update_cached_history(self, async_client):
+        response = await async_client.get("/chat?prompt=First")
+        chat_id = parse_sse(response.text)[0][1]["chat_id"]
+        misses = context_cache.misses
+
+        await async_client.get(f"/chat?prompt=Second&chat_id={chat_id}")
+        history = await get_chat_history(chat_id, max_messages=10)
+
+        assert [m.message for m in history] == ["First", "Hello there!", "Second", "Hello there!"]
+        assert context_cache.misses == misses
+
+    @pytest.mark.asyncio
+    @patch("endpoints.chat.ai_service.generate_response", fake_generate_response)
+    async def test_delete_chat_invalidates_cached_history(self, async_client):
+        response = await async_client.get("/chat?prompt=Hi")
+        chat_id = parse_sse(response.text)[0][1]["chat_id"]
+        assert len(await get_chat_history(chat_id, max_messages=10)) == 2
+
+        await async_client.delete(f"/chat/{chat_id}")
+        assert await get_chat_history(chat_id, max_messages=10) == []
@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from ai_service import AIService
+from backends import EchoBackend
+from coalescing import SingleFlight
+
+
+@pytest.fixture
+def service():
+    with patch("config.ECHO_BACKEND_ENABLED", True):
+        service = AIService()
+    service.response_cache_enabled = False
+    service.coalesce_enabled = True
+    echo = service.backends.get("echo")
+    echo.token_delay_ms = 20
+    return service
+
+
+def count_streams(backend: EchoBackend):
+    """Wrap ``backend.stream`` to count how many generations it runs."""
+    calls = []
+    original = backend.stream
+
+    def stream(*args):
+        calls.append(args)
+        return original(*args)
+
+    backend.stream = stream
+    return calls
+
+
+async def reply(service: AIService, prompt: str):
+    return [token async for token in service.generate_response(prompt=prompt, model="echo")]
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_one_generation(service):
+    calls = count_streams(service.backends.get("echo"))
+
+    first = asyncio.create_task(reply(service, "hello there friend"))
+    await asyncio.sleep(0.05)  # the first tokens are already out
+    late = asyncio.create_task(reply(service, "hello there friend"))
+    other = asyncio.create_task(reply(service, "something else"))
+
+    results = await asyncio.gather(first, late, other)
+    assert results[0] == results[1] == ["Echo:", " hello", " there", " friend"]
+    assert len(calls) == 2
+    assert service.flights.stats() == {"in_flight": 0, "started": 2, "coalesced": 1}
+
+
+@pytest.mark.asyncio
+async def test_leader_disconnect_does_not_stop_other_subscribers(service):
+    leader = service.generate_response(prompt="hello there friend", model="echo")
+    assert await leader.__anext__() == "Echo:"
+    follower = asyncio.create_task(reply(service, "hello there friend"))
+    await asyncio.sleep(0)
+
+    await leader.aclose()
+    assert await follower == ["Echo:", " hello", " there", " friend"]
+
+
+@pytest.mark.asyncio
+async def test_generation_is_cancelled_when_everyone_leaves():
+    flights = SingleFlight()
+    finished = []
+
+    async def generate():
+        try:
+            for i in range(100):
+                yield str(i)
+                await asyncio.sleep(0.01)
+        finally:
+            finished.append(True)
+
+    flight = flights.join("key", generate)
+    subscriber = flight.subscribe()
+    assert await subscriber.__anext__() == "0"
+    await subscriber.aclose()
+    await asyncio.sleep(0.02)
+
+    assert flight.abandoned and flight.task.cancelled()
+    assert finished == [True]
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_subscriber():
+    flights = SingleFlight()
+
+    async def generate():
+        yield "partial"
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def collect():
+        return [token async for token in flights.join("key", generate).subscribe()]
+
+    results = await asyncio.gather(collect(), collect(), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flights.started == 1
+
+
+@pytest.mark.asyncio
+async def test_coalescing_can_be_disabled(service):
+    service.coalesce_enabled = False
+    calls = count_streams(service.backends.get("echo"))
+    await asyncio.gather(reply(service, "hi"), reply(service, "hi"))
+    assert len(calls) == 2
@@ -0,0 +1,64 @@
+from context_cache import ContextCache
+from models.chat import HistoryMessage
+
+
+def window(*texts: str):
+    return [HistoryMessage(user="user", message=text) for text in texts]
+
+
+def test_miss_then_hit():
+    cache = ContextCache(depth=5)
+    assert cache.get("chat", 3) is None
+
+    cache.put("chat", window("a", "b", "c", "d"), complete=False, version=cache.version("chat"))
+    assert [m.message for m in cache.get("chat", 3)] == ["b", "c", "d"]
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_partial_window_misses_unless_complete():
+    cache = ContextCache(depth=5)
+    cache.put("partial", window("a", "b"), complete=False, version=0)
+    cache.put("whole", window("a", "b"), complete=True, version=0)
+
+    assert cache.get("partial", 3) is None
+    assert [m.message for m in cache.get("whole", 3)] == ["a", "b"]
+
+
+def test_append_keeps_window_bounded():
+    cache = ContextCache(depth=3)
+    cache.put("chat", window("a", "b"), complete=True, version=0)
+    cache.append("chat", HistoryMessage(user="bot", message="c"))
+    cache.append("chat", HistoryMessage(user="user", message="d"))
+
+    assert [m.message for m in cache.get("chat", 3)] == ["b", "c", "d"]
+    # The oldest message was dropped, so a longer window is no longer complete
+    assert cache.get("chat", 4) is None
+
+
+def test_stale_read_is_not_stored():
+    cache = ContextCache()
+    version = cache.version("chat")
+    cache.append("chat", HistoryMessage(user="user", message="written meanwhile"))
+
+    cache.put("chat", window("old"), complete=True, version=version)
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = ContextCache(max_chats=2)
+    cache.put("a", window("1"), complete=True, version=0)
+    cache.put("b", window("2"), complete=True, version=0)
+    cache.get("a", 1)
+    cache.put("c", window("3"), complete=True, version=0)
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) is not None
+    assert cache.evictions == 1
+
+
+def test_invalidate():
+    cache = ContextCache()
+    cache.put("chat", window("a"), complete=True, version=0)
+    cache.invalidate("chat")
+
+    assert cache.get("chat", 1) is None
@@ -0,0 +1,22 @@
+import pytest
+from databases import Database
+from db import TunedSQLiteConnection, configure_database
+
+
+@pytest.mark.asyncio
+async def test_sqlite_profile_is_applied(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'tuned.db'}", factory=TunedSQLiteConnection)
+    await database.connect()
+    try:
+        profile = await configure_database(database)
+        assert profile["journal_mode"] == "wal"
+
+        # Per-connection settings hold on every new connection, not just the first
+        async with database.connection() as connection:
+            assert await connection.fetch_val("PRAGMA synchronous") == 1  # NORMAL
+            assert await connection.fetch_val("PRAGMA temp_store") == 2   # MEMORY
+            assert await connection.fetch_val("PRAGMA busy_timeout") == 5000
+            assert await connection.fetch_val("PRAGMA journal_mode") == "wal"
+    finally:
+        await database.disconnect()
+
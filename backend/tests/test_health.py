@@ -0,0 +1,74 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from ai_service import AIService, ai_service, MODEL_NOT_LOADED, MODEL_READY, MODEL_FAILED
+
+
+@pytest.mark.asyncio
+async def test_healthz(async_client):
+    response = await async_client.get("/healthz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
+@pytest.mark.asyncio
+async def test_readyz_without_warmup(async_client):
+    with patch("config.DIALOGPT_WARMUP", False):
+        response = await async_client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["checks"]["database"] is True
+
+
+@pytest.mark.asyncio
+async def test_readyz_waits_for_model_when_warmup_enabled(async_client):
+    with patch("config.DIALOGPT_WARMUP", True):
+        with patch.object(ai_service, "model_state", MODEL_NOT_LOADED):
+            response = await async_client.get("/readyz")
+            assert response.status_code == 503
+            assert response.json()["checks"]["model"] == MODEL_NOT_LOADED
+
+        with patch.object(ai_service, "model_state", MODEL_READY):
+            response = await async_client.get("/readyz")
+            assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_are_single_flight():
+    """Requests arriving while the model loads wait for that one load."""
+    service = AIService()
+    calls = []
+
+    def slow_from_pretrained(name):
+        calls.append(name)
+        # Give the other callers time to pile up behind the lock
+        time.sleep(0.2)
+        return MagicMock()
+
+    with patch("transformers.AutoTokenizer.from_pretrained", side_effect=slow_from_pretrained), \
+            patch("transformers.AutoModelForCausalLM.from_pretrained", side_effect=slow_from_pretrained):
+        await asyncio.gather(*(service.load_dialogpt_model() for _ in range(5)))
+
+    assert len(calls) == 2  # one tokenizer, one model
+    assert service.model_state == MODEL_READY
+
+
+@pytest.mark.asyncio
+async def test_warmup_failure_is_reported():
+    service = AIService()
+    with patch("transformers.AutoTokenizer.from_pretrained", side_effect=OSError("no weights")):
+        service.start_warmup()
+        await service._warmup_task
+
+    assert service.model_state == MODEL_FAILED
+    assert service.model_error == "no weights"
+    assert service._model_loaded is False
+
+
+@pytest.mark.asyncio
+async def test_stats_reports_cache_hit_rates(async_client):
+    response = await async_client.get("/stats")
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body) == {"response_cache", "coalescing", "context_cache", "kv_cache", "token_cache"}
+    assert "hit_rate" in body["response_cache"]
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import pytest
+import torch
+from typing import List
+from inference import DialoGPTBatcher, InferenceQueueFull, quantize_dynamic_int8
+from tests.fakes import EOS, EndlessModel, FakeModel, FakeTokenizer
+
+
+def make_batcher(model: FakeModel, **kwargs) -> DialoGPTBatcher:
+    return DialoGPTBatcher(
+        load_model=lambda: (model, FakeTokenizer()),
+        generation_kwargs={},
+        **kwargs
+    )
+
+
+async def collect(batcher: DialoGPTBatcher, input_ids: List[int]) -> str:
+    return "".join([token async for token in batcher.generate(input_ids)])
+
+
+@pytest.mark.asyncio
+async def test_concurrent_prompts_share_one_generate_call():
+    model = FakeModel()
+    batcher = make_batcher(model, max_batch_size=4, max_wait_ms=200)
+
+    replies = await asyncio.gather(
+        collect(batcher, [5, 1]),
+        collect(batcher, [2]),
+        collect(batcher, [7, 8, 3]),
+    )
+    batcher.stop()
+
+    assert replies == ["w11 w12 w13", "w21 w22 w23", "w31 w32 w33"]
+    assert len(model.calls) == 1
+    # Shorter prompts are left-padded to the longest one
+    assert model.calls[0]["input_ids"].tolist() == [[EOS, 5, 1], [EOS, EOS, 2], [7, 8, 3]]
+    assert model.calls[0]["attention_mask"].tolist() == [[0, 1, 1], [0, 0, 1], [1, 1, 1]]
+
+
+@pytest.mark.asyncio
+async def test_batch_size_is_capped():
+    model = FakeModel()
+    batcher = make_batcher(model, max_batch_size=2, max_wait_ms=200)
+
+    await asyncio.gather(*(collect(batcher, [i]) for i in range(1, 6)))
+    batcher.stop()
+
+    assert [len(call["input_ids"]) for call in model.calls] == [2, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_new_prompts():
+    release = threading.Event()
+    model = FakeModel(release=release)
+    batcher = make_batcher(model, max_batch_size=1, max_wait_ms=0, max_queue_depth=1)
+
+    running = asyncio.create_task(collect(batcher, [1]))
+    while not model.calls:
+        await asyncio.sleep(0.01)
+    waiting = asyncio.create_task(collect(batcher, [2]))
+    await asyncio.sleep(0.01)
+
+    assert batcher.is_full()
+    with pytest.raises(InferenceQueueFull):
+        await collect(batcher, [3])
+
+    release.set()
+    assert await running == "w11 w12 w13"
+    assert await waiting == "w21 w22 w23"
+    batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_generate_errors_reach_every_request():
+    model = FakeModel()
+    model.generate = lambda **kwargs: (_ for _ in ()).throw(RuntimeError("boom"))
+    batcher = make_batcher(model, max_batch_size=2, max_wait_ms=200)
+
+    results = await asyncio.gather(
+        collect(batcher, [1]), collect(batcher, [2]), return_exceptions=True
+    )
+    batcher.stop()
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_idle_worker_returns_its_thread_and_restarts():
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    batcher = make_batcher(FakeModel(), max_wait_ms=0, executor=executor, idle_timeout_s=0.05)
+
+    assert await collect(batcher, [1]) == "w11 w12 w13"
+    for _ in range(100):
+        if batcher._worker is None:
+            break
+        await asyncio.sleep(0.01)
+    assert batcher._worker is None
+
+    assert await collect(batcher, [2]) == "w21 w22 w23"
+    batcher.stop()
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_abandoned_request_stops_generation():
+    model = EndlessModel()
+    batcher = DialoGPTBatcher(load_model=lambda: (model, FakeTokenizer()), generation_kwargs={})
+
+    tokens = batcher.generate([1])
+    assert await tokens.__anext__() == "w1 "
+    await tokens.aclose()
+    await asyncio.to_thread(batcher.stop)
+
+    assert model.steps < 20
+
+
+def test_quantize_dynamic_int8_converts_gpt2_projections():
+    from transformers import GPT2Config, GPT2LMHeadModel
+    from transformers.pytorch_utils import Conv1D
+
+    torch.manual_seed(0)
+    model = GPT2LMHeadModel(GPT2Config(n_layer=2, n_embd=64, n_head=4, vocab_size=100)).eval()
+    input_ids = torch.tensor([[1, 2, 3, 4, 5]])
+    with torch.inference_mode():
+        expected = model(input_ids).logits
+
+    quantized = quantize_dynamic_int8(model)
+    with torch.inference_mode():
+        actual = quantized(input_ids).logits
+
+    modules = list(quantized.modules())
+    assert not any(isinstance(m, Conv1D) for m in modules)
+    assert any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in modules)
+    assert torch.allclose(actual, expected, atol=0.1)
@@ -0,0 +1,136 @@
+import asyncio
+import pytest
+import torch
+from ai_service import AIService, DIALOGPT_CONTEXT_WINDOW, MODEL_READY
+from kv_cache import CachedPrefix, KVCache
+from token_cache import TokenCache
+
+
+def prefix(length: int, layers: int = 2) -> CachedPrefix:
+    """A fake prefix of ``length`` tokens; each layer's keys and values take 4 * length bytes."""
+    past = tuple(
+        (torch.zeros(1, 1, length, 1), torch.zeros(1, 1, length, 1)) for _ in range(layers)
+    )
+    return CachedPrefix(list(range(length + 1)), past)
+
+
+def test_take_requires_history_to_match_cached_turns():
+    cache = KVCache()
+    turns = [("user", "hi"), ("bot", "hello")]
+
+    cache.put("chat", prefix(4), turns)
+    assert cache.take("chat", [("user", "hi"), ("bot", "edited")]) is None
+    # A miss drops the entry: it no longer matches the chat
+    assert cache.take("chat", turns) is None
+
+    # The prefix covers more than the caller's window would encode
+    cache.put("chat", prefix(4), turns)
+    assert cache.take("chat", turns[-1:]) is None
+
+    cache.put("chat", prefix(4), turns)
+    taken = cache.take("chat", turns)
+    assert taken is not None and taken[1] == turns
+    assert len(cache) == 0 and cache.nbytes == 0
+    assert cache.stats()["hits"] == 1
+
+
+def test_eviction_by_count_and_bytes():
+    cache = KVCache(max_chats=2, max_bytes=200)  # prefix(4) is 64 bytes
+    turns = [("user", "hi")]
+    cache.put("a", prefix(4), turns)
+    cache.put("b", prefix(4), turns)
+    cache.put("c", prefix(4), turns)
+    assert cache.take("a", turns) is None
+    assert cache.evictions == 1
+
+    cache.put("big", prefix(10), turns)  # 160 bytes pushes out older chats
+    assert cache.nbytes <= 200
+    assert cache.take("big", turns) is not None
+
+    cache.put("huge", prefix(100), turns)  # larger than the whole budget
+    assert cache.take("huge", turns) is None
+
+
+@pytest.fixture
+def tiny_service():
+    """AIService backed by a tiny random GPT-2 and byte-level tokenizer."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel()
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.train_from_iterator(
+        ["hello how are you doing fine thanks and you"] * 10,
+        trainers.BpeTrainer(
+            vocab_size=300,
+            special_tokens=["<|endoftext|>"],
+            initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+        )
+    )
+    torch.manual_seed(0)
+    service = AIService()
+    service.fallback_tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|endoftext|>")
+    service.fallback_model = GPT2LMHeadModel(GPT2Config(
+        n_layer=2, n_embd=64, n_head=4, vocab_size=len(service.fallback_tokenizer),
+        bos_token_id=0, eos_token_id=0
+    )).eval()
+    service._model_loaded = True
+    service.model_state = MODEL_READY
+    service.kv_cache = KVCache()
+    service.token_cache = TokenCache()
+    service.dialogpt_batcher.generation_kwargs = {
+        "max_new_tokens": 8, "min_new_tokens": 8, "do_sample": False
+    }
+    yield service
+    service.dialogpt_batcher.stop()
+
+
+async def reply(service: AIService, prompt: str, history, chat_id=None) -> str:
+    parts = []
+    async for token in service.generate_response(prompt=prompt, chat_history=history, chat_id=chat_id):
+        parts.append(token)
+    # The keys/values arrive from the inference thread just after the last token
+    for _ in range(100):
+        if not chat_id or len(service.kv_cache):
+            break
+        await asyncio.sleep(0.01)
+    return "".join(parts).strip()
+
+
+@pytest.mark.asyncio
+async def test_follow_up_turn_reuses_cache_with_same_output(tiny_service):
+    first = await reply(tiny_service, "hello", [], chat_id="chat")
+    assert first and len(tiny_service.kv_cache) == 1
+
+    history = [{"user": "user", "message": "hello"}, {"user": "bot", "message": first}]
+    cached = await reply(tiny_service, "how are you", history, chat_id="chat")
+    assert tiny_service.kv_cache.hits == 1
+
+    # Same turn recomputed from scratch
+    recomputed = await reply(tiny_service, "how are you", history)
+    assert cached == recomputed
+
+
+@pytest.mark.asyncio
+async def test_changed_history_falls_back_to_recompute(tiny_service):
+    first = await reply(tiny_service, "hello", [], chat_id="chat")
+    history = [{"user": "user", "message": "hello"}, {"user": "bot", "message": first + " (edited)"}]
+
+    await reply(tiny_service, "how are you", history, chat_id="chat")
+    assert tiny_service.kv_cache.hits == 0
+    assert tiny_service.kv_cache.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_is_not_used_past_the_message_window(tiny_service):
+    history = []
+    for prompt in ["hello", "how are you", "doing fine", "thanks and you"]:
+        text = await reply(tiny_service, prompt, history, chat_id="chat")
+        history += [{"user": "user", "message": prompt}, {"user": "bot", "message": text}]
+
+    # Hits for the second and third turns; by the fourth the prefix spans six
+    # messages while a miss encodes the last five, so it is recomputed
+    assert len(history) > DIALOGPT_CONTEXT_WINDOW.max_messages
+    assert tiny_service.kv_cache.hits == 2
+    assert tiny_service.kv_cache.misses == 2
@@ -0,0 +1,157 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta, UTC
+from databases import Database
+from db import TunedSQLiteConnection
+from migrations import run_migrations
+from message_writer import MessageWriter
+from storage import SQLiteStore
+from models.chat import ChatMessage
+from models.db import chats, messages
+
+
+@pytest_asyncio.fixture
+async def temp_database(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'writer.db'}", factory=TunedSQLiteConnection)
+    await db.connect()
+    await run_migrations(db)
+    await db.execute(chats.insert().values(id="chat-1", title="Chat 1"))
+    await db.execute(chats.insert().values(id="chat-2", title="Chat 2"))
+    yield db
+    await db.disconnect()
+
+
+def make_message(chat_id: str, i: int) -> ChatMessage:
+    return ChatMessage(
+        chat_id=chat_id,
+        user="user" if i % 2 == 0 else "bot",
+        message=f"Message {i}",
+        timestamp=datetime(2024, 1, 1, tzinfo=UTC) + timedelta(seconds=i),
+    )
+
+
+async def stored(db: Database, chat_id: str):
+    rows = await db.fetch_all(
+        messages.select().where(messages.c.chat_id == chat_id).order_by(messages.c.id)
+    )
+    return [row["message"] for row in rows]
+
+
+@pytest.mark.asyncio
+async def test_writes_immediately_when_not_running(temp_database):
+    writer = MessageWriter(SQLiteStore(temp_database))
+    await writer.write(make_message("chat-1", 0))
+
+    assert await stored(temp_database, "chat-1") == ["Message 0"]
+
+
+@pytest.mark.asyncio
+async def test_buffers_until_flush_interval(temp_database):
+    writer = MessageWriter(SQLiteStore(temp_database), batch_size=100, flush_interval_ms=50)
+    await writer.start()
+    for i in range(3):
+        await writer.write(make_message("chat-1", i))
+
+    assert writer.pending == 3
+    assert await stored(temp_database, "chat-1") == []
+
+    await asyncio.sleep(0.2)
+    assert writer.pending == 0
+    assert await stored(temp_database, "chat-1") == ["Message 0", "Message 1", "Message 2"]
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_early(temp_database):
+    writer = MessageWriter(SQLiteStore(temp_database), batch_size=2, flush_interval_ms=60_000)
+    await writer.start()
+    await writer.write(make_message("chat-1", 0))
+    await writer.write(make_message("chat-2", 1))
+    await asyncio.sleep(0.05)
+
+    assert await stored(temp_database, "chat-1") == ["Message 0"]
+    assert await stored(temp_database, "chat-2") == ["Message 1"]
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_flush_chat_gives_read_your_writes(temp_database):
+    writer = MessageWriter(SQLiteStore(temp_database), flush_interval_ms=60_000)
+    await writer.start()
+    await writer.write(make_message("chat-1", 0))
+
+    assert writer.has_pending("chat-1")
+    assert not writer.has_pending("chat-2")
+    await writer.flush_chat("chat-1")
+    assert await stored(temp_database, "chat-1") == ["Message 0"]
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_buffered_messages(temp_database):
+    writer = MessageWriter(SQLiteStore(temp_database), flush_interval_ms=60_000)
+    await writer.start()
+    for i in range(5):
+        await writer.write(make_message("chat-2", i))
+    await writer.stop()
+
+    assert not writer.running
+    assert len(await stored(temp_database, "chat-2")) == 5
+
+
+@pytest.mark.asyncio
+async def test_flush_updates_chat_activity(temp_database):
+    writer = MessageWriter(SQLiteStore(temp_database))
+    await writer.write(make_message("chat-1", 5))
+
+    chat = await temp_database.fetch_one(chats.select().where(chats.c.id == "chat-1"))
+    assert chat["updated_at"] == datetime(2024, 1, 1, 0, 0, 5)
+
+
+class SlowStore(SQLiteStore):
+    """Signals when a write starts, then takes ``delay`` seconds to commit it."""
+
+    def __init__(self, database: Database, delay: float):
+        super().__init__(database)
+        self.delay = delay
+        self.writing = asyncio.Event()
+
+    async def append_messages(self, batch):
+        self.writing.set()
+        await asyncio.sleep(self.delay)
+        await super().append_messages(batch)
+
+
+@pytest.mark.asyncio
+async def test_stop_during_slow_flush_loses_nothing(temp_database):
+    store = SlowStore(temp_database, delay=0.2)
+    writer = MessageWriter(store, flush_interval_ms=10)
+    await writer.start()
+    for i in range(3):
+        await writer.write(make_message("chat-1", i))
+    await store.writing.wait()
+    await writer.write(make_message("chat-1", 3))
+
+    await writer.stop()
+
+    assert writer.pending == 0
+    assert await stored(temp_database, "chat-1") == [f"Message {i}" for i in range(4)]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_flush_keeps_its_batch(temp_database):
+    writer = MessageWriter(SlowStore(temp_database, delay=10), flush_interval_ms=60_000)
+    await writer.start()
+    await writer.write(make_message("chat-1", 0))
+
+    flushing = asyncio.create_task(writer.flush())
+    await writer.store.writing.wait()
+    flushing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flushing
+
+    assert writer.pending == 1
+    writer.store.delay = 0
+    await writer.stop()
+    assert await stored(temp_database, "chat-1") == ["Message 0"]
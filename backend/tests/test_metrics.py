@@ -0,0 +1,60 @@
+import re
+import pytest
+from unittest.mock import patch
+from ai_service import ai_service
+from backends import BackendRegistry, EchoBackend
+from metrics import MetricsRegistry
+
+
+def sample(text: str, name: str, labels: str = "", default: float = None) -> float:
+    """Value of one sample in a Prometheus text exposition."""
+    match = re.search(rf"^{re.escape(name + labels)} (\S+)$", text, re.MULTILINE)
+    if match is None and default is not None:
+        return default
+    assert match, f"{name}{labels} not found"
+    return float(match.group(1))
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ["op"], buckets=[0.1, 1.0])
+    for value in (0.05, 0.1, 0.5, 5.0):
+        latency.labels("read").observe(value)
+    registry.counter("requests_total", "Requests", ["path"]).labels('/a"b').inc(3)
+    registry.gauge("in_flight", "In flight").inc()
+    registry.register_collector(lambda: [("queue_depth", "gauge", "Queue", [({"queue": "x"}, 7)])])
+
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert sample(text, "latency_seconds_bucket", '{op="read",le="0.1"}') == 2
+    assert sample(text, "latency_seconds_bucket", '{op="read",le="1"}') == 3
+    assert sample(text, "latency_seconds_bucket", '{op="read",le="+Inf"}') == 4
+    assert sample(text, "latency_seconds_count", '{op="read"}') == 4
+    assert sample(text, "requests_total", '{path="/a\\"b"}') == 3
+    assert sample(text, "in_flight") == 1
+    assert sample(text, "queue_depth", '{queue="x"}') == 7
+
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Again")
+
+
+@pytest.mark.asyncio
+async def test_chat_request_is_reflected_in_metrics(async_client):
+    before = (await async_client.get("/metrics")).text
+    registry = BackendRegistry()
+    registry.register(EchoBackend())
+    with patch.object(ai_service, "backends", registry):
+        response = await async_client.get("/chat?prompt=count%20these%20words&model=echo")
+    assert response.status_code == 200
+
+    after = (await async_client.get("/metrics")).text
+    tokens = '{backend="echo"}'
+    # "Echo:" plus one token per word
+    assert sample(after, "chat_generated_tokens_total", tokens) - \
+        sample(before, "chat_generated_tokens_total", tokens, default=0) == 4
+    assert sample(after, "chat_time_to_first_token_seconds_count", '{backend="echo"}') >= 1
+    assert sample(after, "sse_bytes_sent_total", '{format="delta"}') >= len(response.content)
+    assert sample(after, "db_query_seconds_count", '{statement="insert_chat"}') >= 1
+    assert sample(after, "chat_active_streams") == 0
+    assert sample(after, "inference_queue_depth") == 0
+    assert 0 <= sample(after, "cache_hit_ratio", '{cache="context"}') <= 1
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from databases import Database
+from db import database_options
+from migrations import MIGRATIONS, POSTGRES_MIGRATIONS, get_schema_version, run_migrations
+from tests.conftest import require_postgres
+
+
+@pytest_asyncio.fixture
+async def temp_database(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'migrations.db'}")
+    await db.connect()
+    yield db
+    await db.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_fresh_database_upgrades_to_latest(temp_database):
+    version = await run_migrations(temp_database)
+    assert version == MIGRATIONS[-1].version
+
+    indexes = await temp_database.fetch_all(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'"
+    )
+    assert "ix_messages_chat_id_timestamp" in [row["name"] for row in indexes]
+
+
+@pytest.mark.asyncio
+async def test_migrations_are_applied_once(temp_database):
+    await run_migrations(temp_database)
+    await run_migrations(temp_database)
+
+    applied = await temp_database.fetch_all("SELECT version FROM schema_migrations")
+    assert [row["version"] for row in applied] == [m.version for m in MIGRATIONS]
+
+
+@pytest.mark.asyncio
+async def test_legacy_database_is_upgraded_in_place(temp_database):
+    # A chatbot.db created by the original metadata.create_all()
+    await temp_database.execute(MIGRATIONS[0].statements[0])
+    await temp_database.execute(MIGRATIONS[0].statements[1])
+    await temp_database.execute("INSERT INTO chats (id, title) VALUES ('old-chat', 'Old Chat')")
+    await temp_database.execute(
+        "INSERT INTO messages (chat_id, user, message, timestamp) VALUES "
+        "('old-chat', 'user', 'Hello', '2024-01-01 00:00:00.000000'), "
+        "('old-chat', 'bot', 'Hi there!', '2024-01-02 00:00:00.000000')"
+    )
+
+    await run_migrations(temp_database)
+
+    chat = await temp_database.fetch_one("SELECT * FROM chats WHERE id = 'old-chat'")
+    assert chat["title"] == "Old Chat"
+    assert chat["created_at"] == "2024-01-01 00:00:00.000000"
+    assert chat["updated_at"] == "2024-01-02 00:00:00.000000"
+    assert await temp_database.fetch_val("SELECT COUNT(*) FROM messages") == 2
+
+
+@pytest.mark.asyncio
+async def test_run_migrations_stops_at_target(temp_database):
+    assert await run_migrations(temp_database, target=1) == 1
+    assert await get_schema_version(temp_database) == 1
+    assert await run_migrations(temp_database) == MIGRATIONS[-1].version
+
+
+@pytest.mark.asyncio
+async def test_replicas_starting_together_migrate_once():
+    url = require_postgres()
+    replicas = [Database(url, **database_options(url)) for _ in range(3)]
+    for replica in replicas:
+        await replica.connect()
+    try:
+        for table in ("messages", "chats", "schema_migrations"):
+            await replicas[0].execute(f"DROP TABLE IF EXISTS {table}")
+
+        versions = await asyncio.gather(*(run_migrations(replica) for replica in replicas))
+
+        assert versions == [POSTGRES_MIGRATIONS[-1].version] * 3
+        applied = await replicas[0].fetch_all("SELECT version FROM schema_migrations")
+        assert [row["version"] for row in applied] == [m.version for m in POSTGRES_MIGRATIONS]
+    finally:
+        for replica in replicas:
+            await replica.disconnect()
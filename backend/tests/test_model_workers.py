@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import pytest
+import torch
+from types import SimpleNamespace
+from typing import List
+from inference import DialoGPTBatcher
+from model_workers import ModelWorkerClient, ModelWorkersUnavailable, run_pool, serve
+from ai_service import AIService
+from tests.fakes import EOS, EndlessModel, FakeModel, FakeTokenizer
+
+
+class PidModel:
+    """Replies ``w<pid>``, naming the worker process that ran it."""
+    device = torch.device("cpu")
+
+    def generate(self, input_ids, attention_mask, pad_token_id, streamer, **kwargs):
+        streamer.put(input_ids)
+        last = input_ids[:, -1]
+        streamer.put(torch.full_like(last, os.getpid()))
+        streamer.put(torch.full_like(last, EOS))
+        streamer.end()
+
+
+
+async def start_worker(model, path: str):
+    """Serve ``model`` on a Unix socket at ``path``, like one forked model worker."""
+    batcher = DialoGPTBatcher(load_model=lambda: (model, FakeTokenizer()), generation_kwargs={}, max_wait_ms=0)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+    return batcher, asyncio.create_task(serve(batcher, sock))
+
+
+async def collect(client: ModelWorkerClient, input_ids: List[int]) -> str:
+    return "".join([token async for token in client.generate(input_ids)])
+
+
+async def stop_worker(batcher: DialoGPTBatcher, server: asyncio.Task) -> None:
+    server.cancel()
+    await asyncio.gather(server, return_exceptions=True)
+    await asyncio.to_thread(batcher.stop)
+
+
+@pytest.mark.asyncio
+async def test_worker_streams_reply_to_client(tmp_path):
+    path = str(tmp_path / "workers.sock")
+    batcher, server = await start_worker(FakeModel(), path)
+    client = ModelWorkerClient(path, generation_kwargs={})
+
+    replies = await asyncio.gather(
+        *(asyncio.create_task(collect(client, ids)) for ids in ([5, 1], [2]))
+    )
+    await stop_worker(batcher, server)
+
+    assert replies == ["w11 w12 w13", "w21 w22 w23"]
+    assert client.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_client_hangup_stops_generation_in_worker(tmp_path):
+    path = str(tmp_path / "workers.sock")
+    model = EndlessModel()
+    batcher, server = await start_worker(model, path)
+    client = ModelWorkerClient(path, generation_kwargs={})
+
+    tokens = client.generate([1])
+    assert await tokens.__anext__() == "w1 "
+    await tokens.aclose()
+    await asyncio.sleep(0.05)
+    # Waits for the running batch, which ends early only if the row was cancelled
+    await stop_worker(batcher, server)
+
+    assert model.steps < 50
+
+
+@pytest.mark.asyncio
+async def test_missing_pool_is_reported(tmp_path):
+    client = ModelWorkerClient(str(tmp_path / "absent.sock"), generation_kwargs={})
+    with pytest.raises(ModelWorkersUnavailable):
+        await collect(client, [1])
+
+
+def test_remote_service_sends_prompts_to_workers():
+    service = AIService(remote_inference=True)
+    assert isinstance(service.dialogpt_batcher, ModelWorkerClient)
+    assert service.backend(None, "dialogpt").sampling_params["max_new_tokens"] == 100
+
+
+def run_fake_pool(path: str) -> None:
+    service = SimpleNamespace(
+        torch_threads=1,
+        dialogpt_batcher=DialoGPTBatcher(
+            load_model=lambda: (PidModel(), FakeTokenizer()), generation_kwargs={}, max_wait_ms=0
+        )
+    )
+    run_pool(path, workers=1, service=service)
+
+
+def worker_pid(path: str) -> int:
+    """Pid of the worker that answers the next prompt, waiting for the pool to listen."""
+    client = ModelWorkerClient(path, generation_kwargs={})
+    for _ in range(200):
+        try:
+            return int(asyncio.run(collect(client, [1])).lstrip("w"))
+        except ModelWorkersUnavailable:
+            time.sleep(0.05)
+    raise AssertionError("Model-worker pool did not start")
+
+
+def test_pool_replaces_dead_worker(tmp_path):
+    path = str(tmp_path / "workers.sock")
+    pool = multiprocessing.get_context("fork").Process(target=run_fake_pool, args=(path,))
+    pool.start()
+    try:
+        first = worker_pid(path)
+        os.kill(first, signal.SIGKILL)
+        # Prompts wait on the pool's socket until the replacement accepts them
+        assert worker_pid(path) != first
+    finally:
+        # Stops the workers, then removes the socket
+        pool.terminate()
+        pool.join(timeout=10)
+
+    assert pool.exitcode == 0
+    assert not os.path.exists(path)
@@ -0,0 +1,84 @@
+import json
+import pytest
+from datetime import datetime, UTC
+from unittest.mock import patch
+from ai_service import ai_service
+from backends import BackendRegistry, EchoBackend
+from profiling import Trace, current_trace, span
+from storage import store
+from tests.conftest import parse_sse
+
+
+@pytest.fixture(autouse=True)
+def echo_backend():
+    registry = BackendRegistry()
+    registry.register(EchoBackend())
+    with patch.object(ai_service, "backends", registry):
+        yield
+
+
+def test_span_is_a_shared_no_op_without_a_trace():
+    assert current_trace.get() is None
+    assert span("a") is span("b")
+
+    trace = Trace("test")
+    token = current_trace.set(trace)
+    try:
+        with span("work", size=3) as args:
+            args["done"] = True
+    finally:
+        current_trace.reset(token)
+    [event] = [e for e in trace.events if e["ph"] == "X"]
+    assert event["name"] == "work" and event["args"] == {"size": 3, "done": True}
+    assert event["dur"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_profiled_request_ends_with_chrome_trace(async_client):
+    with patch("config.PROFILING_ENABLED", True):
+        response = await async_client.get("/chat?prompt=hello%20there&model=echo", headers={"X-Profile": "1"})
+
+    events = parse_sse(response.text)
+    assert [event for event, _ in events][-2:] == ["end", "profile"]
+    trace = events[-1][1]
+    names = {e["name"] for e in trace["traceEvents"]}
+    assert {"create_chat", "get_chat_history", "save_user_message", "generate",
+            "first_token", "sse_write", "save_bot_message"} <= names
+    spans = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert all(e["ts"] >= 0 and e["dur"] >= 0 for e in spans)
+    # One write per event before the trace itself: start, three deltas, end
+    assert sum(e["name"] == "sse_write" for e in spans) == 5
+
+
+@pytest.mark.asyncio
+async def test_profile_header_ignored_unless_enabled(async_client):
+    with patch("config.PROFILING_ENABLED", False):
+        response = await async_client.get("/chat?prompt=hello&model=echo", headers={"X-Profile": "1"})
+    assert [event for event, _ in parse_sse(response.text)][-1] == "end"
+
+
+@pytest.mark.asyncio
+async def test_profile_written_to_trace_dir(async_client, tmp_path):
+    with patch("config.PROFILING_ENABLED", True), patch("config.PROFILE_TRACE_DIR", str(tmp_path)):
+        response = await async_client.get("/chat?prompt=hello&model=echo", headers={"X-Profile": "1"})
+
+    assert [event for event, _ in parse_sse(response.text)][-1] == "end"
+    [path] = list(tmp_path.iterdir())
+    trace = json.loads(path.read_text())
+    assert any(e["name"] == "generate" for e in trace["traceEvents"])
+
+
+@pytest.mark.asyncio
+async def test_trace_filename_cannot_escape_trace_dir(async_client, tmp_path):
+    trace_dir = tmp_path / "traces"
+    chat_id = "../../escaped"
+    await store.create_chat(chat_id, "Chat", datetime.now(UTC))
+    with patch("config.PROFILING_ENABLED", True), patch("config.PROFILE_TRACE_DIR", str(trace_dir)):
+        response = await async_client.get(
+            "/chat", params={"prompt": "hello", "model": "echo", "chat_id": chat_id}, headers={"X-Profile": "1"}
+        )
+    await store.delete_chat(chat_id)
+
+    assert response.status_code == 200
+    [path] = list(tmp_path.rglob("*.json"))
+    assert path.parent == trace_dir and path.name.startswith("chat-______escaped-")
@@ -0,0 +1,81 @@
+import pytest
+from unittest.mock import patch
+from ai_service import AIService
+from backends import ErrorText
+from response_cache import ResponseCache, response_key
+
+
+@pytest.fixture
+def service():
+    with patch("config.ECHO_BACKEND_ENABLED", True):
+        service = AIService()
+    service.response_cache = ResponseCache()
+    service.response_cache_enabled = True
+    return service
+
+
+async def reply(service: AIService, prompt: str, model: str = "echo", history=None, api_key=None):
+    return [token async for token in service.generate_response(
+        prompt=prompt, chat_history=history, api_key=api_key, model=model
+    )]
+
+
+def test_key_normalizes_whitespace_and_scopes_by_api_key():
+    history = [{"user": "user", "message": "hello  there"}]
+    key = response_key("openai", "gpt-4", "sk-a", history, " hi ", {"temperature": 0})
+    assert key == response_key("openai", "gpt-4", "sk-a", [{"user": "user", "message": "hello there"}], "hi", {"temperature": 0})
+    assert key != response_key("openai", "gpt-4", "sk-b", history, "hi", {"temperature": 0})
+    assert key != response_key("openai", "gpt-4", "sk-a", history, "hi", {"temperature": 0.7})
+
+
+def test_ttl_and_lru_eviction():
+    cache = ResponseCache(max_entries=2, ttl_s=60)
+    cache.put("a", ["x"])
+    cache.put("b", ["y"])
+    cache.get("a")
+    cache.put("c", ["z"])  # evicts b, the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == ["x"]
+
+    with patch("response_cache.time.monotonic", return_value=10**9):
+        assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+@pytest.mark.asyncio
+async def test_repeated_prompt_is_replayed(service):
+    first = await reply(service, "what can you do?")
+    backend = service.backends.get("echo")
+    with patch.object(backend, "stream", side_effect=AssertionError("should not generate")):
+        second = await reply(service, "what  can you do? ")
+
+    assert second == first
+    assert service.response_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_sampled_backends_bypass_cache_unless_configured(service):
+    backend = service.backends.get("dialogpt")
+    assert not backend.deterministic
+    assert service._response_cache_key(backend, "hi", [], None, "dialogpt") is None
+
+    with patch("config.RESPONSE_CACHE_SAMPLED", True):
+        assert service._response_cache_key(backend, "hi", [], None, "dialogpt") is not None
+
+
+@pytest.mark.asyncio
+async def test_errors_are_not_cached(service):
+    async def failing_stream(*args):
+        yield ErrorText("Error: boom")
+
+    with patch.object(service.backends.get("echo"), "stream", failing_stream):
+        await reply(service, "hi")
+    assert len(service.response_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_disabled_by_default():
+    with patch("config.ECHO_BACKEND_ENABLED", True):
+        service = AIService()
+    assert service.response_cache_enabled is False
+    assert service._response_cache_key(service.backends.get("echo"), "hi", [], None, "echo") is None
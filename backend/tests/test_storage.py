@@ -0,0 +1,110 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta, UTC
+from databases import Database
+from db import database_options
+from models.chat import ChatMessage
+from storage import ChatStore, PostgresStore, SQLiteStore, create_store
+from tests.conftest import require_postgres
+
+START = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+@pytest_asyncio.fixture(params=["sqlite", "postgres"])
+async def chat_store(request, tmp_path):
+    url = f"sqlite:///{tmp_path / 'store.db'}" if request.param == "sqlite" else require_postgres()
+    store = create_store(Database(url, **database_options(url)))
+    assert isinstance(store, SQLiteStore if request.param == "sqlite" else PostgresStore)
+    await store.connect()
+    await store.migrate()
+    if request.param == "postgres":
+        await store.database.execute("DELETE FROM messages")
+        await store.database.execute("DELETE FROM chats")
+    yield store
+    await store.disconnect()
+
+
+def make_message(chat_id: str, i: int, truncated: bool = False) -> ChatMessage:
+    return ChatMessage(
+        chat_id=chat_id,
+        user="user" if i % 2 == 0 else "bot",
+        message=f"Message {i}",
+        timestamp=START + timedelta(seconds=i),
+        truncated=truncated,
+    )
+
+
+@pytest.mark.asyncio
+async def test_context_window_is_newest_messages_oldest_first(chat_store: ChatStore):
+    await chat_store.create_chat("chat-1", "Chat 1", START)
+    await chat_store.append_messages([make_message("chat-1", i) for i in range(5)])
+
+    window = await chat_store.fetch_context("chat-1", 3)
+    assert [m.message for m in window] == ["Message 2", "Message 3", "Message 4"]
+    assert [m.user for m in window] == ["user", "bot", "user"]
+    assert len(await chat_store.fetch_context("chat-1", None)) == 5
+    assert await chat_store.fetch_context("missing", 3) == []
+
+
+@pytest.mark.asyncio
+async def test_chats_are_listed_by_activity_with_keyset_pages(chat_store: ChatStore):
+    for i in range(5):
+        await chat_store.create_chat(f"chat-{i}", f"Chat {i}", START + timedelta(minutes=i))
+    # A new message makes chat-0 the most recently active
+    await chat_store.append_messages([
+        ChatMessage(chat_id="chat-0", user="user", message="hi", timestamp=START + timedelta(hours=1))
+    ])
+
+    first = await chat_store.list_chats(2)
+    assert [c.id for c in first] == ["chat-0", "chat-4"]
+    rest = await chat_store.list_chats(10, (first[-1].updated_at, first[-1].id))
+    assert [c.id for c in rest] == ["chat-3", "chat-2", "chat-1"]
+
+
+@pytest.mark.asyncio
+async def test_chat_pages(chat_store: ChatStore):
+    await chat_store.create_chat("chat-1", "Chat 1", START)
+    await chat_store.append_messages(
+        [make_message("chat-1", i) for i in range(4)] + [make_message("chat-1", 4, truncated=True)]
+    )
+
+    newest = await chat_store.load_chat_page("chat-1", limit=2)
+    assert newest.title == "Chat 1" and newest.has_more
+    assert [m.message for m in newest.messages] == ["Message 3", "Message 4"]
+    assert newest.messages[-1].truncated and not newest.messages[0].truncated
+
+    older = await chat_store.load_chat_page("chat-1", limit=10, before_id=newest.messages[0].id)
+    assert [m.message for m in older.messages] == ["Message 0", "Message 1", "Message 2"]
+    assert not older.has_more
+
+    caught_up = await chat_store.load_chat_page("chat-1", limit=1, after_id=older.messages[0].id)
+    assert [m.message for m in caught_up.messages] == ["Message 1"] and caught_up.has_more
+
+    assert await chat_store.load_chat_page("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_delete_chat(chat_store: ChatStore):
+    await chat_store.create_chat("chat-1", "Chat 1", START)
+    await chat_store.append_messages([make_message("chat-1", i) for i in range(3)])
+
+    assert await chat_store.delete_chat("chat-1") is True
+    assert await chat_store.load_chat_page("chat-1") is None
+    assert await chat_store.fetch_context("chat-1", None) == []
+    assert await chat_store.delete_chat("chat-1") is False
+
+
+def test_store_must_implement_every_query():
+    class Incomplete(ChatStore):
+        @property
+        def is_connected(self):
+            return False
+
+        async def connect(self):
+            pass
+
+        async def disconnect(self):
+            pass
+
+    with pytest.raises(TypeError, match="fetch_context"):
+        Incomplete()
@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import patch
+from ai_service import AIService, estimate_tokens
+from token_cache import TokenCache
+
+EOS = 0
+
+
+class WordTokenizer:
+    """One id per word (its length), counting encode calls."""
+    eos_token_id = EOS
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text: str):
+        self.calls += 1
+        return [len(word) for word in text.split()]
+
+
+@pytest.fixture
+def service():
+    service = AIService()
+    service.fallback_tokenizer = WordTokenizer()
+    service._model_loaded = True
+    service.token_cache = TokenCache()
+    return service
+
+
+def test_encode_caches_per_tokenizer_and_text():
+    cache = TokenCache(max_entries=2)
+    calls = []
+
+    def encode(text):
+        calls.append(text)
+        return [1, 2, 3]
+
+    assert cache.encode("a", "hello", encode) == [1, 2, 3]
+    assert cache.encode("a", "hello", encode) == [1, 2, 3]
+    assert cache.encode("b", "hello", encode) == [1, 2, 3]
+    assert calls == ["hello", "hello"]
+    assert cache.stats() == {"entries": 2, "hits": 1, "misses": 2}
+
+    cache.encode("a", "other", encode)  # evicts ("a", "hello")
+    cache.encode("a", "hello", encode)
+    assert len(calls) == 4
+
+
+def test_dialogpt_context_reuses_ids_and_drops_oldest_messages(service):
+    history = [
+        {"user": "user", "message": "one two three"},
+        {"user": "bot", "message": "four five"},
+        {"user": "user", "message": "six"},
+    ]
+    prompt_ids = service._dialogpt_ids("seven eight") + [EOS]
+
+    assert service._dialogpt_context(history, prompt_ids, max_tokens=100) == [
+        3, 3, 5, EOS, 4, 4, EOS, 3, EOS, 5, 5, EOS
+    ]
+    calls = service.fallback_tokenizer.calls
+    # Only messages that fit: "four five" + "six" + prompt = 8 tokens
+    assert service._dialogpt_context(history, prompt_ids, max_tokens=8) == [
+        4, 4, EOS, 3, EOS, 5, 5, EOS
+    ]
+    assert service.fallback_tokenizer.calls == calls
+
+
+def test_count_tokens_falls_back_to_estimate(service):
+    with patch("ai_service.TIKTOKEN_AVAILABLE", False):
+        assert service.count_tokens("hello world", api_key="sk-test") == estimate_tokens("hello world")
+    assert service.count_tokens("hello world") == 2
+
+    service._model_loaded = False
+    assert service.count_tokens("hello world") == estimate_tokens("hello world")
+
+
+def test_count_tokens_with_tiktoken(service):
+    pytest.importorskip("tiktoken")
+    if service._tiktoken_encoding("gpt-4") is None:
+        pytest.skip("tiktoken vocabulary could not be downloaded")
+    assert service.count_tokens("hello world", api_key="sk-test", model="gpt-4") == 2
+    assert service.count_tokens("hello world", api_key="sk-test", model="gpt-4") == 2
+    assert service.token_cache.hits == 1
@@ -0,0 +1,52 @@
+from typing import Callable, Dict, List, Tuple
+from collections import OrderedDict
+import config
+
+
+class TokenCache:
+    """
+    In-process LRU cache of token ids per message text.
+
+    Entries are keyed by (tokenizer, text), so the same message tokenized for
+    DialoGPT and for an OpenAI model is cached separately. Chat history is
+    re-sent on every turn, which makes almost every lookup after the first
+    turn a hit.
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, ...]]" = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def encode(self, tokenizer: str, text: str, encode: Callable[[str], List[int]]) -> List[int]:
+        """Token ids of ``text`` under ``tokenizer``, calling ``encode`` on a miss."""
+        key = (tokenizer, text)
+        ids = self._entries.get(key)
+        if ids is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(ids)
+        self.misses += 1
+        ids = tuple(encode(text))
+        self._entries[key] = ids
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return list(ids)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# Global token cache instance
+token_cache = TokenCache(max_entries=config.TOKEN_CACHE_MAX_ENTRIES)
@@ -7,6 +7,9 @@ import { useTheme } from './ThemeContext';
 import { themes } from './themes';
 import './App.css';
 
+// Messages fetched per /load_chat page; older ones load on demand
+const MESSAGE_PAGE_SIZE = 50;
+
 function App() {
   const { theme, currentTheme, switchTheme } = useTheme();
   const [messages, setMessages] = useState([]);
@@ -14,6 +17,8 @@ function App() {
     return localStorage.getItem('lastActiveChatId') || null;
   });
   const [allChats, setAllChats] = useState([]);
+  const [chatsCursor, setChatsCursor] = useState(null);
+  const [hasOlderMessages, setHasOlderMessages] = useState(false);
   const [isNewChat, setIsNewChat] = useState(false);
   const [isSidebarOpen, setIsSidebarOpen] = useState(window.innerWidth > 768);
   const [isMobile, setIsMobile] = useState(window.innerWidth <= 768);
@@ -80,10 +85,11 @@ function App() {
       const savedChatId = localStorage.getItem('lastActiveChatId');
       if (savedChatId) {
         try {
-          const res = await fetch(`/load_chat/${savedChatId}`);
+          const res = await fetch(`/load_chat/${savedChatId}?limit=${MESSAGE_PAGE_SIZE}`);
           const data = await res.json();
           setCurrentChatId(savedChatId);
           setMessages(data.messages || []);
+          setHasOlderMessages(Boolean(data.has_more));
         } catch (err) {
           console.error('Failed to load chat:', err);
           setMessages([{ user: 'bot', message: 'Hello! How can I help you today?' }]);
@@ -100,7 +106,23 @@ function App() {
     try {
       const res = await fetch(`/chats`);
       const data = await res.json();
-      setAllChats(data);
+      setAllChats(data.chats);
+      setChatsCursor(data.next_cursor);
+    } catch (err) {
+      console.error('Failed to fetch chats:', err);
+    }
+  };
+
+  const loadMoreChats = async () => {
+    if (!chatsCursor) return;
+    try {
+      const res = await fetch(`/chats?cursor=${encodeURIComponent(chatsCursor)}`);
+      const data = await res.json();
+      setAllChats((prev) => [
+        ...prev,
+        ...data.chats.filter((chat) => !prev.some((c) => c.id === chat.id)),
+      ]);
+      setChatsCursor(data.next_cursor);
     } catch (err) {
       console.error('Failed to fetch chats:', err);
     }
@@ -153,32 +175,56 @@ function App() {
 
     eventSourceRef.current = new EventSource(url);
 
-    eventSourceRef.current.onmessage = (event) => {
+    // Delta protocol: "start" carries the chat id, each "delta" only the new
+    // text, and "end" closes the stream once the bot message is saved.
+    let botText = '';
+
+    eventSourceRef.current.addEventListener('start', (event) => {
       try {
-        const msg = JSON.parse(event.data);
+        const { chat_id } = JSON.parse(event.data);
 
-        if (!currentChatId && msg.chat_id) {
-          setCurrentChatId(msg.chat_id);
+        if (!currentChatId && chat_id) {
+          setCurrentChatId(chat_id);
 
           setAllChats((prev) => {
-            if (!prev.some((c) => c.id === msg.chat_id)) {
-              return [...prev, { id: msg.chat_id, title: prompt.slice(0, 20) }];
+            if (!prev.some((c) => c.id === chat_id)) {
+              return [{ id: chat_id, title: prompt.slice(0, 20) }, ...prev];
             }
             return prev;
           });
         }
 
+        setMessages((prev) => [
+          ...prev,
+          { user: 'bot', message: '', chat_id, timestamp: new Date().toISOString() },
+        ]);
+      } catch (err) {
+        console.error('Failed to parse message:', err);
+      }
+    });
+
+    eventSourceRef.current.addEventListener('delta', (event) => {
+      try {
+        botText += JSON.parse(event.data).delta;
+        const text = botText.trim();
+
         setMessages((prev) => {
-          if (prev.length && prev[prev.length - 1].user === 'bot') {
-            return [...prev.slice(0, -1), msg];
-          } else {
-            return [...prev, msg];
-          }
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, message: text }];
         });
       } catch (err) {
         console.error('Failed to parse message:', err);
       }
-    };
+    });
+
+    eventSourceRef.current.addEventListener('end', () => {
+      eventSourceRef.current.close();
+    });
+
+    eventSourceRef.current.addEventListener('failure', (event) => {
+      console.error('Streaming error:', JSON.parse(event.data).error);
+      eventSourceRef.current.close();
+    });
 
     eventSourceRef.current.onerror = () => {
       eventSourceRef.current.close();
@@ -187,10 +233,11 @@ function App() {
 
   const loadChat = async (chatId) => {
     try {
-      const res = await fetch(`/load_chat/${chatId}`);
+      const res = await fetch(`/load_chat/${chatId}?limit=${MESSAGE_PAGE_SIZE}`);
       const data = await res.json();
       setCurrentChatId(chatId);
       setMessages(data.messages || []);
+      setHasOlderMessages(Boolean(data.has_more));
       if (isMobile) {
         setIsSidebarOpen(false);
       }
@@ -199,7 +246,23 @@ function App() {
     }
   };
 
+  const loadOlderMessages = async () => {
+    const oldest = messages.find((m) => m.id);
+    if (!currentChatId || !oldest) return;
+    try {
+      const res = await fetch(
+        `/load_chat/${currentChatId}?limit=${MESSAGE_PAGE_SIZE}&before_id=${oldest.id}`
+      );
+      const data = await res.json();
+      setMessages((prev) => [...(data.messages || []), ...prev]);
+      setHasOlderMessages(Boolean(data.has_more));
+    } catch (err) {
+      console.error('Failed to load older messages:', err);
+    }
+  };
+
   const startNewChat = () => {
+    setHasOlderMessages(false);
     setMessages([{ user: 'bot', message: 'Hello! How can I help you today?' }]);
     setCurrentChatId(null);
     setIsNewChat(true);
@@ -293,6 +356,8 @@ function App() {
             onSelectChat={loadChat}
             onDeleteChat={handleDeleteChat}
             currentChatId={currentChatId}
+            hasMore={Boolean(chatsCursor)}
+            onLoadMore={loadMoreChats}
           />
         </div>
       </div>
@@ -480,7 +545,11 @@ function App() {
         </div>
 
         <div style={{ flex: 1, overflow: 'hidden' }}>
-          <ChatWindow messages={messages} />
+          <ChatWindow
+            messages={messages}
+            hasOlder={hasOlderMessages}
+            onLoadOlder={loadOlderMessages}
+          />
         </div>
 
         <MessageInput onSend={sendMessage} ref={inputRef} />
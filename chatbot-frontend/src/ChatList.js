@@ -2,7 +2,7 @@ import React from 'react';
 import ChatItem from './components/ChatItem';
 import { useTheme } from './ThemeContext';
 
-function ChatList({ chats, onSelectChat, onDeleteChat, currentChatId }) {
+function ChatList({ chats, onSelectChat, onDeleteChat, currentChatId, hasMore, onLoadMore }) {
   const { theme } = useTheme();
   return (
     <div style={{
@@ -51,6 +51,22 @@ function ChatList({ chats, onSelectChat, onDeleteChat, currentChatId }) {
             />
           ))
         )}
+        {hasMore && (
+          <button
+            onClick={onLoadMore}
+            style={{
+              width: '100%',
+              padding: theme.spacing.md,
+              backgroundColor: 'transparent',
+              color: theme.colors.text.secondary,
+              border: 'none',
+              cursor: 'pointer',
+              fontSize: theme.fontSize.sm,
+            }}
+          >
+            Load more
+          </button>
+        )}
       </div>
     </div>
   );
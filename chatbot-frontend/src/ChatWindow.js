@@ -2,14 +2,18 @@ import React, { useEffect, useRef } from 'react';
 import Message from './components/Message';
 import { useTheme } from './ThemeContext';
 
-function ChatWindow({ messages }) {
+function ChatWindow({ messages, hasOlder, onLoadOlder }) {
   const { theme } = useTheme();
   const scrollRef = useRef(null);
+  const lastMessageRef = useRef(null);
 
+  // Follow new messages at the bottom, but keep position when older ones are prepended
   useEffect(() => {
-    if (scrollRef.current) {
+    const last = messages[messages.length - 1];
+    if (scrollRef.current && last !== lastMessageRef.current) {
       scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
     }
+    lastMessageRef.current = last;
   }, [messages]);
 
   return (
@@ -35,14 +39,36 @@ function ChatWindow({ messages }) {
           Start a conversation...
         </div>
       ) : (
-        messages.map((msg, idx) => (
-          <Message 
-            key={idx}
-            user={msg.user}
-            message={msg.message}
-            timestamp={msg.timestamp}
-          />
-        ))
+        <>
+          {hasOlder && (
+            <button
+              onClick={onLoadOlder}
+              style={{
+                alignSelf: 'center',
+                margin: theme.spacing.md,
+                padding: `${theme.spacing.sm} ${theme.spacing.lg}`,
+                backgroundColor: 'transparent',
+                color: theme.colors.text.secondary,
+                border: `1px solid ${theme.colors.border.primary}`,
+                borderRadius: theme.borderRadius.md,
+                cursor: 'pointer',
+                fontSize: theme.fontSize.sm,
+              }}
+            >
+              Load earlier messages
+            </button>
+          )}
+          {messages.map((msg, idx) => (
+            <Message 
+              // Stored ids and list positions are both small integers; keep them apart
+              key={msg.id ? `m${msg.id}` : `local-${idx}`}
+              user={msg.user}
+              message={msg.message}
+              timestamp={msg.timestamp}
+              truncated={msg.truncated}
+            />
+          ))}
+        </>
       )}
     </div>
   );
@@ -1,7 +1,7 @@
 import React from 'react';
 import { useTheme } from '../ThemeContext';
 
-function Message({ user, message, timestamp }) {
+function Message({ user, message, timestamp, truncated }) {
   const { theme } = useTheme();
   const isBot = user === 'bot';
   
@@ -67,6 +67,18 @@ function Message({ user, message, timestamp }) {
               {formatTimestamp(timestamp)}
             </span>
           )}
+          {truncated && (
+            <span
+              title="The reply stopped early because the connection was closed"
+              style={{
+                fontSize: theme.fontSize.xs,
+                color: theme.colors.text.tertiary,
+                fontStyle: 'italic',
+              }}
+            >
+              (incomplete)
+            </span>
+          )}
         </div>
         
         <div style={{